@@ -34,6 +34,20 @@ import random
 import math
 import xlsxwriter
 import time
+import inspect
+
+"""Make the pyburst helpers importable from the repository root"""
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))))
+from pyburst.scheduler import Job, Scheduler, AbaqusBackend
+from pyburst.admission import AdmissionController
+from pyburst.monitor import BurstMonitor, OdbProbe
+from pyburst.bracket import PressureBracket, design_scales, pipe_equation
+from pyburst.cache import ResultCache, case_key, atomic_write
+from pyburst.store import ResultStore, config_name
+from pyburst import doe, geometry, sweep, material
+from pyburst.instrument import StageLog
+from pyburst.postjob import Cleanup
+from pyburst.deck import read_deck, FlawMorph, LIGAMENT, CRACK
 
 """This command uses findAt functions to locate objects such as faces and cells, instead of getSequencyFromMask"""
 session.journalOptions.setValues(replayGeometry=COORDINATE, recoverGeometry=COORDINATE)
@@ -49,6 +63,12 @@ lig_length_2 = True
 T_small = True  # Small thickness if True
 D_small = True  # Small diameter if True
 
+# Build mode: started by pyburst.sweep with -- --spec <file> to only write the decks of its cases
+build_spec = sweep.read_build_spec(sys.argv)
+if build_spec is not None:
+	T_small = build_spec['T_small']
+	D_small = build_spec['D_small']
+
 """Set the parameters of the simulation"""
 # Default crack parameters
 default_length_1 = 0.0005
@@ -82,13 +102,40 @@ mesh_fine = 0.0002
 mesh_end1 = 0.0005
 mesh_end2 = 0.002
 
+# Seeds of the edges outside the flaw region, by group of pyburst.geometry
+if T_small:
+	seed_numbers = {'radial': 3, 'near': 3, 'far': 10 if D_small else 15}
+else:
+	seed_numbers = {'radial': 4, 'near': 4, 'far': 10 if D_small else 12}
+
 # Material parameters of the plate [SI unit]
 young_modulus = 210000000000.0
 poisson_ratio = 0.3
 mat_density = 7700
 
+# Job scheduling: jobs kept in flight, budget of each job and of the node
+max_jobs = 4
+cpus_per_job = 18
+memory_per_job = 60000  # MB
+total_cpus = 64
+total_memory = 250000  # MB
+licence_tokens = None  # Abaqus tokens available to this node, None if not limited
+admission_control = False  # Memory and CPUs of each job from its mesh size (pyburst.admission), packed within the node
+stop_at_burst = True  # Terminate a job once the flaw region reaches the burst criterion
+adaptive_window = True  # Centre the pressure window of each case on its predicted burst pressure
+window_margin = 0.05  # Half width of the window relative to the predicted burst pressure
+max_retries = 2  # Re-runs of a case that bursts outside its window
+coefficient_file = None  # Refitted coefficient sets (pyburst.fitting) that predict the window of the first cases
+compact_output = True  # Keep the flaw region output of each job as burst_pressure/<job>_flaw.npz
+keep_odb = False  # Keep the output database after compacting it
+
+# Template mode: only the middle case of the DOE is built in CAE, the other decks are morphed from it
+template_mode = False
+
 # Parameter DOE
 flaw_detail = []
+check_max_length = True  # Drop the cases whose combined length exceeds max_length
+# The published 81-case bTsD sweep ran without this check (combined lengths up to 22 mm)
 if crack_length_1:
 	if T_small:
 		length_1s = [0.0005, 0.001, 0.0015]
@@ -124,23 +171,165 @@ else:
 # Number of simulation
 num_of_simulation = len(length_1s) * len(length_2s) * len(lig_1s) * len(lig_2s)
 
+# Full-factorial design with the first parameter varying fastest, infeasible geometries removed
+design = doe.full_factorial([('length_1', length_1s), ('length_2', length_2s), ('lig_1', lig_1s), ('lig_2', lig_2s)])
+design = doe.prune(design, pipe_thk, 'cc', max_length if check_max_length else None)
+if not os.path.isdir('burst_pressure'):
+	os.makedirs('burst_pressure')
+
 # Job names
 job_name = 'Burst_full_cc_sTsD_'
+if build_spec is not None:
+	job_name = build_spec['job_name']
+	design = sweep.build_design(build_spec)
+doe.write_table('burst_pressure/' + job_name + 'design.txt', design, pipe_thk, 'cc')
+
+# Create magic points ;)
+if T_small:
+	if D_small:
+		magic_pt = (0.0154052750086153, 0.126062196958124)
+		pres_mag_1 = 73500000
+		pres_mag_2 = 79000000
+	else:
+		magic_pt = (0.0146274740894786, 0.228131534430823)
+		pres_mag_1 = 38000000
+		pres_mag_2 = 42000000
+else:
+	if D_small:
+		magic_pt = (0.022, 0.125079974416371)
+		pres_mag_1 = 112000000
+		pres_mag_2 = 140000000
+	else:
+		magic_pt = (0.02, 0.227723428746363)
+		pres_mag_1 = 57600000
+		pres_mag_2 = 72000000
+
+# The sweep runner sets the default window and the mesh, and morphs the decks itself
+if build_spec is not None:
+	pres_mag_1, pres_mag_2 = build_spec['window']
+	mesh_fine = build_spec['mesh_fine']
+	mesh_end1 = build_spec['mesh_end1']
+	mesh_end2 = build_spec['mesh_end2']
+	seed_numbers = build_spec['seed_numbers']
+	template_mode = False
+
+# Named seeding edges of this pipe, derived from its dimensions and the partition angle of magic_pt
+pipe_geometry = geometry.PipeGeometry(pipe_id, pipe_od, pipe_len, crack_par, math.atan2(magic_pt[0], magic_pt[1]))
+pipe_index = geometry.cached_index('burst_pressure/geometry', pipe_geometry)
+
+# Write the summary of the finished cases, flushed after every job
+def write_summary():
+	lines = []
+	lines.append('---------------------------------------------------------------')
+	lines.append('\n Total factorial DOE: ' + str(num_of_simulation))
+	lines.append('\n Feasible cases: ' + str(len(design)))
+	lines.append('\n Total simulations: ' + str(len(flaw_detail)))
+	lines.append('\n Pipe outer diameter: ' + str(pipe_od * 2 * 1000) + ' mm')
+	lines.append('\n Pipe thickness: ' + str(pipe_thk * 1000) + ' mm')
+	lines.append('\n---------------------------------------------------------------')
+	lines.append('\n Flaw parameters detail:')
+	for item in sorted(flaw_detail):
+		lines.append('\n' + str(item)[1:-1])
+	atomic_write('burst_pressure/' + job_name + 'summary.txt', ''.join(lines))
+
+# Results are cached by case key so that an interrupted sweep only runs the missing cases
+cache = ResultCache('burst_pressure/' + job_name + 'cache')
+
+# Finished cases of all sweeps also go to one columnar store, queried by column name
+store = ResultStore('burst_pressure/results')
+
+# Time of every stage of every case, one JSON line each (python -m pyburst.instrument to summarize)
+stages = StageLog('burst_pressure/' + job_name + 'stages.jsonl', sweep=job_name)
+
+# Scratch files and output databases of the finished jobs are removed in the background
+cleanup = Cleanup('burst_pressure', compact_output=compact_output, keep_odb=keep_odb, stages=stages)
+
+# Burst criterion on the peak Mises stress of the flaw region, None if there is none for the grade
+max_mises = material.burst_mises(65)
+
+# Pressure window of each case, predicted from the burst pressures of the finished cases
+bracket = PressureBracket((pres_mag_1, pres_mag_2), scales=design_scales(design, doe.CC_PARAMS), margin=window_margin,
+	equation=pipe_equation('cc', 65, pipe_thk, pipe_od, coefficient_file))
+
+# Stage log, burst time, re-run outside the window, then cache, summary and result store of a finished job
+finisher = sweep.JobFinisher('cc', config_name(T_small, D_small), 65, pipe_thk, pipe_od, (pres_mag_1, pres_mag_2),
+	max_mises, bracket, cache, store, stages, flaw_detail, write_summary, adaptive_window, max_retries)
+
+def finish_job(result):
+	finisher(result, scheduler, cleanup)
+
+# Solver jobs are queued and run concurrently while the next cases are pre-processed
+monitor = BurstMonitor(OdbProbe(), max_mises) if stop_at_burst and max_mises is not None else None
+scheduler = Scheduler(AbaqusBackend(), max_jobs=max_jobs, total_cpus=total_cpus,
+	total_memory_mb=total_memory, on_finish=finish_job, monitor=monitor,
+	admission=AdmissionController(total_cpus, total_memory, licence_tokens, max_jobs) if admission_control else None)
+
+def queue_job(name, key, case_detail, params, window):
+	if build_spec is not None:
+		# The deck is written, the sweep runner queues it
+		return
+	scheduler.submit(Job(name, name + '.inp', cpus=cpus_per_job, memory_mb=memory_per_job,
+		meta={'key': key, 'flaw_detail': case_detail, 'case': name, 'params': params, 'window': window,
+		'retries': 0}))
+	scheduler.step()
+
+# Flaw bands through the wall from the inner surface, used to morph the reference deck
+flaw_kinds = [LIGAMENT, CRACK, LIGAMENT, CRACK, LIGAMENT]
+template = None
+
+# In template mode the reference case goes first
+case_order = list(range(len(design)))
+if template_mode:
+	case_order.insert(0, case_order.pop(len(design) // 2))
 
 """Initiate the while loop"""
-for index in range(num_of_simulation):
+for case in design[case_order]:
 
 	# Assign the crack parameters to the value
-	length_1 = length_1s[index % len(length_1s)]
-	length_2 = length_2s[int(index/len(length_1s)) % len(length_2s)]
-	lig_1 = lig_1s[int(index/len(length_1s)/len(length_2s)) % len(lig_1s)]
-	lig_2 = lig_2s[int(index/len(length_1s)/len(length_2s)/len(lig_1s)) % len(lig_2s)]
+	index = int(case['index'])
+	length_1 = float(case['length_1'])
+	length_2 = float(case['length_2'])
+	lig_1 = float(case['lig_1'])
+	lig_2 = float(case['lig_2'])
 
 	total_length = length_1 * 2 + length_2 * 2 + lig_1 + lig_2
 	lig_3 = pipe_thk - total_length
 
-	# If the max length criterion is met, save it for output
-	flaw_detail.append([index, length_1 * 2000, length_2 * 2000, lig_1 * 1000, lig_2 * 1000, lig_3 * 1000])
+	# Flaw parameters of the case, saved for output once it has a result
+	case_detail = [index, length_1 * 2000, length_2 * 2000, lig_1 * 1000, lig_2 * 1000, lig_3 * 1000]
+
+	flaw_bands = [lig_1, length_1 * 2, lig_2, length_2 * 2, lig_3]
+
+	# Skip the case if its result is already in the cache
+	key = case_key(pipe_od=pipe_od, pipe_thk=pipe_thk, steel_grade=65, length_1=length_1,
+		length_2=length_2, lig_1=lig_1, lig_2=lig_2, mesh_fine=mesh_fine, mesh_end1=mesh_end1,
+		mesh_end2=mesh_end2, pres_mag_1=pres_mag_1, pres_mag_2=pres_mag_2,
+		template_mode=template_mode, adaptive_window=adaptive_window)
+	if build_spec is None and cache.has(key):
+		cached = cache.get(key)
+		flaw_detail.append(cached['flaw_detail'])
+		if 'window' in cached:
+			# The cached burst time is in the fixed window, it still informs the windows of the other cases
+			bracket.add_time((length_1, length_2, lig_1, lig_2), cached['flaw_detail'][-1])
+		continue
+	stages.begin(job_name + str(index))
+
+	# Pressure window of the two steps
+	if adaptive_window and max_mises is not None:
+		window = bracket.window((length_1, length_2, lig_1, lig_2))
+	else:
+		window = (pres_mag_1, pres_mag_2)
+
+	# Morph the reference deck instead of rebuilding the model
+	if template is not None:
+		stages.lap('morph')
+		template.write(job_name + str(index) + '.inp', morph.apply(template.nodes, flaw_bands),
+			pressures=window, comment='Flaw morphed from ' + template_name)
+		stages.end(nodes=len(template.nodes))
+		queue_job(job_name + str(index), key, case_detail, (length_1, length_2, lig_1, lig_2), window)
+		continue
+
+	stages.lap('sketch')
 
 	# Calculate depths
 	thk = pipe_thk
@@ -239,18 +428,7 @@ for index in range(num_of_simulation):
 	mdb.models['Model-1'].Material(name='steel')
 	mdb.models['Model-1'].materials['steel'].Density(table=((mat_density,),))
 	mdb.models['Model-1'].materials['steel'].Elastic(table=((young_modulus, poisson_ratio),))
-	mdb.models['Model-1'].materials['steel'].Plastic(table=((470512820.0,
-		0.0), (508974359.0, 0.00811359), (535897435.0, 0.019472617), (570512820.0,
-		0.038945233), (601282051.0, 0.060040568), (623076923.0, 0.081135903), (
-		641025641.0, 0.102231238), (662820512.0, 0.128194726), (682051282.0,
-		0.159026369), (698717948.0, 0.189858012), (717948717.0, 0.223935091), (
-		735897435.0, 0.266125761), (751282051.0, 0.30831643), (764102564.0,
-		0.344016227), (776923076.0, 0.384584179), (792307692.0, 0.438133874), (
-		806410256.0, 0.486815416), (817948717.0, 0.535496958), (830769230.0,
-		0.592292089), (842307692.0, 0.644219067), (856410256.0, 0.710750507), (
-		866666666.0, 0.782150102), (879487179.0, 0.851926978), (889743589.0,
-		0.918458418), (900000000.0, 0.984989858), (908974359.0, 1.045030426), (
-		916666666.0, 1.10831643)))
+	mdb.models['Model-1'].materials['steel'].Plastic(table=material.plastic_table(65))
 	mdb.models['Model-1'].materials['steel'].PorousMetalPlasticity(relativeDensity=
 		0.999875, table=((1.5, 1.0, 2.25), ))
 	mdb.models['Model-1'].materials['steel'].porousMetalPlasticity.VoidNucleation(
@@ -261,13 +439,13 @@ for index in range(num_of_simulation):
 		((pipe_id, 0.0, 0.0),), )), sectionName='Section-1',thicknessAssignment=FROM_SECTION)
 	mdb.models['Model-1'].rootAssembly.DatumCsysByDefault(CARTESIAN)
 
-	if index == 0:
-		mdb.models['Model-1'].rootAssembly.Instance(dependent=OFF, name='pipe-1',
-			part=mdb.models['Model-1'].parts['pipe'])
-	else:
+	# The first case to be built may not be index 0 when earlier cases are cached
+	if 'pipe-1' in mdb.models['Model-1'].rootAssembly.instances.keys():
 		del mdb.models['Model-1'].rootAssembly.instances['pipe-1']
-		mdb.models['Model-1'].rootAssembly.Instance(dependent=OFF, name='pipe-1',
-			part=mdb.models['Model-1'].parts['pipe'])
+	mdb.models['Model-1'].rootAssembly.Instance(dependent=OFF, name='pipe-1',
+		part=mdb.models['Model-1'].parts['pipe'])
+
+	stages.lap('partition')
 
 	# Create sets: 3 symmetry planes and an end cap
 	mdb.models['Model-1'].rootAssembly.Set(faces=
@@ -287,30 +465,6 @@ for index in range(num_of_simulation):
 	mdb.models['Model-1'].rootAssembly.Surface(name='inner', side1Faces=
 		mdb.models['Model-1'].rootAssembly.instances['pipe-1'].faces.findAt(((pipe_id, 0.0001, pipe_len / 2),)))
 
-	# Create magic points and edges ;)
-	if T_small:
-		if D_small:
-			magic_pt = (0.0154052750086153, 0.126062196958124)
-			magic_edge = (0.014022, 0.114746, pipe_len)
-			pres_mag_1 = 73500000
-			pres_mag_2 = 79000000
-		else:
-			magic_pt = (0.0146274740894786, 0.228131534430823)
-			magic_edge = (0.013898, 0.216755, pipe_len)
-			pres_mag_1 = 38000000
-			pres_mag_2 = 42000000
-	else:
-		if D_small:
-			magic_pt = (0.022, 0.125079974416371)
-			magic_edge = (0.0187, 0.106318, pipe_len)
-			pres_mag_1 = 112000000
-			pres_mag_2 = 140000000
-		else:
-			magic_pt = (0.02, 0.227723428746363)
-			magic_edge = (0.018333, 0.208746, pipe_len)
-			pres_mag_1 = 57600000
-			pres_mag_2 = 72000000
-
 	# Partition face: z-sym face
 	mdb.models['Model-1'].ConstrainedSketch(gridSpacing=0.01, name='__profile__',
 		sheetSize=0.5, transform=
@@ -366,7 +520,7 @@ for index in range(num_of_simulation):
 	mdb.models['Model-1'].rootAssembly.PartitionCellByExtrudeEdge(cells=
 		mdb.models['Model-1'].rootAssembly.instances['pipe-1'].cells.findAt(((
 		pipe_id, 0.0, pipe_len), ), ((pipe_id, 0.0, 0.0), ), ), edges=(
-		mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt(magic_edge, ), ), line=
+		mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt(pipe_index.magic_edge(), ), ), line=
 		mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt((
 		pipe_id, 0.0, 0.0001), ), sense=REVERSE)
 
@@ -388,6 +542,8 @@ for index in range(num_of_simulation):
 		mdb.models['Model-1'].rootAssembly.instances['pipe-1'].cells.findAt(((
 		0.0, pipe_id, pipe_len), )), ))
 
+	stages.lap('mesh')
+
 	# Seed the crack tip, double biased on the long edge
 	mdb.models['Model-1'].rootAssembly.seedEdgeBySize(deviationFactor=0.8, edges=
 		mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt(
@@ -416,78 +572,10 @@ for index in range(num_of_simulation):
 		0.0001, pipe_od, pipe_len), )), maxSize=mesh_end2, minSize=mesh_end1)
 
 	# Seed the rest of the pipe
-	if T_small:
-		if D_small:
-			mdb.models['Model-1'].rootAssembly.seedEdgeByNumber(constraint=FINER, edges=
-				mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt(((
-				0.012737, 0.104225, 0.2895), ), ((0.013192, 0.107947, 0.3), ), ((0.014556,
-				0.119114, 0.2965), ), ((0.014101, 0.115392, 0.0), ), ((0.105, 0.0, 0.2895),
-				), ((0.010929, 0.119501, 0.286), ), ((0.0, 0.10875, 0.286), ), ((0.003192,
-				0.104951, 0.286), ), ((0.003647, 0.119945, 0.0), ), ((0.10875, 0.0, 0.0),
-				), ((0.10875, 0.0, 0.286), ), ((0.12, 0.0, 0.2895), ), ((0.003192,
-				0.104951, 0.0), ), ((0.11625, 0.0, 0.3), ), ((0.0, 0.11625, 0.0), ), ),
-				number=3)
-			mdb.models['Model-1'].rootAssembly.seedEdgeByNumber(constraint=FINER, edges=
-				mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt(((
-				0.012737, 0.104225, 0.0715), ), ((0.014556, 0.119114, 0.2145), ), ((
-				0.04885, 0.092945, 0.286), ), ((0.098184, 0.037215, 0.3), ), ((0.04885,
-				0.092945, 0.0), ), ((0.105, 0.0, 0.0715), ), ((0.0, 0.12, 0.0715), ), ((
-				0.055828, 0.106222, 0.0), ), ((0.11221, 0.042531, 0.286), ), ((0.12, 0.0,
-				0.0715), ), ((0.055828, 0.106222, 0.3), ), ((0.0, 0.105, 0.0715), ), ),
-				number=10)
-		else:
-			mdb.models['Model-1'].rootAssembly.seedEdgeByNumber(constraint=FINER, edges=
-				mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt(((
-				0.013117, 0.20458, 0.2895), ), ((0.013357, 0.208322, 0.3), ), ((0.014077,
-				0.219549, 0.2965), ), ((0.013837, 0.215807, 0.0), ), ((0.205, 0.0, 0.2895),
-				), ((0.010561, 0.219746, 0.286), ), ((0.0, 0.20875, 0.286), ), ((0.003281,
-				0.204974, 0.286), ), ((0.003522, 0.219972, 0.0), ), ((0.20875, 0.0, 0.0),
-				), ((0.20875, 0.0, 0.286), ), ((0.22, 0.0, 0.2895), ), ((0.003281,
-				0.204974, 0.0), ), ((0.21625, 0.0, 0.3), ), ((0.0, 0.21625, 0.0), ), ),
-				number=3)
-			mdb.models['Model-1'].rootAssembly.seedEdgeByNumber(constraint=FINER, edges=
-				mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt(((
-				0.013117, 0.20458, 0.0715), ), ((0.014077, 0.219549, 0.2145), ), ((
-				0.087452, 0.185411, 0.286), ), ((0.190627, 0.075408, 0.3), ), ((0.087452,
-				0.185411, 0.0), ), ((0.205, 0.0, 0.0715), ), ((0.0, 0.22, 0.0715), ), ((
-				0.09385, 0.198978, 0.0), ), ((0.204575, 0.080926, 0.286), ), ((0.22, 0.0,
-				0.0715), ), ((0.09385, 0.198978, 0.3), ), ((0.0, 0.205, 0.0715), ), ),
-				number=15)
-	else:
-		if D_small:
-			mdb.models['Model-1'].rootAssembly.seedEdgeByNumber(constraint=FINER, edges=
-				mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt(((
-				0.016457, 0.093564, 0.2865), ), ((0.017539, 0.099719, 0.3), ), ((0.020787,
-				0.118186, 0.2955), ), ((0.019705, 0.11203, 0.0), ), ((0.095, 0.0, 0.2865),
-				), ((0.015625, 0.118978, 0.282), ), ((0.0, 0.10125, 0.282), ), ((0.004134,
-				0.09491, 0.282), ), ((0.005222, 0.119886, 0.0), ), ((0.10125, 0.0, 0.0), ),
-				((0.10125, 0.0, 0.282), ), ((0.12, 0.0, 0.2865), ), ((0.004134, 0.09491,
-				0.0), ), ((0.11375, 0.0, 0.3), ), ((0.0, 0.11375, 0.0), ), ), number=4)
-			mdb.models['Model-1'].rootAssembly.seedEdgeByNumber(constraint=FINER, edges=
-				mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt(((
-				0.016457, 0.093564, 0.0705), ), ((0.020787, 0.118186, 0.2115), ), ((
-				0.047474, 0.082288, 0.282), ), ((0.089267, 0.032501, 0.3), ), ((0.047474,
-				0.082288, 0.0), ), ((0.095, 0.0, 0.0705), ), ((0.0, 0.12, 0.0705), ), ((
-				0.059967, 0.103942, 0.0), ), ((0.112759, 0.041054, 0.282), ), ((0.12, 0.0,
-				0.0705), ), ((0.059967, 0.103942, 0.3), ), ((0.0, 0.095, 0.0705), ), ),
-				number=10)
-		else:
-			mdb.models['Model-1'].rootAssembly.seedEdgeByNumber(constraint=FINER, edges=
-				mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt(((
-				0.017778, 0.202421, 0.2865), ), ((0.018333, 0.208746, 0.3), ), ((0.02,
-				0.227723, 0.2955), ), ((0.019444, 0.221398, 0.0), ), ((0.2032, 0.0,
-				0.2865), ), ((0.015008, 0.228107, 0.282), ), ((0.0, 0.20955, 0.282), ), ((
-				0.00445, 0.203151, 0.282), ), ((0.005006, 0.228545, 0.0), ), ((0.20955,
-				0.0, 0.0), ), ((0.20955, 0.0, 0.282), ), ((0.2286, 0.0, 0.2865), ), ((
-				0.00445, 0.203151, 0.0), ), ((0.22225, 0.0, 0.3), ), ((0.0, 0.22225, 0.0),
-				), ), number=4)
-			mdb.models['Model-1'].rootAssembly.seedEdgeByNumber(constraint=FINER, edges=
-				mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt(((
-				0.017778, 0.202421, 0.0705), ), ((0.02, 0.227723, 0.2115), ), ((0.089919,
-				0.182222, 0.282), ), ((0.18939, 0.073632, 0.3), ), ((0.089919, 0.182222,
-				0.0), ), ((0.2032, 0.0, 0.0705), ), ((0.0, 0.2286, 0.0705), ), ((0.101159,
-				0.205, 0.0), ), ((0.213064, 0.082836, 0.282), ), ((0.2286, 0.0, 0.0705), ),
-				((0.101159, 0.205, 0.3), ), ((0.0, 0.2032, 0.0705), ), ), number=12)
+	for group in geometry.GROUPS:
+		mdb.models['Model-1'].rootAssembly.seedEdgeByNumber(constraint=FINER, edges=
+			mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt(
+			*[(point, ) for point in pipe_index.group(group)]), number=seed_numbers[group])
 
 	# Generate mesh
 	mdb.models['Model-1'].rootAssembly.generateMesh(regions=
@@ -503,6 +591,10 @@ for index in range(num_of_simulation):
 		mdb.models['Model-1'].rootAssembly.instances['pipe-1'].cells.findAt(((
 		0.0, pipe_id, pipe_len), )))
 
+	stages.end(elements=len(mdb.models['Model-1'].rootAssembly.instances['pipe-1'].elements),
+		nodes=len(mdb.models['Model-1'].rootAssembly.instances['pipe-1'].nodes))
+	stages.lap('model')
+
 	# Create step and field output
 	mdb.models['Model-1'].StaticStep(maxNumInc=10, name='Step-1', nlgeom=ON,
 		previous='Initial')
@@ -515,9 +607,9 @@ for index in range(num_of_simulation):
 
 	# Create load and BC
 	mdb.models['Model-1'].Pressure(amplitude=UNSET, createStepName='Step-1',
-		distributionType=UNIFORM, field='', magnitude=pres_mag_1, name='Load-1',
+		distributionType=UNIFORM, field='', magnitude=window[0], name='Load-1',
 		region=mdb.models['Model-1'].rootAssembly.surfaces['inner'])
-	mdb.models['Model-1'].loads['Load-1'].setValuesInStep(magnitude=pres_mag_2, stepName=
+	mdb.models['Model-1'].loads['Load-1'].setValuesInStep(magnitude=window[1], stepName=
 		'Step-2')
 	mdb.models['Model-1'].XsymmBC(createStepName='Step-1', localCsys=None, name=
 		'Xsym', region=mdb.models['Model-1'].rootAssembly.sets['x_sym'])
@@ -535,54 +627,20 @@ for index in range(num_of_simulation):
 		explicitPrecision=SINGLE, getMemoryFromAnalysis=True, historyPrint=OFF,
 		memory=90, memoryUnits=PERCENTAGE, model='Model-1', modelPrint=OFF,
 		multiprocessingMode=DEFAULT, name=job_name+str(index), nodalOutputPrecision=SINGLE,
-		numCpus=18, numDomains=18, numGPUs=0, queue=None, resultsFormat=ODB,
+		numCpus=cpus_per_job, numDomains=cpus_per_job, numGPUs=0, queue=None, resultsFormat=ODB,
 		scratch='', type=ANALYSIS, userSubroutine='', waitHours=0, waitMinutes=0)
-	#mdb.jobs[job_name + str(index)].writeInput()
-	mdb.jobs[job_name + str(index)].submit(consistencyChecking=OFF)
-	mdb.jobs[job_name + str(index)].waitForCompletion()
-
-	# Remove all the files after getting the data
-	try:
-		os.remove(job_name + str(index) + '.abq')
-	except WindowsError:
-		pass
-	try:
-		os.remove(job_name + str(index) + '.mdl')
-	except WindowsError:
-		pass
-	try:
-		os.remove(job_name + str(index) + '.pac')
-	except WindowsError:
-		pass
-	try:
-		os.remove(job_name + str(index) + '.stt')
-	except WindowsError:
-		pass
-	try:
-		os.remove(job_name + str(index) + '.prt')
-	except WindowsError:
-		pass
-	try:
-		os.remove(job_name + str(index) + '.res')
-	except WindowsError:
-		pass
-	try:
-		os.remove(job_name + str(index) + '.sim')
-	except WindowsError:
-		pass
-	try:
-		os.remove(job_name + str(index) + '.dat')
-	except WindowsError:
-		pass
-
-
-with open('burst_pressure/' + job_name + 'summary.txt', 'w') as f:
-	f.write('---------------------------------------------------------------')
-	f.write('\n Total factorial DOE: ' + str(num_of_simulation))
-	f.write('\n Total simulations: ' + str(len(flaw_detail)))
-	f.write('\n Pipe outer diameter: ' + str(pipe_od * 2 * 1000) + ' mm')
-	f.write('\n Pipe thickness: ' + str(pipe_thk * 1000) + ' mm')
-	f.write('\n---------------------------------------------------------------')
-	f.write('\n Flaw parameters detail:')
-	for item in flaw_detail:
-		f.write('\n' + str(item)[1:-1])
+	mdb.jobs[job_name + str(index)].writeInput(consistencyChecking=OFF)
+	stages.end()
+	queue_job(job_name + str(index), key, case_detail, (length_1, length_2, lig_1, lig_2), window)
+
+	# The first deck built becomes the reference of the other cases
+	if template_mode:
+		template_name = job_name + str(index) + '.inp'
+		template = read_deck(template_name)
+		morph = FlawMorph(flaw_kinds, flaw_bands, pipe_id, pipe_thk, pipe_len, crack_par, pipe_geometry.theta_par)
+
+"""Wait for the jobs still queued or running"""
+scheduler.run()
+cleanup.close()
+if build_spec is None:
+	write_summary()
@@ -36,6 +36,20 @@ import random
 import math
 import xlsxwriter
 import time
+import inspect
+
+"""Make the pyburst helpers importable from the repository root"""
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))))
+from pyburst.scheduler import Job, Scheduler, AbaqusBackend
+from pyburst.admission import AdmissionController
+from pyburst.monitor import BurstMonitor, OdbProbe
+from pyburst.bracket import PressureBracket, design_scales, pipe_equation
+from pyburst.cache import ResultCache, case_key, atomic_write
+from pyburst.store import ResultStore, config_name
+from pyburst import doe, geometry, sweep, material
+from pyburst.instrument import StageLog
+from pyburst.postjob import Cleanup
+from pyburst.deck import read_deck, FlawMorph, LIGAMENT, CRACK, LOSS
 
 """This command uses findAt functions to locate objects such as faces and cells, instead of getSequencyFromMask"""
 session.journalOptions.setValues(replayGeometry=COORDINATE, recoverGeometry=COORDINATE)
@@ -51,7 +65,14 @@ T_small = False  # Small thickness if True
 D_small = True  # Small diameter if True
 
 # Material switch
-steel_grade = 65  # options: X42, X65, X100
+steel_grade = 65  # any grade of pyburst.material: X42, X52, X65, X70, X80, X100
+
+# Build mode: started by pyburst.sweep with -- --spec <file> to only write the decks of its cases
+build_spec = sweep.read_build_spec(sys.argv)
+if build_spec is not None:
+	T_small = build_spec['T_small']
+	D_small = build_spec['D_small']
+	steel_grade = build_spec['grade']
 
 """Set the parameters of the simulation"""
 # Default crack parameters
@@ -86,13 +107,36 @@ mesh_fine = 0.0002
 mesh_end1 = 0.0005
 mesh_end2 = 0.002
 
+# Seeds of the edges outside the flaw region, by group of pyburst.geometry
+seed_numbers = {'radial': 3 if T_small else 5, 'near': 3, 'far': 10 if D_small else 15}
+
 # Material parameters of the plate [SI unit]
 young_modulus = 210000000000.0
 poisson_ratio = 0.3
 mat_density = 7700
 
+# Job scheduling: jobs kept in flight, budget of each job and of the node
+max_jobs = 4
+cpus_per_job = 16
+memory_per_job = 60000  # MB
+total_cpus = 64
+total_memory = 250000  # MB
+licence_tokens = None  # Abaqus tokens available to this node, None if not limited
+admission_control = False  # Memory and CPUs of each job from its mesh size (pyburst.admission), packed within the node
+stop_at_burst = True  # Terminate a job once the flaw region reaches the burst criterion
+adaptive_window = True  # Centre the pressure window of each case on its predicted burst pressure
+window_margin = 0.05  # Half width of the window relative to the predicted burst pressure
+max_retries = 2  # Re-runs of a case that bursts outside its window
+coefficient_file = None  # Refitted coefficient sets (pyburst.fitting) that predict the window of the first cases
+compact_output = True  # Keep the flaw region output of each job as burst_pressure/<job>_flaw.npz
+keep_odb = False  # Keep the output database after compacting it
+
+# Template mode: only the middle case of the DOE is built in CAE, the other decks are morphed from it
+template_mode = False
+
 # Parameter DOE
 flaw_detail = []
+check_max_length = True  # Drop the cases whose combined length exceeds max_length
 if crack_length:
 	lengths = [0.0005, 0.00125, 0.002]
 else:
@@ -117,22 +161,172 @@ else:
 # Number of simulation
 num_of_simulation = len(lengths) * len(lig_2s) * len(heights)
 
+# Full-factorial design with the first parameter varying fastest, infeasible geometries removed
+design = doe.full_factorial([('length', lengths), ('lig_2', lig_2s), ('height', heights)])
+design = doe.prune(design, pipe_thk, 'cw', max_length if check_max_length else None)
+if not os.path.isdir('burst_pressure'):
+	os.makedirs('burst_pressure')
+
 # Job names
 job_name = 'Burst_full_cw_bTsD_'
+if build_spec is not None:
+	job_name = build_spec['job_name']
+	design = sweep.build_design(build_spec)
+doe.write_table('burst_pressure/' + job_name + 'design.txt', design, pipe_thk, 'cw')
+
+# Create magic points ;)
+if T_small:
+	if D_small:
+		magic_pt = (0.0193620651670132, 0.125515379266719)
+		if steel_grade == 65:
+			pres_mag_1 = 58500000
+			pres_mag_2 = 78000000
+		if steel_grade == 42:
+			pres_mag_1 = 40000000
+			pres_mag_2 = 60000000
+		if steel_grade == 100:
+			pres_mag_1 = 90000000
+			pres_mag_2 = 110000000
+	else:
+		magic_pt = (0.0189993341502983, 0.219178067565725)
+		pres_mag_1 = 31500000
+		pres_mag_2 = 42000000
+else:
+	if D_small:
+		magic_pt = (0.022, 0.125079974416371)
+		pres_mag_1 = 112000000
+		pres_mag_2 = 140000000
+	else:
+		magic_pt = (0.02, 0.227723428746363)
+		pres_mag_1 = 57600000
+		pres_mag_2 = 72000000
+
+# The sweep runner sets the default window and the mesh, and morphs the decks itself
+if build_spec is not None:
+	pres_mag_1, pres_mag_2 = build_spec['window']
+	mesh_fine = build_spec['mesh_fine']
+	mesh_end1 = build_spec['mesh_end1']
+	mesh_end2 = build_spec['mesh_end2']
+	seed_numbers = build_spec['seed_numbers']
+	template_mode = False
+
+# Named seeding edges of this pipe, derived from its dimensions and the partition angle of magic_pt
+pipe_geometry = geometry.PipeGeometry(pipe_id, pipe_od, pipe_len, crack_par, math.atan2(magic_pt[0], magic_pt[1]))
+pipe_index = geometry.cached_index('burst_pressure/geometry', pipe_geometry)
+
+# Write the summary of the finished cases, flushed after every job
+def write_summary():
+	lines = []
+	lines.append('---------------------------------------------------------------')
+	lines.append('\n Total factorial DOE: ' + str(num_of_simulation))
+	lines.append('\n Feasible cases: ' + str(len(design)))
+	lines.append('\n Total simulations: ' + str(len(flaw_detail)))
+	lines.append('\n Pipe outer diameter: ' + str(pipe_od * 2 * 1000) + ' mm')
+	lines.append('\n Pipe thickness: ' + str(pipe_thk * 1000) + ' mm')
+	lines.append('\n---------------------------------------------------------------')
+	lines.append('\n Flaw parameters detail:')
+	for item in sorted(flaw_detail):
+		lines.append('\n' + str(item)[1:-1])
+	atomic_write('burst_pressure/' + job_name + 'summary.txt', ''.join(lines))
+
+# Results are cached by case key so that an interrupted sweep only runs the missing cases
+cache = ResultCache('burst_pressure/' + job_name + 'cache')
+
+# Finished cases of all sweeps also go to one columnar store, queried by column name
+store = ResultStore('burst_pressure/results')
+
+# Time of every stage of every case, one JSON line each (python -m pyburst.instrument to summarize)
+stages = StageLog('burst_pressure/' + job_name + 'stages.jsonl', sweep=job_name)
+
+# Scratch files and output databases of the finished jobs are removed in the background
+cleanup = Cleanup('burst_pressure', compact_output=compact_output, keep_odb=keep_odb, stages=stages)
+
+# Burst criterion on the peak Mises stress of the flaw region, None if there is none for the grade
+max_mises = material.burst_mises(steel_grade)
+
+# Pressure window of each case, predicted from the burst pressures of the finished cases
+bracket = PressureBracket((pres_mag_1, pres_mag_2), scales=design_scales(design, doe.CW_PARAMS), margin=window_margin,
+	equation=pipe_equation('cw', steel_grade, pipe_thk, pipe_od, coefficient_file))
+
+# Stage log, burst time, re-run outside the window, then cache, summary and result store of a finished job
+finisher = sweep.JobFinisher('cw', config_name(T_small, D_small), steel_grade, pipe_thk, pipe_od,
+	(pres_mag_1, pres_mag_2), max_mises, bracket, cache, store, stages, flaw_detail, write_summary, adaptive_window,
+	max_retries)
+
+def finish_job(result):
+	finisher(result, scheduler, cleanup)
+
+# Solver jobs are queued and run concurrently while the next cases are pre-processed
+monitor = BurstMonitor(OdbProbe(), max_mises) if stop_at_burst and max_mises is not None else None
+scheduler = Scheduler(AbaqusBackend(), max_jobs=max_jobs, total_cpus=total_cpus,
+	total_memory_mb=total_memory, on_finish=finish_job, monitor=monitor,
+	admission=AdmissionController(total_cpus, total_memory, licence_tokens, max_jobs) if admission_control else None)
+
+def queue_job(name, key, case_detail, params, window):
+	if build_spec is not None:
+		# The deck is written, the sweep runner queues it
+		return
+	scheduler.submit(Job(name, name + '.inp', cpus=cpus_per_job, memory_mb=memory_per_job,
+		meta={'key': key, 'flaw_detail': case_detail, 'case': name, 'params': params, 'window': window,
+		'retries': 0}))
+	scheduler.step()
+
+# Flaw bands through the wall from the inner surface, used to morph the reference deck
+flaw_kinds = [LIGAMENT, CRACK, LIGAMENT, LOSS]
+template = None
+
+# In template mode the reference case goes first
+case_order = list(range(len(design)))
+if template_mode:
+	case_order.insert(0, case_order.pop(len(design) // 2))
 
 """Initiate the while loop"""
-for index in range(num_of_simulation):
+for case in design[case_order]:
 
 	# Assign the crack parameters to the value
-	length = lengths[index % len(lengths)]
-	lig_2 = lig_2s[int(index/len(lengths)) % len(lig_2s)]
-	height = heights[int(index/len(lengths)/len(lig_2s)) % len(heights)]
+	index = int(case['index'])
+	length = float(case['length'])
+	lig_2 = float(case['lig_2'])
+	height = float(case['height'])
 
 	total_length = length * 2 + lig_2 + height
 	lig_1 = pipe_thk - total_length
 
-	# If the max length criterion is met, save it for output
-	flaw_detail.append([index, height * 1000, length * 2000,  lig_2 * 1000, lig_1 * 1000])
+	# Flaw parameters of the case, saved for output once it has a result
+	case_detail = [index, height * 1000, length * 2000,  lig_2 * 1000, lig_1 * 1000]
+
+	flaw_bands = [lig_1, length * 2, lig_2, height]
+
+	# Skip the case if its result is already in the cache
+	key = case_key(pipe_od=pipe_od, pipe_thk=pipe_thk, steel_grade=steel_grade, length=length,
+		lig_2=lig_2, height=height, mesh_fine=mesh_fine, mesh_end1=mesh_end1, mesh_end2=mesh_end2,
+		pres_mag_1=pres_mag_1, pres_mag_2=pres_mag_2,
+		template_mode=template_mode, adaptive_window=adaptive_window)
+	if build_spec is None and cache.has(key):
+		cached = cache.get(key)
+		flaw_detail.append(cached['flaw_detail'])
+		if 'window' in cached:
+			# The cached burst time is in the fixed window, it still informs the windows of the other cases
+			bracket.add_time((length, lig_2, height), cached['flaw_detail'][-1])
+		continue
+	stages.begin(job_name + str(index))
+
+	# Pressure window of the two steps
+	if adaptive_window and max_mises is not None:
+		window = bracket.window((length, lig_2, height))
+	else:
+		window = (pres_mag_1, pres_mag_2)
+
+	# Morph the reference deck instead of rebuilding the model
+	if template is not None:
+		stages.lap('morph')
+		template.write(job_name + str(index) + '.inp', morph.apply(template.nodes, flaw_bands),
+			pressures=window, comment='Flaw morphed from ' + template_name)
+		stages.end(nodes=len(template.nodes))
+		queue_job(job_name + str(index), key, case_detail, (length, lig_2, height), window)
+		continue
+
+	stages.lap('sketch')
 
 	# Calculate depths
 	thk = pipe_thk
@@ -221,62 +415,8 @@ for index in range(num_of_simulation):
 	mdb.models['Model-1'].Material(name='steel')
 	mdb.models['Model-1'].materials['steel'].Density(table=((mat_density,),))
 	mdb.models['Model-1'].materials['steel'].Elastic(table=((young_modulus, poisson_ratio),))
-	# Default option is X65 steel
-	if steel_grade == 65:
-		mdb.models['Model-1'].materials['steel'].Plastic(table=((470512820.0,
-			0.0), (508974359.0, 0.00811359), (535897435.0, 0.019472617), (570512820.0,
-			0.038945233), (601282051.0, 0.060040568), (623076923.0, 0.081135903), (
-			641025641.0, 0.102231238), (662820512.0, 0.128194726), (682051282.0,
-			0.159026369), (698717948.0, 0.189858012), (717948717.0, 0.223935091), (
-			735897435.0, 0.266125761), (751282051.0, 0.30831643), (764102564.0,
-			0.344016227), (776923076.0, 0.384584179), (792307692.0, 0.438133874), (
-			806410256.0, 0.486815416), (817948717.0, 0.535496958), (830769230.0,
-			0.592292089), (842307692.0, 0.644219067), (856410256.0, 0.710750507), (
-			866666666.0, 0.782150102), (879487179.0, 0.851926978), (889743589.0,
-			0.918458418), (900000000.0, 0.984989858), (908974359.0, 1.045030426), (
-			916666666.0, 1.10831643)))
-	# Use below if considering X42 steel with hardening power n=8
-	if steel_grade == 42:
-		mdb.models['Model-1'].materials['steel'].Plastic(table=((290000000.0,
-			0.0), (424154992.312889, 0.0275385878489327), (461149210.372505,
-			0.0550771756978654), (484627939.600789, 0.082615763546798), (
-			502113853.99879, 0.110154351395731), (516156452.599337, 0.137692939244663),
-			(527945510.285983, 0.165231527093596), (538137346.323632,
-			0.192770114942529), (547134170.004543, 0.220308702791461), (
-			555201098.831299, 0.247847290640394), (562522521.885263,
-			0.275385878489327), (569232084.272135, 0.30292446633826), (
-			575429877.083185, 0.330463054187192), (581192886.274058,
-			0.358001642036125), (586581650.56838, 0.385540229885058), (
-			591644671.800413, 0.41307881773399), (596421433.175642, 0.440617405582923),
-			(600944522.949387, 0.468155993431856), (605241164.835568,
-			0.495694581280788), (609334344.104584, 0.523233169129721), (
-			613243651.506362, 0.550771756978654), (616985926.081478,
-			0.578310344827586), (620575751.9369, 0.605848932676519), (624025847.195306,
-			0.633387520525452), (627347372.125112, 0.660926108374384), (
-			630550175.865016, 0.688464696223317), (633642995.91325, 0.71600328407225),
-			(636633620.869316, 0.743541871921182), (639529024.289882,
-			0.771080459770115), (642335475.621264, 0.798619047619048)))
-	# Use below if considering X100 steel with hardening power n=20
-	if steel_grade == 100:
-		mdb.models['Model-1'].materials['steel'].Plastic(table=((690000000.0,
-			0.0), (771642152.382901, 0.0274729064039409), (796664582.211452,
-			0.0549458128078818), (812208939.81009, 0.0824187192118227), (
-			823579589.388454, 0.109891625615764), (832577415.026499,
-			0.137364532019704), (840038086.921171, 0.164837438423645), (
-			846419394.31807, 0.192310344827586), (851999929.046442, 0.219783251231527),
-			(856962103.138024, 0.247256157635468), (861431988.866977,
-			0.274729064039409), (865500426.629878, 0.30220197044335), (
-			869235075.332677, 0.329674876847291), (872687706.729223,
-			0.357147783251232), (875898834.402907, 0.384620689655172), (
-			878900768.03402, 0.412093596059113), (881719695.677703, 0.439566502463054),
-			(884377143.518149, 0.467039408866995), (886891024.126369,
-			0.494512315270936), (889276405.174676, 0.521985221674877), (
-			891546083.65349, 0.549458128078818), (893711021.878313, 0.576931034482759),
-			(895780683.426378, 0.6044039408867), (897763295.391735, 0.63187684729064),
-			(899666055.562975, 0.659349753694581), (901495297.863439,
-			0.686822660098522), (903256625.76696, 0.714295566502463), (
-			904955020.860924, 0.741768472906404), (906594931.920279,
-			0.769241379310345), (908180348.551184, 0.796714285714286)))
+	# Plastic curve of the grade from the material library (X65 measured, X42 n=8, X100 n=20, ...)
+	mdb.models['Model-1'].materials['steel'].Plastic(table=material.plastic_table(steel_grade))
 	mdb.models['Model-1'].materials['steel'].PorousMetalPlasticity(relativeDensity=
 		0.999875, table=((1.5, 1.0, 2.25), ))
 	mdb.models['Model-1'].materials['steel'].porousMetalPlasticity.VoidNucleation(
@@ -287,13 +427,13 @@ for index in range(num_of_simulation):
 		((pipe_id, 0.0, 0.0),), )), sectionName='Section-1',thicknessAssignment=FROM_SECTION)
 	mdb.models['Model-1'].rootAssembly.DatumCsysByDefault(CARTESIAN)
 
-	if index == 0:
-		mdb.models['Model-1'].rootAssembly.Instance(dependent=OFF, name='pipe-1',
-			part=mdb.models['Model-1'].parts['pipe'])
-	else:
+	# The first case to be built may not be index 0 when earlier cases are cached
+	if 'pipe-1' in mdb.models['Model-1'].rootAssembly.instances.keys():
 		del mdb.models['Model-1'].rootAssembly.instances['pipe-1']
-		mdb.models['Model-1'].rootAssembly.Instance(dependent=OFF, name='pipe-1',
-			part=mdb.models['Model-1'].parts['pipe'])
+	mdb.models['Model-1'].rootAssembly.Instance(dependent=OFF, name='pipe-1',
+		part=mdb.models['Model-1'].parts['pipe'])
+
+	stages.lap('partition')
 
 	# Create sets: 3 symmetry planes and an end cap
 	mdb.models['Model-1'].rootAssembly.Set(faces=
@@ -313,37 +453,6 @@ for index in range(num_of_simulation):
 	mdb.models['Model-1'].rootAssembly.Surface(name='inner', side1Faces=
 		mdb.models['Model-1'].rootAssembly.instances['pipe-1'].faces.findAt(((pipe_id, 0.0001, pipe_len / 2),)))
 
-	# Create magic points and edges ;)
-	if T_small:
-		if D_small:
-			magic_pt = (0.0193620651670132, 0.125515379266719)
-			magic_edge = (0.017624, 0.114249, pipe_len)
-			if steel_grade == 65:
-				pres_mag_1 = 58500000
-				pres_mag_2 = 78000000
-			if steel_grade == 42:
-				pres_mag_1 = 40000000
-				pres_mag_2 = 60000000
-			if steel_grade == 100:
-				pres_mag_1 = 90000000
-				pres_mag_2 = 110000000
-		else:
-			magic_pt = (0.0189993341502983, 0.219178067565725)
-			magic_edge = (0.018028, 0.20797, pipe_len)
-			pres_mag_1 = 31500000
-			pres_mag_2 = 42000000
-	else:
-		if D_small:
-			magic_pt = (0.022, 0.125079974416371)
-			magic_edge = (0.0187, 0.106318, pipe_len)
-			pres_mag_1 = 112000000
-			pres_mag_2 = 140000000
-		else:
-			magic_pt = (0.02, 0.227723428746363)
-			magic_edge = (0.018333, 0.208746, pipe_len)
-			pres_mag_1 = 57600000
-			pres_mag_2 = 72000000
-
 	# Partition face: z-sym face
 	mdb.models['Model-1'].ConstrainedSketch(gridSpacing=0.01, name='__profile__',
 		sheetSize=0.5, transform=
@@ -399,7 +508,7 @@ for index in range(num_of_simulation):
 	mdb.models['Model-1'].rootAssembly.PartitionCellByExtrudeEdge(cells=
 		mdb.models['Model-1'].rootAssembly.instances['pipe-1'].cells.findAt(((
 		pipe_id, 0.0, pipe_len), ), ((pipe_id, 0.0, 0.0), ), ), edges=(
-		mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt(magic_edge, ), ), line=
+		mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt(pipe_index.magic_edge(), ), ), line=
 		mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt((
 		pipe_id, 0.0, 0.0001), ), sense=REVERSE)
 
@@ -421,6 +530,8 @@ for index in range(num_of_simulation):
 		mdb.models['Model-1'].rootAssembly.instances['pipe-1'].cells.findAt(((
 		0.0, pipe_id, pipe_len), )), ))
 
+	stages.lap('mesh')
+
 	# Seed the crack tip, double biased on the long edge
 	mdb.models['Model-1'].rootAssembly.seedEdgeBySize(deviationFactor=0.8, edges=
 		mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt(
@@ -450,84 +561,10 @@ for index in range(num_of_simulation):
 		pipe_od - height, pipe_len), ), ), size=0.001)
 
 	# Seed the rest of the pipe
-	if T_small:
-		if D_small:
-			mdb.models['Model-1'].rootAssembly.seedEdgeByNumber(constraint=FINER, edges=
-				mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt(((
-				0.016008, 0.103773, 0.28575), ), ((0.01658, 0.107479, 0.3), ), ((0.018295,
-				0.118597, 0.29525), ), ((0.017723, 0.114891, 0.0), ), ((0.105, 0.0,
-				0.28575), ), ((0.013745, 0.11921, 0.281), ), ((0.0, 0.10875, 0.281), ), ((
-				0.004017, 0.104923, 0.281), ), ((0.004591, 0.119912, 0.0), ), ((0.10875,
-				0.0, 0.0), ), ((0.10875, 0.0, 0.281), ), ((0.12, 0.0, 0.28575), ), ((
-				0.004017, 0.104923, 0.0), ), ((0.11625, 0.0, 0.3), ), ((0.0, 0.11625, 0.0),
-				), ), number=3)
-			mdb.models['Model-1'].rootAssembly.seedEdgeByNumber(constraint=FINER, edges=
-				mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt(((
-				0.016008, 0.103773, 0.07025), ), ((0.018295, 0.118597, 0.21075), ), ((
-				0.051028, 0.091767, 0.281), ), ((0.098473, 0.036441, 0.3), ), ((0.051028,
-				0.091767, 0.0), ), ((0.105, 0.0, 0.07025), ), ((0.0, 0.12, 0.07025), ), ((
-				0.058318, 0.104876, 0.0), ), ((0.112541, 0.041647, 0.281), ), ((0.12, 0.0,
-				0.07025), ), ((0.058318, 0.104876, 0.3), ), ((0.0, 0.105, 0.07025), ), ),
-				number=10)
-		else:
-			mdb.models['Model-1'].rootAssembly.seedEdgeByNumber(constraint=FINER, edges=
-				mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt(((
-				0.017704, 0.204234, 0.28575), ), ((0.018028, 0.20797, 0.3), ), ((0.018999,
-				0.219178, 0.29525), ), ((0.018675, 0.215442, 0.0), ), ((0.205, 0.0,
-				0.28575), ), ((0.014257, 0.219538, 0.281), ), ((0.0, 0.20875, 0.281), ), ((
-				0.004431, 0.204952, 0.281), ), ((0.004755, 0.219949, 0.0), ), ((0.20875,
-				0.0, 0.0), ), ((0.20875, 0.0, 0.281), ), ((0.22, 0.0, 0.28575), ), ((
-				0.004431, 0.204952, 0.0), ), ((0.21625, 0.0, 0.3), ), ((0.0, 0.21625, 0.0),
-				), ), number=3)
-			mdb.models['Model-1'].rootAssembly.seedEdgeByNumber(constraint=FINER, edges=
-				mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt(((
-				0.017704, 0.204234, 0.07025), ), ((0.018999, 0.219178, 0.21075), ), ((
-				0.090559, 0.183913, 0.281), ), ((0.191047, 0.074338, 0.3), ), ((0.090559,
-				0.183913, 0.0), ), ((0.205, 0.0, 0.07025), ), ((0.0, 0.22, 0.07025), ), ((
-				0.097185, 0.19737, 0.0), ), ((0.205026, 0.079777, 0.281), ), ((0.22, 0.0,
-				0.07025), ), ((0.097185, 0.19737, 0.3), ), ((0.0, 0.205, 0.07025), ), ),
-				number=15)
-	else:
-		if D_small:
-			mdb.models['Model-1'].rootAssembly.seedEdgeByNumber(constraint=FINER, edges=
-				mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt(((
-				0.017539, 0.099719, 0.3), ), ((0.019705, 0.11203, 0.0), ), ((0.0, 0.10125,
-				0.279), ), ((0.10125, 0.0, 0.0), ), ((0.10125, 0.0, 0.279), ), ((0.11375,
-				0.0, 0.3), ), ((0.0, 0.11375, 0.0), ), ), number=5)
-			mdb.models['Model-1'].rootAssembly.seedEdgeByNumber(constraint=FINER, edges=
-				mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt(((
-				0.016457, 0.093564, 0.28425), ), ((0.020787, 0.118186, 0.29475), ), ((
-				0.095, 0.0, 0.28425), ), ((0.015625, 0.118978, 0.279), ), ((0.004134,
-				0.09491, 0.279), ), ((0.005222, 0.119886, 0.0), ), ((0.12, 0.0, 0.28425),
-				), ((0.004134, 0.09491, 0.0), ), ), number=3)
-			mdb.models['Model-1'].rootAssembly.seedEdgeByNumber(constraint=FINER, edges=
-				mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt(((
-				0.016457, 0.093564, 0.06975), ), ((0.020787, 0.118186, 0.20925), ), ((
-				0.047474, 0.082288, 0.279), ), ((0.089267, 0.032501, 0.3), ), ((0.047474,
-				0.082288, 0.0), ), ((0.095, 0.0, 0.06975), ), ((0.0, 0.12, 0.06975), ), ((
-				0.059967, 0.103942, 0.0), ), ((0.112759, 0.041054, 0.279), ), ((0.12, 0.0,
-				0.06975), ), ((0.059967, 0.103942, 0.3), ), ((0.0, 0.095, 0.06975), ), ),
-				number=10)
-		else:
-			mdb.models['Model-1'].rootAssembly.seedEdgeByNumber(constraint=FINER, edges=
-				mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt(((
-				0.017607, 0.200478, 0.3), ), ((0.018701, 0.21293, 0.0), ), ((0.0, 0.20125,
-				0.279), ), ((0.20125, 0.0, 0.0), ), ((0.20125, 0.0, 0.279), ), ((0.21375,
-				0.0, 0.3), ), ((0.0, 0.21375, 0.0), ), ), number=5)
-			mdb.models['Model-1'].rootAssembly.seedEdgeByNumber(constraint=FINER, edges=
-				mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt(((
-				0.019248, 0.219156, 0.29475), ), ((0.195, 0.0, 0.28425), ), ((0.014444,
-				0.219525, 0.279), ), ((0.004818, 0.219947, 0.0), ), ((0.22, 0.0, 0.28425),
-				), ((0.01706, 0.194252, 0.28425), ), ((0.00427, 0.194953, 0.279), ), 
-				((0.00427, 0.194953, 0.0), ), ), number=3)
-			mdb.models['Model-1'].rootAssembly.seedEdgeByNumber(constraint=FINER, edges=
-				mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt(((
-				0.01706, 0.194252, 0.06975), ), ((0.019248, 0.219156, 0.20925), ), ((
-				0.08629, 0.174869, 0.279), ), ((0.181747, 0.07066, 0.3), ), ((0.08629,
-				0.174869, 0.0), ), ((0.195, 0.0, 0.06975), ), ((0.0, 0.22, 0.06975), ), ((
-				0.097353, 0.197288, 0.0), ), ((0.205048, 0.079719, 0.279), ), ((0.22, 0.0,
-				0.06975), ), ((0.097353, 0.197288, 0.3), ), ((0.0, 0.195, 0.06975), ), ),
-				number=15)
+	for group in geometry.GROUPS:
+		mdb.models['Model-1'].rootAssembly.seedEdgeByNumber(constraint=FINER, edges=
+			mdb.models['Model-1'].rootAssembly.instances['pipe-1'].edges.findAt(
+			*[(point, ) for point in pipe_index.group(group)]), number=seed_numbers[group])
 
 	# Generate mesh
 	mdb.models['Model-1'].rootAssembly.generateMesh(regions=
@@ -543,6 +580,10 @@ for index in range(num_of_simulation):
 		mdb.models['Model-1'].rootAssembly.instances['pipe-1'].cells.findAt(((
 		0.0, pipe_id, pipe_len), )))
 
+	stages.end(elements=len(mdb.models['Model-1'].rootAssembly.instances['pipe-1'].elements),
+		nodes=len(mdb.models['Model-1'].rootAssembly.instances['pipe-1'].nodes))
+	stages.lap('model')
+
 	# Create step and field output
 	mdb.models['Model-1'].StaticStep(maxNumInc=10, name='Step-1', nlgeom=ON,
 		previous='Initial')
@@ -555,9 +596,9 @@ for index in range(num_of_simulation):
 
 	# Create load and BC
 	mdb.models['Model-1'].Pressure(amplitude=UNSET, createStepName='Step-1',
-		distributionType=UNIFORM, field='', magnitude=pres_mag_1, name='Load-1',
+		distributionType=UNIFORM, field='', magnitude=window[0], name='Load-1',
 		region=mdb.models['Model-1'].rootAssembly.surfaces['inner'])
-	mdb.models['Model-1'].loads['Load-1'].setValuesInStep(magnitude=pres_mag_2, stepName=
+	mdb.models['Model-1'].loads['Load-1'].setValuesInStep(magnitude=window[1], stepName=
 		'Step-2')
 	mdb.models['Model-1'].XsymmBC(createStepName='Step-1', localCsys=None, name=
 		'Xsym', region=mdb.models['Model-1'].rootAssembly.sets['x_sym'])
@@ -575,55 +616,21 @@ for index in range(num_of_simulation):
 		explicitPrecision=SINGLE, getMemoryFromAnalysis=True, historyPrint=OFF,
 		memory=90, memoryUnits=PERCENTAGE, model='Model-1', modelPrint=OFF,
 		multiprocessingMode=DEFAULT, name=job_name+str(index), nodalOutputPrecision=SINGLE,
-		numCpus=16, numDomains=16, numGPUs=0, queue=None, resultsFormat=ODB,
+		numCpus=cpus_per_job, numDomains=cpus_per_job, numGPUs=0, queue=None, resultsFormat=ODB,
 		scratch='', type=ANALYSIS, userSubroutine='', waitHours=0, waitMinutes=0)
-	#mdb.jobs[job_name + str(index)].writeInput()
-	mdb.jobs[job_name + str(index)].submit(consistencyChecking=OFF)
-	mdb.jobs[job_name + str(index)].waitForCompletion()
-
-	# Remove all the files after getting the data
-	try:
-		os.remove(job_name + str(index) + '.abq')
-	except WindowsError:
-		pass
-	try:
-		os.remove(job_name + str(index) + '.mdl')
-	except WindowsError:
-		pass
-	try:
-		os.remove(job_name + str(index) + '.pac')
-	except WindowsError:
-		pass
-	try:
-		os.remove(job_name + str(index) + '.stt')
-	except WindowsError:
-		pass
-	try:
-		os.remove(job_name + str(index) + '.prt')
-	except WindowsError:
-		pass
-	try:
-		os.remove(job_name + str(index) + '.res')
-	except WindowsError:
-		pass
-	try:
-		os.remove(job_name + str(index) + '.sim')
-	except WindowsError:
-		pass
-	try:
-		os.remove(job_name + str(index) + '.dat')
-	except WindowsError:
-		pass
-
-
-with open('burst_pressure/' + job_name + 'summary.txt' ,'w') as f:
-	f.write('---------------------------------------------------------------')
-	f.write('\n Total factorial DOE: ' + str(num_of_simulation))
-	f.write('\n Total simulations: ' + str(len(flaw_detail)))
-	f.write('\n Pipe outer diameter: ' + str(pipe_od * 2 * 1000) + ' mm')
-	f.write('\n Pipe thickness: ' + str(pipe_thk * 1000) + ' mm')
-	f.write('\n---------------------------------------------------------------')
-	f.write('\n Flaw parameters detail:')
-	for item in flaw_detail:
-		f.write('\n' + str(item)[1:-1])
-	
+	mdb.jobs[job_name + str(index)].writeInput(consistencyChecking=OFF)
+	stages.end()
+	queue_job(job_name + str(index), key, case_detail, (length, lig_2, height), window)
+
+	# The first deck built becomes the reference of the other cases
+	if template_mode:
+		template_name = job_name + str(index) + '.inp'
+		template = read_deck(template_name)
+		morph = FlawMorph(flaw_kinds, flaw_bands, pipe_id, pipe_thk, pipe_len, crack_par,
+			pipe_geometry.theta_par, lock_radius=loss_width)
+
+"""Wait for the jobs still queued or running"""
+scheduler.run()
+cleanup.close()
+if build_spec is None:
+	write_summary()
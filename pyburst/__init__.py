@@ -0,0 +1,31 @@
+"""
+Python helpers for the burst pressure simulations and equations
+The Abaqus scripts in Abaqus_script import these modules to run the DOE sweeps,
+the rest replaces the MATLAB helpers for fitting and evaluating the equations.
+
+ - scheduler: keeps several solver jobs in flight with a CPU/memory budget
+ - cache: content-addressed results so interrupted sweeps only run the missing cases
+ - deck: per-case input decks morphed from one meshed reference deck
+ - doe: full-factorial, Latin hypercube and Sobol designs with vectorized feasibility checks
+ - equations: batch evaluation of the fitted CW and CC equations with validity flags
+ - odb_post: burst time from the flaw region output, read frame by frame
+ - monitor: stops a running job as soon as its flaw region reaches the burst criterion
+ - bracket: per-case pressure windows predicted from the finished cases, with re-runs when a case misses its window
+ - fitting: batched Levenberg-Marquardt fits of the power-law equations with standard errors
+ - bootstrap: percentile intervals of the coefficients and bands of pb from parallel bootstrap refits
+ - active: active-learning driver that runs the cases where a bootstrap surrogate is least certain
+ - store: memory-mapped columnar store of all results with appends and filtered queries
+ - assess: command line batch assessment of inline-inspection flaw lists
+ - geometry: named seeding edges of the partitioned pipe, derived from its dimensions
+ - convergence: mesh-convergence study of the reference flaw with the cheapest mesh within tolerance
+ - instrument: JSON lines timing of every stage of every case, with per-sweep summaries
+ - postjob: background removal of the solver scratch files and compaction of the output databases
+ - sweep: TOML sweep specs of both flaw types run side by side through one scheduler
+ - material: plastic tables of the steel grades from power-law curves, cached by parameters
+ - surrogate: NumPy network of pb trained on the result store, exported to one .npz file
+ - reliability: Monte Carlo probability of burst below the MAOP per flaw, with reproducible Philox streams
+ - critical: largest acceptable flaw size for a target pressure, broadcast over pipes and ligaments
+ - lookup: memory-mapped grids of pb over the normalized flaw and t/D, interpolated multilinearly
+ - distributed: coordinator and solver-host workers of the sweeps around a SQLite queue broker
+ - admission: memory, licence tokens and CPUs of each job from its mesh, packed within the node
+"""
@@ -0,0 +1,132 @@
+"""
+Active-learning driver for the flaw geometry sweeps
+Instead of a fixed grid, the cases are chosen in batches where the surrogate is
+least certain. The surrogate is the power law of the equations fitted to bootstrap
+resamples of the results so far; the spread of its predictions is the uncertainty.
+The loop stops when the mean coefficients change by less than tol between batches.
+
+The simulator is any callable from a design (structured array, see doe.py) to the
+normalized burst pressures of its cases. PowerLawSimulator is an analytic stand-in
+for running the loop end-to-end without Abaqus.
+"""
+############################################################################################################
+import numpy as np
+
+from pyburst import doe
+from pyburst.fitting import fit_power_law, power_law
+
+
+class PowerLawSimulator(object):
+	"""Stand-in for the FE runs: the power law with coefficients c, plus relative noise"""
+
+	def __init__(self, c, pipe_thk, flaw, noise=0.0, seed=None):
+		self.c = np.asarray(c, dtype=float)
+		self.pipe_thk = pipe_thk
+		self.flaw = flaw
+		self.noise = noise
+		self.rng = np.random.default_rng(seed)
+		self.runs = 0
+
+	def __call__(self, design):
+		self.runs += len(design)
+		pb = power_law(self.c, doe.dimensionless(design, self.pipe_thk, self.flaw))
+		if self.noise:
+			pb *= 1 + self.noise * self.rng.standard_normal(len(pb))
+		return pb
+
+
+class BootstrapSurrogate(object):
+	"""Power law fitted to n_boot bootstrap resamples; predictions give mean and variance"""
+
+	def __init__(self, n_boot=64, seed=None):
+		self.n_boot = n_boot
+		self.rng = np.random.default_rng(seed)
+		self.c = None
+
+	def fit(self, x, pb):
+		n = len(x)
+		# Resample counts per point, every resample is one weighted fit of the batch
+		weights = np.stack([np.bincount(self.rng.integers(0, n, n), minlength=n) for _ in range(self.n_boot)])
+		# Least squares on pb as in bootstrap.py, the resamples start from the fit of all points
+		self.mean_c = fit_power_law(x, pb).c
+		self.c = fit_power_law(x, np.broadcast_to(pb, (self.n_boot, n)), weights, c0=self.mean_c).c
+		return self
+
+	def predict(self, x):
+		"""Mean and variance of pb over the resamples"""
+		samples = power_law(self.c, x)
+		return samples.mean(axis=0), samples.var(axis=0)
+
+
+class ActiveLearner(object):
+	"""
+	Runs the simulator batch by batch on the candidates of highest predictive variance
+	Candidates are a Sobol design over bounds, pruned to feasible geometries. Within a
+	batch, candidates closer than min_distance (in the unit cube) to a chosen one are
+	skipped so that a batch does not pile up in one corner.
+	"""
+
+	def __init__(self, simulator, bounds, pipe_thk, flaw, max_length=None, batch=4, initial=None,
+		candidates=4096, tol=1e-3, patience=2, max_runs=81, min_distance=0.1, n_boot=64, seed=None):
+		self.simulator = simulator
+		self.bounds = doe.as_pairs(bounds)
+		self.pipe_thk = pipe_thk
+		self.flaw = flaw
+		self.batch = batch
+		self.tol = tol
+		self.patience = patience
+		self.max_runs = max_runs
+		self.min_distance = min_distance
+		self.surrogate = BootstrapSurrogate(n_boot, seed)
+		pool = doe.sobol(self.bounds, candidates, seed=seed)
+		self.pool = doe.prune(pool, pipe_thk, flaw, max_length)
+		if not len(self.pool):
+			raise ValueError('no feasible geometry within the bounds')
+		self.unit = np.column_stack([(self.pool[name] - low) / (high - low) for name, low, high in self.bounds])
+		self.x_pool = doe.dimensionless(self.pool, pipe_thk, flaw)
+		# The first points of a Sobol sequence are well spread, they seed the surrogate
+		dim = self.x_pool.shape[1]
+		self.initial = initial or 2 * (dim + 1)
+		self.done = np.zeros(len(self.pool), dtype=bool)
+		self.pb = np.full(len(self.pool), np.nan)
+		self.history = []
+
+	def run_cases(self, chosen):
+		self.pb[chosen] = self.simulator(self.pool[chosen])
+		self.done[chosen] = True
+
+	def propose(self):
+		"""Indices of the next batch in the pool"""
+		open_ = np.flatnonzero(~self.done)
+		_, var = self.surrogate.predict(self.x_pool[open_])
+		chosen = []
+		for i in open_[np.argsort(var)[::-1]]:
+			if len(chosen) == self.batch:
+				break
+			if chosen and np.min(np.linalg.norm(self.unit[chosen] - self.unit[i], axis=1)) < self.min_distance:
+				continue
+			chosen.append(i)
+		return np.array(chosen, dtype=np.intp)
+
+	def run(self):
+		"""Run until the coefficients converge or max_runs; returns the fitted coefficients"""
+		self.run_cases(np.arange(min(self.initial, len(self.pool))))
+		previous = None
+		stable = 0
+		while True:
+			done = np.flatnonzero(self.done)
+			self.surrogate.fit(self.x_pool[done], self.pb[done])
+			c = self.surrogate.mean_c
+			change = np.inf if previous is None else np.max(np.abs(c - previous) / np.maximum(np.abs(previous), 1e-3))
+			_, var = self.surrogate.predict(self.x_pool)
+			self.history.append({'runs': len(done), 'c': c, 'change': change, 'max_std': float(np.sqrt(var.max()))})
+			stable = stable + 1 if change < self.tol else 0
+			if stable >= self.patience or len(done) >= self.max_runs or self.done.all():
+				return c
+			previous = c
+			chosen = self.propose()
+			self.run_cases(chosen[:self.max_runs - len(done)])
+
+	def results(self):
+		"""Design and pb of the cases run so far"""
+		return self.pool[self.done], self.pb[self.done]
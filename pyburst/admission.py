@@ -0,0 +1,207 @@
+"""
+Admission control of the solver jobs: memory, licence tokens and CPUs per job
+The scripts create their jobs with memory=90, memoryUnits=PERCENTAGE, so two jobs on
+one node would each claim 90 % of its memory, and the licence tokens of a job grow
+with its cores. The controller sizes every job from its mesh instead:
+
+    memory_mb = margin * a_m * elements^b_m                (at least min_memory_mb)
+    wall      = a_t * elements^b_t * ((1 - p) + p / cpus)  (Amdahl, p parallel fraction)
+    tokens    = int(5 * cpus^0.422)
+
+and admits a job only while the running jobs stay within the CPUs, memory and tokens
+of the node. For every mesh size it picks the CPUs per job (and as many domains, as
+the scripts do) with the most cases per hour: jobs in parallel / wall, the number of
+jobs being limited by whichever of CPUs, memory, tokens or max_jobs runs out first.
+
+The default coefficients are rough values for the C3D8R pipe meshes; every finished
+job refits them from its element count, CPUs, wall time and the memory estimate of
+its .dat file. Plans can be tried with made-up capacities:
+
+    python -m pyburst.admission plan --elements 150000 --total-cpus 64 --total-memory 250000 --tokens 50
+    Scheduler(backend, admission=AdmissionController(64, 250000, total_tokens=50, max_jobs=8))
+"""
+############################################################################################################
+import os
+import sys
+import argparse
+from collections import namedtuple
+
+import numpy as np
+
+from pyburst.convergence import count_elements, memory_estimate
+from pyburst.scheduler import abaqus_tokens
+
+MEMORY = (0.004, 1.2)  # a_m (MB), b_m: about 4 GB at 100k elements
+WALL_TIME = (0.05, 1.2)  # a_t (s), b_t on one core
+PARALLEL_FRACTION = 0.9
+CPU_OPTIONS = (1, 2, 4, 6, 8, 12, 16, 18, 24, 32, 48, 64)
+
+"""Best split of the node for one mesh size"""
+Plan = namedtuple('Plan', ['cpus', 'jobs', 'memory_mb', 'tokens', 'wall_time', 'cases_per_hour'])
+
+
+class CostModel(object):
+	"""Memory and wall time of a job from its element count and CPUs, see the module docstring"""
+
+	def __init__(self, memory=MEMORY, wall_time=WALL_TIME, parallel_fraction=PARALLEL_FRACTION, margin=1.2,
+		min_memory_mb=2000):
+		self.memory = tuple(memory)
+		self.wall_time_coeffs = tuple(wall_time)
+		self.parallel_fraction = parallel_fraction
+		self.margin = margin
+		self.min_memory_mb = min_memory_mb
+
+	def memory_mb(self, elements):
+		a, b = self.memory
+		return max(self.min_memory_mb, self.margin * a * elements ** b)
+
+	def speedup(self, cpus):
+		"""Wall time on cpus cores relative to one core"""
+		return (1 - self.parallel_fraction) + self.parallel_fraction / cpus
+
+	def wall_time(self, elements, cpus):
+		a, b = self.wall_time_coeffs
+		return a * elements ** b * self.speedup(cpus)
+
+	def fit(self, records):
+		"""
+		Refit from finished jobs, dicts with elements, cpus, wall_time and memory_estimate_mb
+		(None when unknown). Exponents need two mesh sizes and p two CPU counts; with
+		less, only the scale is refitted.
+		"""
+		memory = [(r['elements'], r['memory_estimate_mb']) for r in records if r.get('memory_estimate_mb')]
+		if memory:
+			elements, mb = np.array(memory, dtype=float).T
+			b = self.memory[1]
+			if len(np.unique(elements)) > 1:
+				b = float(np.clip(np.polyfit(np.log(elements), np.log(mb), 1)[0], 0.5, 2.0))
+			self.memory = (float(np.exp(np.mean(np.log(mb) - b * np.log(elements)))), b)
+		timed = [(r['elements'], r['cpus'], r['wall_time']) for r in records if r.get('wall_time')]
+		if not timed:
+			return self
+		elements, cpus, wall = np.array(timed, dtype=float).T
+		b = self.wall_time_coeffs[1]
+		if len(np.unique(cpus)) > 1:
+			# wall / E^b = a (1 - p) + a p / cpus is linear in 1 / cpus
+			slope, intercept = np.polyfit(1 / cpus, wall / elements ** b, 1)
+			if slope > 0 and slope + intercept > 0:
+				self.parallel_fraction = float(np.clip(slope / (slope + intercept), 0.0, 0.99))
+		serial = wall / self.speedup(cpus)
+		if len(np.unique(elements)) > 1:
+			b = float(np.clip(np.polyfit(np.log(elements), np.log(serial), 1)[0], 0.5, 2.5))
+		self.wall_time_coeffs = (float(np.exp(np.mean(np.log(serial) - b * np.log(elements)))), b)
+		return self
+
+
+class AdmissionController(object):
+	"""
+	Sizes the jobs of a Scheduler and admits them within the node, see the module
+	docstring. With choose_cpus False the CPUs of each job are kept and only its
+	memory is set. The budgets are plain numbers, so any node can be simulated.
+	"""
+
+	def __init__(self, total_cpus, total_memory_mb, total_tokens=None, max_jobs=None, model=None, choose_cpus=True,
+		cpu_options=CPU_OPTIONS):
+		self.total_cpus = total_cpus
+		self.total_memory_mb = total_memory_mb
+		self.total_tokens = total_tokens
+		self.max_jobs = max_jobs
+		self.model = model or CostModel()
+		self.choose_cpus = choose_cpus
+		self.cpu_options = [cpus for cpus in cpu_options if cpus <= total_cpus]
+		self.records = []
+
+	def jobs_in_parallel(self, cpus, memory_mb):
+		"""Jobs of one size that fit in the node together"""
+		jobs = [self.total_cpus // cpus, int(self.total_memory_mb // memory_mb)]
+		if self.total_tokens is not None:
+			jobs.append(self.total_tokens // abaqus_tokens(cpus))
+		if self.max_jobs is not None:
+			jobs.append(self.max_jobs)
+		return max(0, min(jobs))
+
+	def plans(self, elements):
+		"""Plan of every CPU option that fits in the node, by CPUs"""
+		memory_mb = self.model.memory_mb(elements)
+		plans = []
+		for cpus in self.cpu_options:
+			jobs = self.jobs_in_parallel(cpus, memory_mb)
+			if jobs:
+				wall = self.model.wall_time(elements, cpus)
+				plans.append(Plan(cpus, jobs, memory_mb, abaqus_tokens(cpus), wall, jobs * 3600.0 / wall))
+		return plans
+
+	def plan(self, elements):
+		"""Plan with the most cases per hour, the fewer CPUs on a tie; None if no job fits the node"""
+		plans = self.plans(elements)
+		if not plans:
+			return None
+		best = max(plan.cases_per_hour for plan in plans)
+		return min((plan for plan in plans if plan.cases_per_hour >= best * (1 - 1e-9)), key=lambda plan: plan.cpus)
+
+	def prepare(self, job):
+		"""Set the memory, and the CPUs, of a submitted job from the elements of its deck"""
+		if 'elements' not in job.meta:
+			job.meta['elements'] = count_elements(os.path.join(job.workdir, job.input_file))
+		elements = job.meta['elements']
+		plan = self.plan(elements) if self.choose_cpus else None
+		if plan is not None:
+			job.cpus = plan.cpus
+		job.memory_mb = int(np.ceil(self.model.memory_mb(elements)))
+		job.meta['tokens'] = abaqus_tokens(job.cpus)
+
+	def fits(self, job, running):
+		"""Whether job can start next to the running jobs; a job too large for the node runs alone"""
+		if not running:
+			return True
+		if self.max_jobs is not None and len(running) >= self.max_jobs:
+			return False
+		if sum(other.cpus for other in running) + job.cpus > self.total_cpus:
+			return False
+		if sum(other.memory_mb or 0 for other in running) + (job.memory_mb or 0) > self.total_memory_mb:
+			return False
+		if self.total_tokens is not None and \
+			sum(abaqus_tokens(other.cpus) for other in running) + abaqus_tokens(job.cpus) > self.total_tokens:
+			return False
+		return True
+
+	def observe(self, result):
+		"""Refit the cost model with a finished job"""
+		job = result.job
+		if result.returncode != 0 or 'elements' not in job.meta:
+			return
+		self.records.append({'elements': job.meta['elements'], 'cpus': job.cpus,
+			'wall_time': result.end - result.start,
+			'memory_estimate_mb': memory_estimate(os.path.join(job.workdir, job.name + '.dat'))})
+		self.model.fit(self.records)
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(prog='python -m pyburst.admission', description=__doc__.split('\n')[1])
+	commands = parser.add_subparsers(dest='command')
+	command = commands.add_parser('plan', help='cases per hour of every CPU split for a mesh size')
+	command.add_argument('--elements', type=int, help='elements of the mesh')
+	command.add_argument('--deck', help='input deck to count the elements of')
+	command.add_argument('--total-cpus', type=int, default=64, help='CPUs of the node')
+	command.add_argument('--total-memory', type=int, default=250000, help='memory of the node (MB)')
+	command.add_argument('--tokens', type=int, help='licence tokens available to the node')
+	command.add_argument('--max-jobs', type=int)
+	command.add_argument('--parallel-fraction', type=float, default=PARALLEL_FRACTION)
+	args = parser.parse_args(argv)
+	if args.command != 'plan' or (args.elements is None and args.deck is None):
+		parser.print_help()
+		return 1
+	elements = args.elements if args.elements is not None else count_elements(args.deck)
+	controller = AdmissionController(args.total_cpus, args.total_memory, args.tokens, args.max_jobs,
+		CostModel(parallel_fraction=args.parallel_fraction))
+	best = controller.plan(elements)
+	print('{} elements, {:.0f} MB per job'.format(elements, controller.model.memory_mb(elements)))
+	print('{:>5} {:>5} {:>7} {:>10} {:>11}'.format('cpus', 'jobs', 'tokens', 'wall (h)', 'cases/hour'))
+	for plan in controller.plans(elements):
+		print('{:>5} {:>5} {:>7} {:>10.2f} {:>11.2f}{}'.format(plan.cpus, plan.jobs, plan.tokens * plan.jobs,
+			plan.wall_time / 3600, plan.cases_per_hour, '  <' if plan == best else ''))
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,321 @@
+"""
+Batch assessment of inline-inspection flaw lists with the burst pressure equations
+    python -m pyburst.assess flaws.csv predictions.csv --flaw cw --t 15 --D 240
+
+The flaw list is read in chunks of --chunk records, so memory stays bounded for
+any file size. Chunks are parsed and evaluated in a process pool (at most two
+chunks per process in flight) and written back in input order.
+
+Input columns, all lengths in one unit (e.g. mm):
+ - CW records: h (loss height), a (full crack length), l (ligament)
+ - CC records: a1, a2 (full crack lengths), l1, l2 (ligaments)
+ - t and D per record, unless given as --t and --D
+ - flaw (cw or cc) per record, unless given as --flaw
+Other names can be mapped with --map h=depth_mm. Output: record number, an optional
+--id column, flaw type, normalized burst pressure pb and the validity flags of
+pyburst.equations. --cw-coeffs/--cc-coeffs also take a surrogate exported by
+pyburst.surrogate (.npz) or a table of pyburst.lookup (.lut). Parquet in or out
+needs pyarrow.
+"""
+############################################################################################################
+import os
+import sys
+import time
+import argparse
+import itertools
+import multiprocessing
+from collections import deque
+
+import numpy as np
+
+from pyburst import equations
+from pyburst.surrogate import Surrogate
+from pyburst.lookup import LookupTable
+
+FLAW_COLUMNS = {'cw': ('h', 'a', 'l'), 'cc': ('a1', 'a2', 'l1', 'l2')}
+OUTPUT_COLUMNS = ('record', 'flaw', 'pb', 'flags')
+
+
+def get_model(name):
+	"""Coefficient set by name, a surrogate exported by pyburst.surrogate (.npz file) or a lookup table (.lut)"""
+	if str(name).endswith('.npz'):
+		return Surrogate.load(name)
+	if str(name).endswith('.lut'):
+		return LookupTable(name)
+	return equations.get_set(name)
+
+
+def require_coefficients(parser, coefficients, names):
+	"""Exit through the parser when no coefficient file is given and a named set has no c1"""
+	if coefficients:
+		return
+	for name in names:
+		if name in equations.COEFFICIENTS:
+			try:
+				equations.complete_set(name)
+			except ValueError as error:
+				parser.error('--coefficients is required: {}'.format(error))
+
+
+class Assessment(object):
+	"""Evaluates parsed chunks: dict of column arrays -> output columns"""
+
+	def __init__(self, coeffs, flaw=None, t=None, D=None):
+		self.coeffs = dict((kind, get_model(name)) for kind, name in coeffs.items())
+		for kind, coeff in self.coeffs.items():
+			if coeff.flaw != kind:
+				raise ValueError('the {} records need a {} model, got {!r}'.format(kind, kind, coeff))
+			if isinstance(coeff, equations.CoefficientSet):
+				equations.complete_set(coeff)
+		self.flaw = flaw
+		self.t = t
+		self.D = D
+
+	def evaluate(self, columns, n):
+		t = self.t if self.t is not None else columns['t']
+		D = self.D if self.D is not None else columns['D']
+		t = np.broadcast_to(np.asarray(t, dtype=float), (n,))
+		D = np.broadcast_to(np.asarray(D, dtype=float), (n,))
+		pb = np.full(n, np.nan)
+		flags = np.full(n, equations.INVALID, dtype=np.uint8)
+		if self.flaw is not None:
+			kinds = np.full(n, self.flaw)
+		else:
+			kinds = np.char.lower(np.asarray(columns['flaw']).astype(str))
+		for kind in self.coeffs:
+			rows = np.flatnonzero(kinds == kind)
+			if not len(rows):
+				continue
+			data = [np.asarray(columns[name], dtype=float)[rows] for name in FLAW_COLUMNS[kind]]
+			if isinstance(self.coeffs[kind], equations.CoefficientSet):
+				out, f = equations.evaluate(self.coeffs[kind], data, t[rows], D[rows])
+			else:
+				out, f = self.coeffs[kind].evaluate(data, t[rows], D[rows])
+			pb[rows] = out
+			flags[rows] = f
+		return kinds, pb, flags
+
+
+"""Per-process state of the pool workers, set by init_worker"""
+WORKER = {}
+
+
+def init_worker(settings):
+	if settings.get('coefficients'):
+		equations.COEFFICIENTS.update(equations.load_coefficients(settings['coefficients']))
+	WORKER['assessment'] = Assessment(settings['coeffs'], settings['flaw'], settings['t'], settings['D'])
+	WORKER['settings'] = settings
+
+
+def parse_csv(lines, header, needed, delimiter):
+	"""Columns of a chunk of CSV lines; numeric columns through loadtxt, text columns by splitting"""
+	columns = {}
+	numeric = [(name, header.index(source)) for name, source in needed if name not in ('flaw', 'id')]
+	if numeric:
+		data = np.loadtxt(lines, delimiter=delimiter, usecols=[i for _, i in numeric], ndmin=2, dtype=float)
+		for j, (name, _) in enumerate(numeric):
+			columns[name] = data[:, j]
+	text = [(name, header.index(source)) for name, source in needed if name in ('flaw', 'id')]
+	if text:
+		fields = [line.rstrip('\r\n').split(delimiter) for line in lines]
+		for name, i in text:
+			columns[name] = np.array([row[i].strip() for row in fields])
+	return columns
+
+
+def format_csv(start, kinds, pb, flags, ids=None):
+	records = range(start, start + len(pb))
+	if ids is None:
+		rows = zip(records, kinds.tolist(), pb.tolist(), flags.tolist())
+		lines = ['{},{},{!r},{}'.format(*row) for row in rows]
+	else:
+		rows = zip(records, ids.tolist(), kinds.tolist(), pb.tolist(), flags.tolist())
+		lines = ['{},{},{},{!r},{}'.format(*row) for row in rows]
+	return '\n'.join(lines) + '\n' if lines else ''
+
+
+def assess_chunk(task):
+	"""Worker: parse a chunk (CSV lines or column dict), evaluate it and format the output"""
+	start, payload = task
+	settings = WORKER['settings']
+	if isinstance(payload, dict):
+		columns = payload
+	else:
+		columns = parse_csv(payload, settings['header'], settings['needed'], settings['delimiter'])
+	n = len(next(iter(columns.values()))) if columns else 0
+	kinds, pb, flags = WORKER['assessment'].evaluate(columns, n)
+	ids = columns.get('id')
+	if settings['output_format'] == 'csv':
+		return n, format_csv(start, kinds, pb, flags, ids)
+	result = {'record': np.arange(start, start + n), 'flaw': kinds, 'pb': pb, 'flags': flags}
+	if ids is not None:
+		result['id'] = np.asarray(ids)
+	return n, result
+
+
+def needed_columns(args, names):
+	mapping = dict(item.split('=', 1) for item in args.map)
+	wanted = []
+	kinds = [args.flaw] if args.flaw else list(FLAW_COLUMNS)
+	for kind in kinds:
+		wanted += FLAW_COLUMNS[kind]
+	if args.t is None:
+		wanted.append('t')
+	if args.D is None:
+		wanted.append('D')
+	if not args.flaw:
+		wanted.append('flaw')
+	if args.id:
+		mapping['id'] = args.id
+		wanted.append('id')
+	needed = []
+	for name in wanted:
+		source = mapping.get(name, name)
+		if source not in names:
+			raise ValueError('column {!r} not in the flaw list (map another column with --map {}=...)'.format(
+				source, name))
+		needed.append((name, source))
+	return needed
+
+
+def csv_chunks(path, chunk):
+	"""Header and chunks of raw lines of a CSV file"""
+	f = open(path)
+	header = [name.strip() for name in f.readline().rstrip('\r\n').split(',')]
+
+	def chunks():
+		try:
+			start = 0
+			while True:
+				lines = [line for line in itertools.islice(f, chunk) if line.strip()]
+				if not lines:
+					break
+				yield start, lines
+				start += len(lines)
+		finally:
+			f.close()
+	return header, chunks()
+
+
+def parquet_chunks(path, chunk, needed):
+	"""Header and chunks of column dicts of a Parquet file"""
+	import pyarrow.parquet as pq
+	parquet = pq.ParquetFile(path)
+	header = parquet.schema_arrow.names
+
+	def chunks():
+		start = 0
+		sources = [source for _, source in needed]
+		for batch in parquet.iter_batches(batch_size=chunk, columns=sources):
+			columns = dict((name, batch.column(sources.index(source)).to_numpy(zero_copy_only=False))
+				for name, source in needed)
+			yield start, columns
+			start += batch.num_rows
+	return header, chunks()
+
+
+class ParquetOutput(object):
+	def __init__(self, path):
+		import pyarrow
+		import pyarrow.parquet as pq
+		self.pyarrow = pyarrow
+		self.pq = pq
+		self.path = path
+		self.writer = None
+
+	def write(self, columns):
+		table = self.pyarrow.table(columns)
+		if self.writer is None:
+			self.writer = self.pq.ParquetWriter(self.path, table.schema)
+		self.writer.write_table(table)
+
+	def close(self):
+		if self.writer is not None:
+			self.writer.close()
+
+
+def run(args):
+	coeffs = {'cw': args.cw_coeffs, 'cc': args.cc_coeffs}
+	if args.flaw:
+		coeffs = {args.flaw: coeffs[args.flaw]}
+	settings = {'coeffs': coeffs, 'flaw': args.flaw, 't': args.t,
+		'D': args.D, 'coefficients': args.coefficients, 'delimiter': ',',
+		'output_format': 'parquet' if args.output.endswith('.parquet') else 'csv'}
+	if args.input.endswith('.parquet'):
+		import pyarrow.parquet as pq
+		names = pq.ParquetFile(args.input).schema_arrow.names
+		settings['needed'] = needed_columns(args, names)
+		header, chunks = parquet_chunks(args.input, args.chunk, settings['needed'])
+	else:
+		header, chunks = csv_chunks(args.input, args.chunk)
+		settings['needed'] = needed_columns(args, header)
+	settings['header'] = header
+	# Fail early on missing coefficients, before starting the pool
+	init_worker(settings)
+
+	if settings['output_format'] == 'csv':
+		out = open(args.output, 'w')
+		out.write(','.join(OUTPUT_COLUMNS[:1] + (('id',) if args.id else ()) + OUTPUT_COLUMNS[1:]) + '\n')
+	else:
+		out = ParquetOutput(args.output)
+
+	processes = args.processes or multiprocessing.cpu_count()
+	begin = time.time()
+	total = 0
+	pool = multiprocessing.Pool(processes, init_worker, (settings,)) if processes > 1 else None
+	pending = deque()
+	try:
+		for task in chunks:
+			if pool is None:
+				pending.append(assess_chunk(task))
+			else:
+				pending.append(pool.apply_async(assess_chunk, (task,)))
+			# Bounded look-ahead keeps memory independent of the file size
+			while pending and (len(pending) >= 2 * processes or pool is None):
+				item = pending.popleft()
+				n, result = item if pool is None else item.get()
+				out.write(result)
+				total += n
+		while pending:
+			n, result = pending.popleft().get()
+			out.write(result)
+			total += n
+	finally:
+		if pool is not None:
+			pool.close()
+			pool.join()
+		out.close()
+	elapsed = time.time() - begin
+	sys.stderr.write('{} records in {:.2f} s ({:.0f} records/s, {} processes)\n'.format(
+		total, elapsed, total / elapsed if elapsed > 0 else 0.0, processes))
+	return total
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(prog='python -m pyburst.assess', description=__doc__.split('\n')[1])
+	parser.add_argument('input', help='flaw list, .csv or .parquet')
+	parser.add_argument('output', help='predictions, .csv or .parquet')
+	parser.add_argument('--flaw', choices=sorted(FLAW_COLUMNS), help='flaw type of all records (default: flaw column)')
+	parser.add_argument('--t', type=float, help='wall thickness of all records (default: t column)')
+	parser.add_argument('--D', type=float, help='outer diameter of all records (default: D column)')
+	parser.add_argument('--cw-coeffs', default='CW_allTD', help='coefficient set, surrogate (.npz) or lookup table (.lut) of the CW records')
+	parser.add_argument('--cc-coeffs', default='CC_allTD', help='coefficient set, surrogate (.npz) or lookup table (.lut) of the CC records')
+	parser.add_argument('--coefficients', help='coefficient file (see equations.save_coefficients)')
+	parser.add_argument('--map', action='append', default=[], metavar='NAME=COLUMN',
+		help='read variable NAME from COLUMN')
+	parser.add_argument('--id', help='column copied to the output to identify the records')
+	parser.add_argument('--chunk', type=int, default=1 << 18, help='records per chunk')
+	parser.add_argument('--processes', type=int, help='worker processes (default: all cores)')
+	args = parser.parse_args(argv)
+	if not os.path.exists(args.input):
+		parser.error('no such file: {}'.format(args.input))
+	require_coefficients(parser, args.coefficients,
+		[args.cw_coeffs, args.cc_coeffs] if args.flaw is None else [getattr(args, args.flaw + '_coeffs')])
+	try:
+		run(args)
+	except (ValueError, KeyError) as error:
+		parser.exit(1, 'error: {}\n'.format(error.args[0] if error.args else error))
+
+
+if __name__ == '__main__':
+	main()
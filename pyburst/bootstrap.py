@@ -0,0 +1,98 @@
+"""
+Bootstrap and jackknife uncertainty of the fitted burst pressure equations
+Each resample is a weight vector over the simulation table (how often every case is
+drawn), so a chunk of resamples is one batched fit_power_law call. Chunks are spread
+over a process pool; every chunk has its own seed from a SeedSequence, so the result
+does not depend on the number of processes.
+
+BootstrapResult gives percentile intervals of the coefficients and confidence or
+prediction bands of pb at new points.
+"""
+############################################################################################################
+import multiprocessing
+
+import numpy as np
+
+from pyburst.fitting import fit_power_law, power_law
+
+
+def resample_chunk(args):
+	"""Fit n bootstrap resamples of (x, pb) starting from c0; returns coefficients and RMSE"""
+	x, pb, c0, n, seed = args
+	rng = np.random.default_rng(seed)
+	m = len(pb)
+	weights = rng.multinomial(m, np.full(m, 1.0 / m), size=n).astype(float)
+	result = fit_power_law(x, np.broadcast_to(pb, (n, m)), weights, c0=c0)
+	return result.c, result.rmse, result.converged
+
+
+class BootstrapResult(object):
+	"""Fit of the full table plus the coefficients of every resample"""
+
+	def __init__(self, fit, samples, rmse, converged):
+		self.fit = fit
+		self.c = fit.c
+		self.samples = samples
+		self.rmse = rmse
+		self.converged = converged
+
+	def interval(self, level=0.95):
+		"""Percentile interval (lower, upper) of every coefficient"""
+		tail = 50 * (1 - level)
+		samples = self.samples[self.converged]
+		return np.percentile(samples, tail, axis=0), np.percentile(samples, 100 - tail, axis=0)
+
+	def band(self, x, level=0.95, prediction=False, seed=None):
+		"""
+		Percentile band of pb at points x
+		The confidence band covers the fitted curve; the prediction band also adds the
+		residual scatter of each resample, so it covers new simulation results.
+		"""
+		pb = power_law(self.samples[self.converged], np.asarray(x, dtype=float))
+		if prediction:
+			rng = np.random.default_rng(seed)
+			pb = pb + rng.standard_normal(pb.shape) * self.rmse[self.converged][:, None]
+		tail = 50 * (1 - level)
+		return np.percentile(pb, tail, axis=0), np.percentile(pb, 100 - tail, axis=0)
+
+
+def bootstrap(x, pb, n_resamples=10000, seed=None, chunk=1000, processes=None):
+	"""
+	Case bootstrap of the power-law fit of pb(x)
+	processes=None uses all cores, 1 runs in this process.
+	"""
+	x = np.asarray(x, dtype=float)
+	pb = np.asarray(pb, dtype=float)
+	fit = fit_power_law(x, pb)
+	sizes = [min(chunk, n_resamples - start) for start in range(0, n_resamples, chunk)]
+	seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+	tasks = [(x, pb, fit.c, n, s) for n, s in zip(sizes, seeds)]
+	if processes is None:
+		processes = multiprocessing.cpu_count()
+	if processes > 1 and len(tasks) > 1:
+		pool = multiprocessing.Pool(min(processes, len(tasks)))
+		try:
+			parts = pool.map(resample_chunk, tasks)
+		finally:
+			pool.close()
+			pool.join()
+	else:
+		parts = [resample_chunk(task) for task in tasks]
+	samples = np.concatenate([part[0] for part in parts])
+	rmse = np.concatenate([part[1] for part in parts])
+	converged = np.concatenate([part[2] for part in parts])
+	return BootstrapResult(fit, samples, rmse, converged)
+
+
+def jackknife(x, pb):
+	"""Leave-one-out fits in one batch: estimates (n, p), bias-corrected coefficients and standard errors"""
+	x = np.asarray(x, dtype=float)
+	pb = np.asarray(pb, dtype=float)
+	n = len(pb)
+	fit = fit_power_law(x, pb)
+	weights = 1.0 - np.eye(n)
+	estimates = fit_power_law(x, np.broadcast_to(pb, (n, n)), weights, c0=fit.c).c
+	mean = estimates.mean(axis=0)
+	corrected = n * fit.c - (n - 1) * mean
+	se = np.sqrt((n - 1) / float(n) * ((estimates - mean) ** 2).sum(axis=0))
+	return estimates, corrected, se
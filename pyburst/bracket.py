@@ -0,0 +1,131 @@
+"""
+Adaptive pressure windows for the two load steps
+Step-1 ramps the inner pressure to pres_mag_1 in up to 10 increments, Step-2 from
+pres_mag_1 to pres_mag_2 in increments of 1 %. The window of each case is centred
+on its predicted burst pressure: an inverse-distance average of the nearest
+completed cases, or the fitted equation while there are too few of them, or the
+fixed window of the pipe configuration as a last resort.
+
+A case that bursts in Step-1 or does not burst at all is outside its window and is
+re-run with the window moved to where the burst is, until max_retries: centred on
+the interpolated Step-1 burst pressure and capped at the old pres_mag_1, or above
+pres_mag_2 when there was no burst.
+
+pipe_equation() gives the equation of a pipe from its fitted coefficient set, once
+the set has c1 (from a file of pyburst.fitting refits).
+
+The MATLAB scripts convert the burst time with one window per configuration, so
+results are reported as equivalent_time() of that fixed window.
+"""
+############################################################################################################
+import numpy as np
+
+from pyburst import equations
+
+
+def equivalent_time(pressure, window):
+	"""Burst time that gives pressure with window[0] + (window[1] - window[0]) * time"""
+	return (pressure - window[0]) / (window[1] - window[0])
+
+
+def design_scales(design, names):
+	"""Range of each parameter over a design, None when the design is empty"""
+	if not len(design):
+		return None
+	return [float(np.max(design[name]) - np.min(design[name])) for name in names]
+
+
+def pipe_equation(flaw, grade, pipe_thk, pipe_od, coefficients=None):
+	"""
+	Burst pressure (Pa) of the parameters of a case (in the order of doe.CW_PARAMS or
+	CC_PARAMS, m) from the coefficient set of its pipe and grade; pipe_od is the outer
+	radius as in the scripts, coefficients an optional file of refitted sets. None
+	while the set has no c1 or reference pressure.
+	"""
+	sets = equations.load_coefficients(coefficients) if coefficients else None
+	coeffs = equations.pipe_set(flaw, grade, pipe_thk * 1000, pipe_od * 2000, sets)
+	if coeffs is None or coeffs.pb_ref_MPa is None or np.isnan(coeffs.c[0]):
+		return None
+
+	def equation(params):
+		if flaw == 'cw':
+			length, lig_2, height = params
+			columns = (height, 2 * length, lig_2)
+		else:
+			length_1, length_2, lig_1, lig_2 = params
+			columns = (2 * length_1, 2 * length_2, lig_1, lig_2)
+		pb, flags = equations.evaluate(coeffs, [[x] for x in columns], pipe_thk, 2 * pipe_od)
+		return float(pb[0]) * coeffs.pb_ref_MPa * 1e6
+	return equation
+
+
+class PressureBracket(object):
+	"""
+	Predicts the pressure window of a case from the burst pressures of completed cases
+	Cases are points in flaw parameter space, scales normalizes each parameter (e.g.
+	its range in the design) before distances are taken. equation is an optional
+	callable from the parameters to the burst pressure in Pa.
+	"""
+
+	def __init__(self, default, scales=None, margin=0.05, neighbours=4, equation=None):
+		if not default[0] < default[1]:
+			raise ValueError('window {} must be increasing'.format(default))
+		self.default = (float(default[0]), float(default[1]))
+		self.scales = None if scales is None else np.array([s if s > 0 else 1.0 for s in scales], dtype=float)
+		self.margin = margin
+		self.neighbours = neighbours
+		self.equation = equation
+		self.points = []
+		self.pressures = []
+
+	def add(self, params, pressure):
+		self.points.append(np.asarray(params, dtype=float))
+		self.pressures.append(float(pressure))
+
+	def add_time(self, params, burst_time):
+		"""Add a case from its burst time in the default window (equivalent_time); NaN is skipped"""
+		if burst_time is not None and np.isfinite(burst_time):
+			self.add(params, self.default[0] + (self.default[1] - self.default[0]) * burst_time)
+
+	def predict(self, params):
+		"""Predicted burst pressure, None when nothing is known yet"""
+		if len(self.points) >= self.neighbours or (self.points and self.equation is None):
+			x = np.asarray(params, dtype=float)
+			d = np.array(self.points) - x
+			if self.scales is not None:
+				d /= self.scales
+			dist = np.sqrt((d * d).sum(axis=1))
+			nearest = np.argsort(dist)[:self.neighbours]
+			if dist[nearest[0]] == 0:
+				return self.pressures[nearest[0]]
+			weights = 1.0 / dist[nearest] ** 2
+			return float(np.dot(weights, np.array(self.pressures)[nearest]) / weights.sum())
+		if self.equation is not None:
+			return self.equation(params)
+		return None
+
+	def around(self, pressure, margin=None):
+		margin = self.margin if margin is None else margin
+		return (pressure * (1 - margin), pressure * (1 + margin))
+
+	def window(self, params):
+		"""(pres_mag_1, pres_mag_2) of a case"""
+		pressure = self.predict(params)
+		if pressure is None or not np.isfinite(pressure) or pressure <= 0:
+			return self.default
+		return self.around(pressure)
+
+	def retry(self, burst, window):
+		"""Window for a re-run when the burst is outside `window`, otherwise None"""
+		if burst.burst and burst.step == 'Step-2':
+			return None
+		if burst.burst:
+			# Burst during the coarse Step-1 ramp: its interpolated pressure is the new centre and
+			# pres_mag_1, which was not reached, the upper bound
+			low, high = self.around(burst.pressure(window[0], window[1]))
+			if not low < min(high, window[0]):
+				# Burst at the start of the ramp: bisect below pres_mag_1
+				return (0.5 * window[0], window[0])
+			return (low, min(high, window[0]))
+		# No burst up to pres_mag_2: the next window starts there, twice as wide
+		return (window[1], window[1] + 2 * (window[1] - window[0]))
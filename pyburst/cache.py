@@ -0,0 +1,75 @@
+"""
+Content-addressed result cache for the DOE sweeps
+Every case is keyed on the hash of its defining parameters (pipe, material, flaw
+geometry, mesh sizes and pressure magnitudes), so an interrupted sweep can be
+restarted and only the cases without a stored result are run again.
+"""
+############################################################################################################
+import os
+import json
+import hashlib
+
+# Parameters are rounded before hashing so that 0.1 + 0.2 and 0.3 give the same key
+KEY_DIGITS = 9
+
+
+def case_key(**params):
+	"""Hash of the case parameters, independent of their order"""
+	canonical = {}
+	for name, value in params.items():
+		if isinstance(value, float):
+			value = round(value, KEY_DIGITS)
+		canonical[name] = value
+	text = json.dumps(canonical, sort_keys=True, separators=(',', ':'))
+	return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def atomic_write(path, text):
+	"""Write through a temporary file so a crash never leaves a truncated file"""
+	folder = os.path.dirname(path)
+	if folder and not os.path.isdir(folder):
+		os.makedirs(folder)
+	tmp = path + '.tmp'
+	with open(tmp, 'w') as f:
+		f.write(text)
+	os.replace(tmp, path)
+
+
+class ResultCache(object):
+	"""One JSON record per case key, stored as <root>/<key[:2]>/<key>.json"""
+
+	def __init__(self, root):
+		self.root = root
+
+	def path(self, key):
+		return os.path.join(self.root, key[:2], key + '.json')
+
+	def has(self, key):
+		return os.path.exists(self.path(key))
+
+	def get(self, key, default=None):
+		try:
+			with open(self.path(key)) as f:
+				return json.load(f)
+		except (IOError, OSError, ValueError):
+			return default
+
+	def put(self, key, record):
+		atomic_write(self.path(key), json.dumps(record, sort_keys=True, indent=1))
+
+	def keys(self):
+		if not os.path.isdir(self.root):
+			return
+		for prefix in sorted(os.listdir(self.root)):
+			folder = os.path.join(self.root, prefix)
+			if not os.path.isdir(folder):
+				continue
+			for name in sorted(os.listdir(folder)):
+				if name.endswith('.json'):
+					yield name[:-5]
+
+	def __contains__(self, key):
+		return self.has(key)
+
+	def __len__(self):
+		return sum(1 for _ in self.keys())
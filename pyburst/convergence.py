@@ -0,0 +1,340 @@
+"""
+Mesh-convergence study of the reference flaw
+One flaw is solved with a series of mesh settings (mesh_fine, mesh_end1, mesh_end2,
+seed_numbers of the scripts) and every run records its element count, solve wall
+time, memory estimate (of the .dat file) and burst time. The burst time of each run is compared with the
+reference, the finest mesh unless given, and the cheapest mesh whose burst time is
+within tolerance of it is reported.
+
+The runs go through a MeshSolver:
+ - DeckSolver builds the input deck with a callable, e.g. CaeMeshBuilder (the script
+   of the flaw type in build mode, as pyburst.sweep, with the mesh in its build
+   spec), solves it with a scheduler backend and reads the burst time from the
+   output database with odb_post
+ - SyntheticSolver is a stand-in with a burst time converging as h^order, to try the
+   bookkeeping and the report without Abaqus
+burst_time is the step time in Step-2 as in the summary files; a run without a burst
+in Step-2 never meets the tolerance.
+
+    python -m pyburst.convergence run study.json --flaw cw --config sTsD --grade 65 --scale 0.5 0.75 1 1.5
+    python -m pyburst.convergence report study.json --tolerance 0.005 --cost wall_time
+"""
+############################################################################################################
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+
+from pyburst import odb_post
+from pyburst.cache import atomic_write
+from pyburst.deck import is_keyword, keyword_name
+from pyburst.scheduler import Job, Scheduler
+
+# Mesh settings of the scripts, the finest run of a study usually halves these
+DEFAULT_MESH = {'mesh_fine': 0.0002, 'mesh_end1': 0.0005, 'mesh_end2': 0.002,
+	'seed_numbers': {'radial': 3, 'near': 3, 'far': 10}}
+
+# Costs a study can minimize
+COSTS = ('elements', 'wall_time', 'memory_estimate_mb')
+
+
+def mesh_grid(base=None, **sweep):
+	"""Full factorial of the swept settings, e.g. mesh_fine=[1e-4, 2e-4], over the base settings"""
+	base = dict(DEFAULT_MESH if base is None else base)
+	names = sorted(sweep)
+	unknown = set(names) - set(base)
+	if unknown:
+		raise ValueError('unknown mesh settings {}'.format(', '.join(sorted(unknown))))
+	meshes = []
+	for values in itertools.product(*[sweep[name] for name in names]):
+		mesh = dict(base)
+		mesh.update(zip(names, values))
+		meshes.append(mesh)
+	return meshes
+
+
+def scaled_mesh(factor, base=None):
+	"""Mesh with the sizes multiplied and the seed numbers divided by factor"""
+	base = DEFAULT_MESH if base is None else base
+	mesh = dict(base)
+	for name in ('mesh_fine', 'mesh_end1', 'mesh_end2'):
+		mesh[name] = base[name] * factor
+	mesh['seed_numbers'] = dict((group, max(1, int(round(number / factor))))
+		for group, number in base['seed_numbers'].items())
+	return mesh
+
+
+def count_elements(path):
+	"""Number of elements in an input deck; continuation lines end with a comma"""
+	count = 0
+	in_elements = False
+	continued = False
+	with open(path) as f:
+		for line in f:
+			if is_keyword(line):
+				in_elements = keyword_name(line) == 'element'
+				continued = False
+				continue
+			if not in_elements or line.startswith('**') or not line.strip():
+				continue
+			if not continued:
+				count += 1
+			continued = line.rstrip().endswith(',')
+	return count
+
+
+def memory_estimate(path):
+	"""Memory estimate (MB) to minimize I/O from the memory table of an Abaqus .dat file, None if absent"""
+	if not os.path.exists(path):
+		return None
+	memory = None
+	with open(path) as f:
+		lines = iter(f)
+		for line in lines:
+			if 'MEMORY TO' not in line or 'MINIMIZE I/O' not in line:
+				continue
+			for row in lines:
+				fields = row.split()
+				if not fields:
+					continue
+				if fields[0].isdigit():
+					value = float(fields[-1])
+					memory = value if memory is None else max(memory, value)
+				elif memory is not None:
+					break
+	return memory
+
+
+class MeshSolver(object):
+	"""Runs the reference flaw with one mesh; subclass to plug in another solver"""
+
+	def run(self, name, mesh):
+		"""Dict with elements, burst_time, and optionally wall_time and memory_estimate_mb"""
+		raise NotImplementedError
+
+
+class DeckSolver(MeshSolver):
+	"""Deck written by build(name, mesh) -> input file, solved through a scheduler backend"""
+
+	def __init__(self, build, backend, max_mises, region='FLAW_REGION', cpus=16, memory_mb=None,
+		workdir='.', poll_interval=1.0):
+		self.build = build
+		self.backend = backend
+		self.max_mises = max_mises
+		self.region = region
+		self.cpus = cpus
+		self.memory_mb = memory_mb
+		self.workdir = workdir
+		self.poll_interval = poll_interval
+
+	def run(self, name, mesh):
+		input_file = self.build(name, mesh)
+		scheduler = Scheduler(self.backend, max_jobs=1, poll_interval=self.poll_interval)
+		scheduler.submit(Job(name, input_file, cpus=self.cpus, memory_mb=self.memory_mb, workdir=self.workdir))
+		result = scheduler.run()[0]
+		record = {'elements': count_elements(os.path.join(self.workdir, input_file)),
+			'wall_time': result.end - result.start,
+			'memory_estimate_mb': memory_estimate(os.path.join(self.workdir, name + '.dat')),
+			'returncode': result.returncode, 'burst_time': None}
+		if result.returncode == 0:
+			burst = odb_post.extract_burst(os.path.join(self.workdir, name + '.odb'), self.max_mises, self.region)
+			if burst.burst and burst.step == 'Step-2':
+				record['burst_time'] = burst.burst_time
+		return record
+
+
+class CaeMeshBuilder(object):
+	"""
+	build(name, mesh) of DeckSolver: the reference flaw of a sweep (pyburst.sweep, the
+	default flaw of the script unless doe_spec is given) written by its CAE script in
+	build mode with the mesh and seed_numbers of the run, as name.inp
+	"""
+
+	def __init__(self, flaw='cw', config='sTsD', grade=65, doe_spec=None, builder=None, workdir='.',
+		poll_interval=5.0):
+		from pyburst.sweep import CaeBuilder
+		self.flaw = flaw
+		self.config = config
+		self.grade = grade
+		self.doe_spec = doe_spec
+		self.builder = builder or CaeBuilder()
+		self.workdir = workdir
+		self.poll_interval = poll_interval
+
+	def sweep(self, name, mesh=None):
+		from pyburst.sweep import Sweep
+		return Sweep(self.flaw, self.config, self.grade, self.doe_spec, mesh, name=name + '_')
+
+	def __call__(self, name, mesh):
+		sweep = self.sweep(name, mesh)
+		case = sweep.reference(sweep.cases())
+		handle = self.builder.start(sweep, [case], self.workdir)
+		returncode = self.builder.poll(handle)
+		while returncode is None:
+			time.sleep(self.poll_interval)
+			returncode = self.builder.poll(handle)
+		deck = os.path.join(self.workdir, case.name + '.inp')
+		if returncode != 0 or not os.path.exists(deck):
+			raise RuntimeError('building the deck of {} failed (see {}build.log)'.format(name, sweep.job_name))
+		os.replace(deck, os.path.join(self.workdir, name + '.inp'))
+		return name + '.inp'
+
+
+class SyntheticSolver(MeshSolver):
+	"""
+	Stand-in: burst_time = exact + error * (h / h0)^order with h the mesh_fine size,
+	elements and memory growing as (h0 / h)^3
+	"""
+
+	def __init__(self, exact=0.5, error=0.02, order=2.0, elements=20000, memory_mb=500.0, h0=0.0002):
+		self.exact = exact
+		self.error = error
+		self.order = order
+		self.elements = elements
+		self.memory_mb = memory_mb
+		self.h0 = h0
+
+	def run(self, name, mesh):
+		ratio = mesh['mesh_fine'] / self.h0
+		return {'elements': int(round(self.elements / ratio ** 3)), 'memory_estimate_mb': self.memory_mb / ratio ** 3,
+			'burst_time': self.exact + self.error * ratio ** self.order}
+
+
+class ConvergenceStudy(object):
+	"""Runs the meshes through a solver and keeps one record per run, see the module docstring"""
+
+	def __init__(self, solver, meshes, name='mesh_', reference=None, path=None):
+		self.solver = solver
+		self.meshes = list(meshes)
+		self.name = name
+		self.reference = reference
+		self.path = path
+		self.records = []
+
+	def run(self):
+		"""Solve every mesh in turn; with a path the records are saved after each run"""
+		for i, mesh in enumerate(self.meshes):
+			begin = time.time()
+			record = dict(self.solver.run(self.name + str(i), mesh))
+			if record.get('wall_time') is None:
+				record['wall_time'] = time.time() - begin
+			record.setdefault('memory_estimate_mb', None)
+			record['name'] = self.name + str(i)
+			record['mesh'] = mesh
+			self.records.append(record)
+			if self.path:
+				self.save(self.path)
+		return self.records
+
+	def reference_time(self):
+		"""Given reference burst time, else that of the run with the most elements"""
+		if self.reference is not None:
+			return self.reference
+		burst = [record for record in self.records if record['burst_time'] is not None]
+		if not burst:
+			return None
+		return max(burst, key=lambda record: record['elements'])['burst_time']
+
+	def deltas(self):
+		reference = self.reference_time()
+		return [float('inf') if record['burst_time'] is None or reference is None
+			else abs(record['burst_time'] - reference) for record in self.records]
+
+	def cheapest(self, tolerance=0.01, cost='elements'):
+		"""Record of the cheapest run within tolerance of the reference burst time, None if there is none"""
+		if cost not in COSTS:
+			raise ValueError('unknown cost {!r}, expected one of {}'.format(cost, ', '.join(COSTS)))
+		candidates = [(record[cost], i) for i, (record, delta) in enumerate(zip(self.records, self.deltas()))
+			if delta <= tolerance and record[cost] is not None]
+		if not candidates:
+			return None
+		return self.records[min(candidates)[1]]
+
+	def report(self, tolerance=0.01, cost='elements'):
+		"""Text table of the runs, the cheapest run within tolerance marked with *"""
+		best = self.cheapest(tolerance, cost)
+		lines = ['{:<12} {:>10} {:>10} {:>10} {:>10} {:>10} {:>8} {:>6} {:>6} {:>6}'.format('run', 'elements',
+			'time (s)', 'mem (MB)', 'burst', 'delta', 'fine', 'radial', 'near', 'far')]
+		for record, delta in zip(self.records, self.deltas()):
+			mesh = record['mesh']
+			seeds = mesh.get('seed_numbers', {})
+			lines.append('{:<12} {:>10} {:>10.1f} {:>10} {:>10} {:>10} {:>8.2e} {:>6} {:>6} {:>6}{}'.format(
+				record['name'], record['elements'], record['wall_time'],
+				'-' if record['memory_estimate_mb'] is None else '{:.0f}'.format(record['memory_estimate_mb']),
+				'-' if record['burst_time'] is None else '{:.5f}'.format(record['burst_time']),
+				'-' if delta == float('inf') else '{:.2e}'.format(delta),
+				mesh['mesh_fine'], seeds.get('radial', '-'), seeds.get('near', '-'), seeds.get('far', '-'),
+				' *' if record is best else ''))
+		if best is None:
+			lines.append('no mesh within {} of the reference burst time'.format(tolerance))
+		else:
+			lines.append('cheapest by {} within {}: {}'.format(cost, tolerance, best['name']))
+		return '\n'.join(lines)
+
+	def save(self, path):
+		atomic_write(path, json.dumps({'reference': self.reference, 'records': self.records}, indent=1,
+			sort_keys=True))
+
+	@classmethod
+	def load(cls, path, solver=None):
+		with open(path) as f:
+			doc = json.load(f)
+		study = cls(solver, [record['mesh'] for record in doc['records']], reference=doc['reference'], path=path)
+		study.records = doc['records']
+		return study
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(prog='python -m pyburst.convergence', description=__doc__.split('\n')[1])
+	commands = parser.add_subparsers(dest='command')
+	run = commands.add_parser('run', help='solve the reference flaw with a series of meshes')
+	run.add_argument('study', help='records of the runs (.json), saved after each run')
+	run.add_argument('--flaw', choices=('cw', 'cc'), default='cw')
+	run.add_argument('--config', default='sTsD', help='pipe configuration, e.g. sTsD')
+	run.add_argument('--grade', type=int, default=65)
+	run.add_argument('--scale', type=float, nargs='+', default=[0.5, 0.75, 1.0, 1.5, 2.0],
+		help='factors on the mesh sizes of the configuration (scaled_mesh)')
+	run.add_argument('--cpus', type=int, default=16, help='CPUs of each run')
+	run.add_argument('--abaqus', default='abaqus', help='Abaqus command')
+	run.add_argument('--synthetic', action='store_true', help='SyntheticSolver instead of CAE and Abaqus')
+	report = commands.add_parser('report', help='print the runs of a study')
+	report.add_argument('study', help='records of the runs (.json)')
+	for command in (run, report):
+		command.add_argument('--tolerance', type=float, default=0.01, help='on the burst time')
+		command.add_argument('--cost', choices=COSTS, default='elements')
+		command.add_argument('--reference', type=float, help='reference burst time (default: the finest run)')
+	args = parser.parse_args(argv)
+	if args.command == 'report':
+		study = ConvergenceStudy.load(args.study)
+		if args.reference is not None:
+			study.reference = args.reference
+	elif args.command == 'run':
+		if args.synthetic:
+			solver = SyntheticSolver()
+			base = DEFAULT_MESH
+		else:
+			from pyburst.scheduler import AbaqusBackend
+			from pyburst.sweep import CaeBuilder
+			build = CaeMeshBuilder(args.flaw, args.config, args.grade, builder=CaeBuilder(args.abaqus))
+			try:
+				reference = build.sweep('mesh')
+			except ValueError as error:
+				parser.exit(1, 'error: {}\n'.format(error))
+			if reference.max_mises is None:
+				parser.exit(1, 'error: no burst criterion for X{}\n'.format(args.grade))
+			solver = DeckSolver(build, AbaqusBackend(args.abaqus), reference.max_mises, cpus=args.cpus)
+			base = reference.mesh
+		study = ConvergenceStudy(solver, [scaled_mesh(factor, base) for factor in sorted(args.scale)],
+			reference=args.reference, path=args.study)
+		study.run()
+	else:
+		parser.print_help()
+		return 1
+	print(study.report(args.tolerance, args.cost))
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
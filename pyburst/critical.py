@@ -0,0 +1,135 @@
+"""
+Critical flaw sizes: the inverse of the burst pressure equations
+For a pipe (t, D, grade) and a target pressure, the size of one flaw dimension at
+which pb reaches the limit, with the other dimensions fixed. The power laws of
+pyburst.equations are solved in closed form,
+
+    x_j = ((pb_target - 1) / (c1 * prod_{i != j} x_i^c_i)) ^ (1 / c_j)
+
+and a pyburst.surrogate model or pyburst.lookup table by bisection on all the points
+at once. Every argument broadcasts, so a whole acceptance chart (pipes x ligaments x
+loss depths) is one call:
+
+    pb = pb_target(maop=12, t=t[:, None], D=D[:, None], grade=65)
+    a, flags = critical_size('CW_allTD', 'a', pb, {'h': h[None, :], 'l': 4.0}, t[:, None], D[:, None])
+
+Dimensions are named as in pyburst.assess: h, a, l for CW, a1, a2, l1, l2 for CC.
+For a crack or loss (positive exponent with c1 < 0) the result is the largest
+acceptable size, for a ligament the smallest. pb_target >= 1 accepts no flaw (size
+0, or an infinite ligament); the flags of pyburst.equations mark the solutions
+outside the fitted ranges.
+"""
+############################################################################################################
+import numpy as np
+
+from pyburst import equations, material
+from pyburst.assess import FLAW_COLUMNS
+
+
+def intact_pressure(t, D, flow_stress):
+	"""Barlow burst pressure of the pipe without flaw, 2 t sigma_f / (D - t)"""
+	t = np.asarray(t, dtype=float)
+	return 2 * t * np.asarray(flow_stress, dtype=float) / (np.asarray(D, dtype=float) - t)
+
+
+def pb_target(maop, t=None, D=None, grade=None, uts=None, p_ref=None):
+	"""
+	Normalized burst pressure of a pressure maop: maop / p_ref, or maop over the Barlow
+	pressure with the tensile strength uts (MPa, from the grade when not given)
+	"""
+	if p_ref is None:
+		if uts is None:
+			if grade is None:
+				raise ValueError('give p_ref, the tensile strength or the grade')
+			uts = material.strengths(grade)[1] / 1e6
+		p_ref = intact_pressure(t, D, uts)
+	return np.asarray(maop, dtype=float) / p_ref
+
+
+def variable_index(flaw, variable):
+	names = FLAW_COLUMNS[flaw]
+	if variable not in names:
+		raise ValueError('unknown {} dimension {!r}, expected one of {}'.format(flaw, variable, ', '.join(names)))
+	return names.index(variable)
+
+
+def closed_form(coeffs, variable, pb, columns, t, D):
+	"""Normalized critical value x_j of a coefficient set, every argument broadcast"""
+	j = variable_index(coeffs.flaw, variable)
+	c1, exponents = coeffs.c[0], coeffs.c[1:]
+	t = np.asarray(t, dtype=float)
+	log_rest = exponents[-1] * np.log(np.asarray(D, dtype=float) / t)
+	for i, name in enumerate(FLAW_COLUMNS[coeffs.flaw]):
+		if i != j:
+			log_rest = log_rest + exponents[i] * np.log(np.asarray(columns[name], dtype=float) / t)
+	with np.errstate(divide='ignore', invalid='ignore'):
+		ratio = (np.asarray(pb, dtype=float) - 1) / c1
+		x = np.exp((np.log(ratio) - log_rest) / exponents[j])
+	# No flaw is acceptable above the intact pipe: a crack of size 0, a ligament of infinite size
+	return np.where(ratio > 0, x, 0.0 if exponents[j] * c1 < 0 else np.inf)
+
+
+def bisection(model, variable, pb, columns, t, D, bounds=None, iterations=50):
+	"""Normalized critical value of a surrogate or lookup table, by bisection in log x within bounds (default: its ranges)"""
+	j = variable_index(model.flaw, variable)
+	names = FLAW_COLUMNS[model.flaw]
+	ranges = model.ranges()
+	low, high = bounds or ranges[model.variables[j]]
+	arrays = np.broadcast_arrays(*([np.asarray(pb, dtype=float), np.asarray(t, dtype=float),
+		np.asarray(D, dtype=float)] + [np.asarray(columns[name], dtype=float) for i, name in enumerate(names)
+		if i != j]))
+	pb, t, D = arrays[:3]
+	shape = pb.shape
+	x = np.empty((pb.size, len(names) + 1))
+	k = 3
+	for i in range(len(names)):
+		if i != j:
+			x[:, i] = (arrays[k] / t).ravel()
+			k += 1
+	x[:, -1] = (D / t).ravel()
+	target = pb.ravel()
+	# pb at the two ends gives the direction: severity grows with x where pb(high) < pb(low)
+	x[:, j] = low
+	at_low = model.predict_x(x)
+	x[:, j] = high
+	at_high = model.predict_x(x)
+	growing = at_high < at_low
+	lo = np.full(target.shape, np.log(low))
+	hi = np.full(target.shape, np.log(high))
+	for _ in range(iterations):
+		mid = 0.5 * (lo + hi)
+		x[:, j] = np.exp(mid)
+		safe = model.predict_x(x) >= target
+		# Keep the safe side of the bracket on lo for sizes and on hi for ligaments
+		lo = np.where(safe == growing, mid, lo)
+		hi = np.where(safe == growing, hi, mid)
+	result = np.exp(0.5 * (lo + hi))
+	# Outside the bracket: the whole range is safe, or none of it
+	all_safe = np.minimum(at_low, at_high) >= target
+	none_safe = np.maximum(at_low, at_high) < target
+	result = np.where(all_safe, np.where(growing, np.inf, 0.0), result)
+	result = np.where(none_safe, np.where(growing, 0.0, np.inf), result)
+	return result.reshape(shape)
+
+
+def critical_size(model, variable, pb, columns, t, D, bounds=None):
+	"""
+	Critical value of one flaw dimension (in the unit of t) and the validity flags of
+	the critical flaw; columns holds the other dimensions by name
+	"""
+	if not hasattr(model, 'predict_x'):
+		model = equations.complete_set(model)
+		x = closed_form(model, variable, pb, columns, t, D)
+	else:
+		x = bisection(model, variable, pb, columns, t, D, bounds)
+	size = x * np.asarray(t, dtype=float)
+	names = FLAW_COLUMNS[model.flaw]
+	arrays = np.broadcast_arrays(*([size, np.asarray(t, dtype=float), np.asarray(D, dtype=float)] +
+		[np.asarray(columns[name], dtype=float) for name in names if name != variable]))
+	others = iter(arrays[3:])
+	flaw = [arrays[0].ravel() if name == variable else next(others).ravel() for name in names]
+	if isinstance(model, equations.CoefficientSet):
+		_, flags = equations.evaluate(model, flaw, arrays[1].ravel(), arrays[2].ravel())
+	else:
+		_, flags = model.evaluate(flaw, arrays[1].ravel(), arrays[2].ravel())
+	return arrays[0], flags.reshape(arrays[0].shape)
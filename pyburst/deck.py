@@ -0,0 +1,194 @@
+"""
+Parametric Abaqus input decks for the DOE sweeps
+One reference case per pipe configuration is built and meshed in CAE and written
+with writeInput(). The other cases are written from that deck by morphing the node
+coordinates of the flaw partition so that the crack and wall loss faces move to
+the new sizes, and by replacing the pressure magnitudes of the two steps.
+The mesh topology, sets and surfaces of the reference deck are kept as they are.
+
+The morph works in the pipe coordinates of the scripts: radius r from the pipe
+axis, angle theta from the y axis (the flaws sit on the x = 0 symmetry plane) and
+axial distance s = pipe_len - z from the z = pipe_len symmetry plane.
+ - Through the wall the flaw is a stack of bands from the inner surface, e.g.
+   ligament 1, crack (2 * length), ligament 2, loss height for the CW geometry.
+   The radial position is mapped piecewise-linearly from the reference bands to
+   the new ones, so inner and outer surfaces and every band edge are kept.
+ - Along the axis the crack bands are scaled by new/reference length so the penny
+   crack stays circular, loss bands are not scaled (loss_width is fixed) and the
+   ligaments blend linearly between their neighbours.
+ - The map is exact inside lock_radius of the flaw and fades to the identity at
+   the partition boundary (s = crack_par, theta = theta_par), so nodes shared with
+   the rest of the pipe do not move.
+The loss face is revolved about the radial line, so its hoop extent moves slightly
+with the radius; the error is below (change of height) * theta_lock.
+"""
+############################################################################################################
+import numpy as np
+
+# Band kinds through the wall thickness
+LIGAMENT = 'lig'
+CRACK = 'crack'
+LOSS = 'loss'
+
+
+def is_keyword(line):
+	return line.startswith('*') and not line.startswith('**')
+
+
+def keyword_name(line):
+	return line[1:].split(',')[0].strip().lower()
+
+
+class DeckTemplate(object):
+	"""Reference input deck with the node coordinates and pressure loads located"""
+
+	def __init__(self, lines):
+		self.lines = lines
+		self.node_lines = []  # line numbers of the node data lines
+		self.dsload_lines = []  # line numbers of the pressure data lines, in step order
+		node_ids, coords = [], []
+		keyword = None
+		for number, line in enumerate(lines):
+			if is_keyword(line):
+				keyword = keyword_name(line)
+				continue
+			if line.startswith('**') or not line.strip():
+				continue
+			if keyword == 'node':
+				fields = line.split(',')
+				node_ids.append(int(fields[0]))
+				coords.append([float(v) for v in fields[1:4]])
+				self.node_lines.append(number)
+			elif keyword == 'dsload':
+				self.dsload_lines.append(number)
+		self.node_ids = np.array(node_ids, dtype=np.int64)
+		self.nodes = np.array(coords, dtype=float).reshape(-1, 3)
+
+	def render(self, nodes=None, pressures=None, comment=None):
+		"""Deck text with new node coordinates and step pressure magnitudes"""
+		lines = list(self.lines)
+		if nodes is not None:
+			nodes = np.asarray(nodes, dtype=float)
+			if nodes.shape != self.nodes.shape:
+				raise ValueError('expected {} nodes, got {}'.format(len(self.nodes), len(nodes)))
+			# Only the nodes of the flaw partition move, the other lines are kept verbatim
+			for i in np.flatnonzero(np.any(nodes != self.nodes, axis=1)):
+				x, y, z = nodes[i]
+				lines[self.node_lines[i]] = '{:7d}, {:.10g}, {:.10g}, {:.10g}\n'.format(self.node_ids[i], x, y, z)
+		if pressures is not None:
+			if len(pressures) != len(self.dsload_lines):
+				raise ValueError('expected {} pressure magnitudes, got {}'.format(
+					len(self.dsload_lines), len(pressures)))
+			for number, magnitude in zip(self.dsload_lines, pressures):
+				fields = lines[number].rstrip('\n').split(',')
+				fields[2] = ' {:.10g}'.format(magnitude)
+				lines[number] = ','.join(fields) + '\n'
+		if comment:
+			lines.insert(0, '** ' + comment + '\n')
+		return ''.join(lines)
+
+	def write(self, path, nodes=None, pressures=None, comment=None):
+		with open(path, 'w') as f:
+			f.write(self.render(nodes, pressures, comment))
+
+
+def read_deck(path):
+	with open(path) as f:
+		return DeckTemplate(f.readlines())
+
+
+class FlawMorph(object):
+	"""
+	Maps the nodes of a reference flaw to another flaw of the same band layout
+	kinds and ref_sizes list the bands from the inner surface; the sizes must add up
+	to pipe_thk. theta_par and crack_par are the partition of the flaw region.
+	"""
+
+	def __init__(self, kinds, ref_sizes, pipe_id, pipe_thk, pipe_len, crack_par, theta_par,
+		lock_radius=None):
+		self.kinds = list(kinds)
+		self.ref_edges = self.edges(ref_sizes, pipe_thk)
+		self.pipe_id = pipe_id
+		self.pipe_thk = pipe_thk
+		self.pipe_len = pipe_len
+		self.crack_par = crack_par
+		self.theta_par = theta_par
+		cracks = [size / 2 for kind, size in zip(self.kinds, ref_sizes) if kind == CRACK]
+		# Axial scaling is applied up to twice the largest crack, then fades out
+		self.scale_len = 2 * max(cracks) if cracks else 0.0
+		self.lock_radius = max(lock_radius or 0.0, self.scale_len)
+		if self.lock_radius >= crack_par or self.lock_radius / pipe_id >= theta_par:
+			raise ValueError('flaw of radius {} does not fit in the partition'.format(self.lock_radius))
+
+	def edges(self, sizes, pipe_thk):
+		if len(sizes) != len(self.kinds):
+			raise ValueError('expected {} band sizes, got {}'.format(len(self.kinds), len(sizes)))
+		sizes = np.asarray(sizes, dtype=float)
+		if np.any(sizes < 0) or abs(sizes.sum() - pipe_thk) > 1e-9:
+			raise ValueError('band sizes {} do not fill the wall thickness {}'.format(list(sizes), pipe_thk))
+		return np.concatenate(([0.0], np.cumsum(sizes)))
+
+	def axial_scale(self, new_edges):
+		"""Axial scale at every band edge: crack bands new/ref, loss bands 1, ligaments blend"""
+		ref_sizes = np.diff(self.ref_edges)
+		new_sizes = np.diff(new_edges)
+		band_scale = [None] * len(self.kinds)
+		for i, kind in enumerate(self.kinds):
+			if kind == CRACK:
+				band_scale[i] = new_sizes[i] / ref_sizes[i]
+			elif kind == LOSS:
+				band_scale[i] = 1.0
+		known = [i for i, k in enumerate(band_scale) if k is not None]
+		if not known:
+			return np.ones(len(new_edges))
+		scale = np.empty(len(new_edges))
+		for j in range(len(new_edges)):
+			# Edge j sits between band j - 1 and band j, take the nearest fixed band
+			left = [i for i in known if i <= j - 1]
+			right = [i for i in known if i >= j]
+			if left and left[-1] == j - 1:
+				scale[j] = band_scale[j - 1]
+			elif right and right[0] == j:
+				scale[j] = band_scale[j]
+			else:
+				scale[j] = band_scale[left[-1]] if left else band_scale[right[0]]
+		return scale
+
+	def apply(self, nodes, sizes):
+		"""Node coordinates (n, 3) for the flaw with band sizes `sizes`"""
+		nodes = np.asarray(nodes, dtype=float)
+		new_edges = self.edges(sizes, self.pipe_thk)
+		x, y, z = nodes[:, 0], nodes[:, 1], nodes[:, 2]
+		theta = np.arctan2(x, y)
+		s = self.pipe_len - z
+		# Nodes outside the flaw partition are returned untouched
+		inside = (theta < self.theta_par) & (s < self.crack_par)
+		theta, s = theta[inside], s[inside]
+		rho = np.hypot(x[inside], y[inside]) - self.pipe_id
+
+		# Blending weights: 1 around the flaw, 0 on the partition boundary
+		hoop = np.clip((self.theta_par - theta) / (self.theta_par - self.lock_radius / self.pipe_id), 0.0, 1.0)
+		axial = np.clip((self.crack_par - s) / (self.crack_par - self.lock_radius), 0.0, 1.0)
+
+		# Through the wall
+		rho_new = np.interp(rho, self.ref_edges, new_edges)
+		rho_new = rho + hoop * axial * (rho_new - rho)
+
+		# Along the axis: s * k up to scale_len, then linear back to the identity at crack_par
+		k = np.interp(rho, self.ref_edges, self.axial_scale(new_edges))
+		if self.scale_len > 0:
+			if np.any(k * self.scale_len >= self.crack_par):
+				raise ValueError('scaled flaw does not fit in the partition')
+			s_far = k * self.scale_len + (s - self.scale_len) * \
+				(self.crack_par - k * self.scale_len) / (self.crack_par - self.scale_len)
+			s_new = np.where(s <= self.scale_len, k * s, s_far)
+		else:
+			s_new = s
+		s_new = s + hoop * (s_new - s)
+
+		r_new = self.pipe_id + rho_new
+		out = nodes.copy()
+		out[inside, 0] = r_new * np.sin(theta)
+		out[inside, 1] = r_new * np.cos(theta)
+		out[inside, 2] = self.pipe_len - s_new
+		return out
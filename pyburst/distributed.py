@@ -0,0 +1,462 @@
+"""
+Sweeps spread over several solver hosts through a queue broker
+The coordinator runs the sweeps of a spec as pyburst.sweep does (build in CAE,
+adaptive windows, retries, cache, store and summaries) but hands the decks to a
+broker instead of a local scheduler. Workers on the solver hosts claim cases that fit
+their free CPUs and memory, run them with their own scheduler and burst monitor, and
+send back the compact result: return code, times, solver counts and the burst time.
+The output database and its compact file stay on the worker.
+
+    python -m pyburst.distributed coordinator specs/overnight.toml --broker /shared/burst.db --licence-tokens 80
+    abaqus python pyburst/distributed.py worker --broker /shared/burst.db --total-cpus 64 --max-jobs 4
+
+Broker is a SQLite file on a file system all hosts can lock (not all network file
+systems can); another queue with the same methods can replace it.
+
+ - Licence tokens: every case holds abaqus_tokens(cpus) tokens while it runs, and no
+   case is handed out beyond the licence_tokens budget of the coordinator.
+ - Heartbeats: a thread of every worker bumps its beat counter. The coordinator
+   counts a worker as lost when its counter has not moved for heartbeat_timeout
+   seconds of its own clock, so the host clocks need not agree.
+ - Worker loss: the cases of a lost worker go back to the queue, and fail after
+   max_attempts. A worker that comes back kills its copies of them.
+"""
+############################################################################################################
+import os
+import sys
+import json
+import time
+import zlib
+import socket
+import sqlite3
+import argparse
+import threading
+from collections import deque
+
+if __name__ == '__main__' and __package__ is None:
+	# Run as a file by abaqus python: make the package importable
+	sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyburst import odb_post
+from pyburst.instrument import count_increments, solver_times
+from pyburst.monitor import BurstMonitor, OdbProbe
+from pyburst.postjob import Cleanup
+from pyburst.scheduler import Job, JobResult, Scheduler, AbaqusBackend, abaqus_tokens
+from pyburst.store import ResultStore
+from pyburst.sweep import FOLDER, SweepState, SweepRunner, SweepMonitor, CaeBuilder, DeckBuilder, load_specs
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cases (name TEXT PRIMARY KEY, state TEXT, worker TEXT, cpus INTEGER, memory_mb INTEGER,
+	tokens INTEGER, attempts INTEGER, payload TEXT, deck BLOB, result TEXT);
+CREATE TABLE IF NOT EXISTS workers (name TEXT PRIMARY KEY, beats INTEGER, state TEXT);
+CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT);
+'''
+
+# Meta entries of a job that travel to the worker
+PAYLOAD_META = ('sweep', 'case', 'key', 'window', 'retries', 'max_mises', 'stop_at_burst', 'compact_output',
+	'keep_odb')
+
+
+class Broker(object):
+	"""SQLite stand-in of the queue, one connection per process or thread"""
+
+	def __init__(self, path, timeout=60.0):
+		self.path = path
+		self.db = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+		self.db.executescript(SCHEMA)
+		self.seen = {}  # worker -> (beats, local time the count last moved), on the coordinator
+
+	def transaction(self):
+		"""Write lock for a read-modify-write, released by commit or rollback"""
+		self.db.execute('BEGIN IMMEDIATE')
+
+	def setting(self, name, default=None):
+		row = self.db.execute('SELECT value FROM settings WHERE name = ?', (name,)).fetchone()
+		return default if row is None else json.loads(row[0])
+
+	def configure(self, **settings):
+		for name, value in settings.items():
+			self.db.execute('INSERT OR REPLACE INTO settings VALUES (?, ?)', (name, json.dumps(value)))
+
+	def reset(self, licence_tokens=None):
+		"""Start a run: forget the cases of earlier runs"""
+		self.db.execute('DELETE FROM cases')
+		self.configure(closed=False, licence_tokens=licence_tokens)
+
+	def close(self):
+		"""End of the run: idle workers exit"""
+		self.configure(closed=True)
+
+	def closed(self):
+		return self.setting('closed', False)
+
+	def publish(self, job, deck, payload):
+		tokens = abaqus_tokens(job.cpus)
+		budget = self.setting('licence_tokens')
+		if budget is not None and tokens > budget:
+			raise ValueError('{} needs {} licence tokens, more than the budget of {}'.format(job.name, tokens, budget))
+		self.db.execute("INSERT OR REPLACE INTO cases VALUES (?, 'queued', NULL, ?, ?, ?, 0, ?, ?, NULL)",
+			(job.name, job.cpus, job.memory_mb or 0, tokens, json.dumps(payload), zlib.compress(deck)))
+
+	def queued(self):
+		return self.db.execute("SELECT COUNT(*) FROM cases WHERE state = 'queued'").fetchone()[0]
+
+	def claim(self, worker, cpus=None, memory_mb=None):
+		"""Oldest queued case within cpus, memory_mb and the free licence tokens: (name, payload, deck) or None"""
+		self.transaction()
+		try:
+			budget = self.setting('licence_tokens')
+			used = self.db.execute("SELECT COALESCE(SUM(tokens), 0) FROM cases WHERE state = 'running'").fetchone()[0]
+			row = self.db.execute("SELECT name, payload, deck FROM cases WHERE state = 'queued' AND "
+				"(? IS NULL OR cpus <= ?) AND (? IS NULL OR memory_mb <= ?) AND (? IS NULL OR tokens <= ?) "
+				"ORDER BY rowid LIMIT 1", (cpus, cpus, memory_mb, memory_mb, budget,
+				None if budget is None else budget - used)).fetchone()
+			if row is not None:
+				self.db.execute("UPDATE cases SET state = 'running', worker = ?, attempts = attempts + 1 WHERE name = ?",
+					(worker, row[0]))
+			self.db.execute('COMMIT')
+		except Exception:
+			self.db.execute('ROLLBACK')
+			raise
+		if row is None:
+			return None
+		return row[0], json.loads(row[1]), zlib.decompress(row[2])
+
+	def heartbeat(self, worker, names):
+		"""Bump the beat of a worker; returns the names it runs that are no longer its cases"""
+		self.db.execute("INSERT OR IGNORE INTO workers VALUES (?, 0, 'active')", (worker,))
+		self.db.execute("UPDATE workers SET beats = beats + 1, state = 'active' WHERE name = ?", (worker,))
+		owned = set(row[0] for row in self.db.execute("SELECT name FROM cases WHERE state = 'running' AND worker = ?",
+			(worker,)))
+		return [name for name in names if name not in owned]
+
+	def complete(self, name, worker, result):
+		"""Result of a case; False when the case was taken away from the worker"""
+		cursor = self.db.execute("UPDATE cases SET state = 'done', result = ? WHERE name = ? AND worker = ? AND "
+			"state = 'running'", (json.dumps(result), name, worker))
+		return cursor.rowcount == 1
+
+	def leave(self, worker):
+		"""A worker shutting down: its running cases go back to the queue"""
+		self.db.execute("UPDATE cases SET state = 'queued', worker = NULL WHERE state = 'running' AND worker = ?",
+			(worker,))
+		self.db.execute("UPDATE workers SET state = 'left' WHERE name = ?", (worker,))
+
+	def requeue_lost(self, timeout, max_attempts):
+		"""Requeue, or fail after max_attempts, the cases of workers silent for timeout; returns (case, worker, requeued)"""
+		now = time.time()
+		lost = []
+		for worker, beats, state in self.db.execute('SELECT name, beats, state FROM workers').fetchall():
+			if worker not in self.seen or self.seen[worker][0] != beats:
+				self.seen[worker] = (beats, now)
+			elif state == 'active' and now - self.seen[worker][1] > timeout:
+				lost.append(worker)
+		moved = []
+		for worker in lost:
+			self.transaction()
+			try:
+				self.db.execute("UPDATE workers SET state = 'lost' WHERE name = ?", (worker,))
+				for name, attempts in self.db.execute("SELECT name, attempts FROM cases WHERE state = 'running' AND "
+					"worker = ?", (worker,)).fetchall():
+					if attempts < max_attempts:
+						self.db.execute("UPDATE cases SET state = 'queued', worker = NULL WHERE name = ?", (name,))
+					else:
+						self.db.execute("UPDATE cases SET state = 'failed', result = ? WHERE name = ?",
+							(json.dumps({'returncode': None, 'error': 'lost with worker ' + worker}), name))
+					moved.append((name, worker, attempts < max_attempts))
+				self.db.execute('COMMIT')
+			except Exception:
+				self.db.execute('ROLLBACK')
+				raise
+		return moved
+
+	def collect(self):
+		"""(name, result) of the cases done or failed since the last call"""
+		self.transaction()
+		try:
+			rows = self.db.execute("SELECT name, result FROM cases WHERE state IN ('done', 'failed')").fetchall()
+			self.db.execute("UPDATE cases SET state = 'collected' WHERE state IN ('done', 'failed')")
+			self.db.execute('COMMIT')
+		except Exception:
+			self.db.execute('ROLLBACK')
+			raise
+		return [(name, json.loads(result)) for name, result in rows]
+
+
+class BrokerScheduler(object):
+	"""
+	Scheduler of the coordinator: submitted jobs are published while fewer than
+	lookahead cases wait in the broker, so late cases still get windows from the
+	latest results; the results of the workers come back through on_finish
+	"""
+
+	def __init__(self, broker, on_finish, lookahead=4, heartbeat_timeout=300.0, max_attempts=3):
+		self.broker = broker
+		self.on_finish = on_finish
+		self.lookahead = lookahead
+		self.heartbeat_timeout = heartbeat_timeout
+		self.max_attempts = max_attempts
+		self.queue = deque()
+		self.published = {}  # job name -> Job
+		self.results = []
+
+	def submit(self, job):
+		self.queue.append(job)
+
+	def publish(self, job):
+		with open(os.path.join(job.workdir, job.input_file), 'rb') as f:
+			deck = f.read()
+		payload = {'cpus': job.cpus, 'memory_mb': job.memory_mb,
+			'meta': dict((name, job.meta[name]) for name in PAYLOAD_META if name in job.meta)}
+		self.broker.publish(job, deck, payload)
+		self.published[job.name] = job
+
+	def step(self):
+		for name, worker, requeued in self.broker.requeue_lost(self.heartbeat_timeout, self.max_attempts):
+			sys.stderr.write('{}: worker {} lost, {}\n'.format(name, worker, 'requeued' if requeued else 'failed'))
+		for name, result in self.broker.collect():
+			job = self.published.pop(name, None)
+			if job is None:
+				continue
+			if result.get('burst') is not None:
+				job.meta['burst'] = odb_post.BurstResult(**result['burst'])
+			job.meta['solver'] = {'cpu': result.get('cpu'), 'increments': result.get('increments'),
+				'worker': result.get('worker')}
+			end = result.get('end') or time.time()
+			result = JobResult(job, result['returncode'], result.get('start') or end, end)
+			self.results.append(result)
+			self.on_finish(result)
+		while self.queue and self.broker.queued() < self.lookahead:
+			self.publish(self.queue.popleft())
+		return bool(self.queue or self.published)
+
+
+class RemoteCleanup(object):
+	"""The files of a job are cleaned up on its worker"""
+
+	def submit(self, name, workdir='.'):
+		pass
+
+	def close(self):
+		return []
+
+
+class Coordinator(SweepRunner):
+	"""SweepRunner whose cases are solved by the workers of a broker"""
+
+	def __init__(self, sweeps, broker, builder=None, licence_tokens=None, lookahead=4, heartbeat_timeout=300.0,
+		max_attempts=3, poll_interval=5.0, workdir='.'):
+		self.store = ResultStore(os.path.join(workdir, FOLDER, 'results'))
+		self.states = dict((sweep.job_name, SweepState(sweep, self.store, workdir)) for sweep in sweeps)
+		self.order = [sweep.job_name for sweep in sweeps]
+		self.builder = builder or CaeBuilder()
+		self.workdir = workdir
+		self.poll_interval = poll_interval
+		self.broker = broker if isinstance(broker, Broker) else Broker(broker)
+		self.broker.reset(licence_tokens)
+		self.scheduler = BrokerScheduler(self.broker, self.finish, lookahead, heartbeat_timeout, max_attempts)
+		self.cleanups = dict((name, RemoteCleanup()) for name in self.states)
+		self.turn = 0
+		self.failed = []
+
+	def submit(self, state, case):
+		SweepRunner.submit(self, state, case)
+		sweep = state.sweep
+		self.scheduler.queue[-1].meta.update(max_mises=sweep.max_mises, stop_at_burst=sweep.options['stop_at_burst'],
+			compact_output=sweep.options['compact_output'], keep_odb=sweep.options['keep_odb'])
+
+	def run(self):
+		try:
+			return SweepRunner.run(self)
+		finally:
+			self.broker.close()
+
+
+class Heartbeat(object):
+	"""Thread of a worker that beats every interval and notes the cases taken away from it"""
+
+	def __init__(self, path, worker, interval):
+		self.path = path
+		self.worker = worker
+		self.interval = interval
+		self.names = set()
+		self.cancelled = set()
+		self.lock = threading.Lock()
+		self.stopped = threading.Event()
+		self.thread = threading.Thread(target=self.run)
+		self.thread.daemon = True
+
+	def start(self):
+		Broker(self.path).heartbeat(self.worker, [])
+		self.thread.start()
+
+	def run(self):
+		broker = Broker(self.path)
+		while not self.stopped.wait(self.interval):
+			with self.lock:
+				names = list(self.names)
+			cancelled = broker.heartbeat(self.worker, names)
+			with self.lock:
+				self.cancelled.update(cancelled)
+
+	def stop(self):
+		self.stopped.set()
+		self.thread.join()
+
+
+class Worker(object):
+	"""Claims cases from a broker and runs them within the budget of its host"""
+
+	def __init__(self, broker_path, name=None, backend=None, max_jobs=4, total_cpus=64, total_memory=250000,
+		poll_interval=1.0, heartbeat_interval=10.0, probe=None, workdir='.', compact_executable=('abaqus', 'python')):
+		self.name = name or '{}:{}'.format(socket.gethostname(), os.getpid())
+		self.broker = Broker(broker_path)
+		self.heartbeat = Heartbeat(broker_path, self.name, heartbeat_interval)
+		self.max_jobs = max_jobs
+		self.total_cpus = total_cpus
+		self.total_memory = total_memory
+		self.poll_interval = poll_interval
+		self.probe = probe
+		self.workdir = workdir
+		self.monitors = {}
+		self.scheduler = Scheduler(backend or AbaqusBackend(), max_jobs=max_jobs, total_cpus=total_cpus,
+			total_memory_mb=total_memory, poll_interval=poll_interval, on_finish=self.finish,
+			monitor=SweepMonitor(self.monitors))
+		self.cleanups = {}
+		self.compact_executable = compact_executable
+		self.done = 0
+
+	def cleanup(self, meta):
+		options = (meta.get('compact_output', True), meta.get('keep_odb', False))
+		if options not in self.cleanups:
+			self.cleanups[options] = Cleanup(os.path.join(self.workdir, FOLDER), compact_output=options[0],
+				keep_odb=options[1], executable=self.compact_executable)
+		return self.cleanups[options]
+
+	def claim(self):
+		"""Claim cases while the scheduler has room for them"""
+		while len(self.scheduler.running) + len(self.scheduler.queue) < self.max_jobs:
+			idle = not self.scheduler.running and not self.scheduler.queue
+			# An idle host takes any case, as the scheduler runs a job larger than the budget alone
+			cpus = None if idle else self.total_cpus - self.scheduler.cpus_in_use()
+			memory = None if idle or self.total_memory is None else self.total_memory - self.scheduler.memory_in_use()
+			claimed = self.broker.claim(self.name, cpus, memory)
+			if claimed is None:
+				return
+			name, payload, deck = claimed
+			with open(os.path.join(self.workdir, name + '.inp'), 'wb') as f:
+				f.write(deck)
+			meta = payload['meta']
+			if meta.get('stop_at_burst') and meta.get('max_mises') is not None and meta['sweep'] not in self.monitors:
+				self.monitors[meta['sweep']] = BurstMonitor(self.probe or OdbProbe(), meta['max_mises'])
+			with self.heartbeat.lock:
+				self.heartbeat.names.add(name)
+			self.scheduler.submit(Job(name, name + '.inp', cpus=payload['cpus'], memory_mb=payload['memory_mb'],
+				workdir=self.workdir, meta=meta))
+			self.scheduler.step()
+
+	def finish(self, result):
+		"""Send the compact result of a finished job to the broker"""
+		job = result.job
+		with self.heartbeat.lock:
+			self.heartbeat.names.discard(job.name)
+			cancelled = job.name in self.heartbeat.cancelled
+			self.heartbeat.cancelled.discard(job.name)
+		if cancelled:
+			return
+		returncode = result.returncode
+		burst = job.meta.get('burst')
+		error = None
+		if returncode == 0 and burst is None and job.meta.get('max_mises') is not None:
+			try:
+				burst = odb_post.extract_burst(os.path.join(self.workdir, job.name + '.odb'), job.meta['max_mises'])
+			except Exception as exc:
+				returncode, error = -1, 'burst extraction failed: {}'.format(exc)
+		record = {'returncode': returncode, 'start': result.start, 'end': result.end, 'worker': self.name,
+			'cpu': solver_times(os.path.join(self.workdir, job.name + '.msg')).get('cpu'),
+			'increments': count_increments(os.path.join(self.workdir, job.name + '.sta')),
+			'burst': None if burst is None else burst.as_dict(), 'error': error}
+		if not self.broker.complete(job.name, self.name, record):
+			sys.stderr.write('{}: result dropped, the case was handed to another worker\n'.format(job.name))
+		self.done += 1
+		self.cleanup(job.meta).submit(job.name, self.workdir)
+
+	def kill_cancelled(self):
+		"""Kill the running copies of cases the coordinator gave to another worker"""
+		with self.heartbeat.lock:
+			cancelled = set(self.heartbeat.cancelled)
+			self.heartbeat.cancelled.clear()
+		for name in cancelled:
+			if name in self.scheduler.running:
+				job, handle, start = self.scheduler.running.pop(name)
+				self.scheduler.backend.kill(handle)
+				self.scheduler.monitor.forget(job)
+				sys.stderr.write('{}: stopped, the case was handed to another worker\n'.format(name))
+			with self.heartbeat.lock:
+				self.heartbeat.names.discard(name)
+
+	def run(self, idle_exit=False):
+		"""Run cases until the coordinator closes the run (or, with idle_exit, the queue is empty); returns the jobs run"""
+		self.heartbeat.start()
+		try:
+			while True:
+				self.kill_cancelled()
+				self.scheduler.step()
+				self.claim()
+				if not self.scheduler.running and not self.scheduler.queue and \
+					(self.broker.closed() or (idle_exit and not self.broker.queued())):
+					break
+				time.sleep(self.poll_interval)
+		finally:
+			self.scheduler.cancel()
+			self.heartbeat.stop()
+			self.broker.leave(self.name)
+			for cleanup in self.cleanups.values():
+				for job, error in cleanup.close():
+					sys.stderr.write('cleanup of {} failed: {}\n'.format(job, error))
+		return self.done
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(prog='distributed.py', description=__doc__.split('\n')[1])
+	commands = parser.add_subparsers(dest='command')
+	command = commands.add_parser('coordinator', help='run the sweeps of the specs on the workers of a broker')
+	command.add_argument('specs', nargs='+', help='spec files (.toml or .json)')
+	command.add_argument('--broker', required=True, help='broker file, on a file system shared with the workers')
+	command.add_argument('--licence-tokens', type=int, help='Abaqus tokens shared by all the workers')
+	command.add_argument('--lookahead', type=int, default=4, help='cases waiting in the broker')
+	command.add_argument('--heartbeat-timeout', type=float, default=300.0, help='seconds before a silent worker is lost')
+	command.add_argument('--max-attempts', type=int, default=3, help='runs of a case on lost workers before it fails')
+	command.add_argument('--abaqus', default='abaqus', help='Abaqus command')
+	command.add_argument('--reference', help='reference deck to copy instead of building the decks in CAE')
+	command = commands.add_parser('worker', help='run the cases of a broker on this host')
+	command.add_argument('--broker', required=True, help='broker file of the coordinator')
+	command.add_argument('--name', help='worker name (default host:pid)')
+	command.add_argument('--max-jobs', type=int, default=4, help='jobs in flight')
+	command.add_argument('--total-cpus', type=int, default=64, help='CPUs of the host')
+	command.add_argument('--total-memory', type=int, default=250000, help='memory of the host (MB)')
+	command.add_argument('--heartbeat-interval', type=float, default=10.0)
+	command.add_argument('--abaqus', default='abaqus', help='Abaqus command')
+	command.add_argument('--workdir', default='.')
+	args = parser.parse_args(argv)
+	if args.command == 'coordinator':
+		try:
+			sweeps, _ = load_specs(args.specs)
+		except (ValueError, KeyError) as error:
+			parser.exit(1, 'error: {}\n'.format(error.args[0] if error.args else error))
+		builder = DeckBuilder(args.reference) if args.reference else CaeBuilder(args.abaqus)
+		coordinator = Coordinator(sweeps, args.broker, builder, args.licence_tokens, args.lookahead,
+			args.heartbeat_timeout, args.max_attempts)
+		return 1 if coordinator.run() else 0
+	if args.command == 'worker':
+		worker = Worker(args.broker, args.name, AbaqusBackend(args.abaqus), args.max_jobs, args.total_cpus,
+			args.total_memory, heartbeat_interval=args.heartbeat_interval, workdir=args.workdir,
+			compact_executable=(args.abaqus, 'python'))
+		print('{}: {} jobs run'.format(worker.name, worker.run()))
+		return 0
+	parser.print_help()
+	return 1
+
+
+if __name__ == '__main__':
+	sys.exit(main())
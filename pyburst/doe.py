@@ -0,0 +1,183 @@
+"""
+Design of experiments for the flaw geometry sweeps
+Designs are NumPy structured arrays with an 'index' field and one float field per
+flaw parameter (in m, as in the Abaqus scripts). Infeasible geometries are removed
+in a vectorized pass before any job is created.
+
+Full-factorial designs keep the case numbering of the scripts: the first parameter
+varies fastest, so index 7 of a 3 x 3 x 3 design is (lengths[1], lig_2s[2], heights[0]).
+"""
+############################################################################################################
+import numpy as np
+
+# Free parameters of each flaw geometry, in the order of the scripts
+CW_PARAMS = ('length', 'lig_2', 'height')
+CC_PARAMS = ('length_1', 'length_2', 'lig_1', 'lig_2')
+
+# Columns of flaw_detail in the summary files (mm, crack lengths are full lengths)
+CW_COLUMNS = ('index', 'height', 'length', 'lig_2', 'lig_1')
+CC_COLUMNS = ('index', 'length_1', 'length_2', 'lig_1', 'lig_2', 'lig_3')
+
+# Tolerance on the max_length check, so that 2 * 0.002 + 0.005 + 0.005 still fits 0.014
+LENGTH_TOL = 1e-9
+
+
+def design_dtype(names):
+	return np.dtype([('index', np.int64)] + [(str(name), np.float64) for name in names])
+
+
+def as_pairs(spec):
+	"""Accept a dict or a list of (name, ...) tuples, keeping the order"""
+	if hasattr(spec, 'items'):
+		return [(name,) + tuple(value if isinstance(value, tuple) else (value,)) for name, value in spec.items()]
+	return [tuple(item) for item in spec]
+
+
+def full_factorial(levels):
+	"""All combinations of levels, given as [(name, values), ...]; first name varies fastest"""
+	pairs = [(name, np.asarray(values, dtype=float)) for name, values in as_pairs(levels)]
+	names = [name for name, _ in pairs]
+	grids = np.meshgrid(*[values for _, values in pairs], indexing='ij')
+	design = np.empty(grids[0].size if grids else 0, dtype=design_dtype(names))
+	design['index'] = np.arange(len(design))
+	for name, grid in zip(names, grids):
+		# Fortran order makes the first parameter the fastest one
+		design[name] = grid.ravel(order='F')
+	return design
+
+
+def scale_unit(unit, bounds):
+	"""Structured design from points in the unit cube and [(name, low, high), ...]"""
+	bounds = as_pairs(bounds)
+	design = np.empty(len(unit), dtype=design_dtype([b[0] for b in bounds]))
+	design['index'] = np.arange(len(unit))
+	for j, (name, low, high) in enumerate(bounds):
+		design[name] = low + (high - low) * unit[:, j]
+	return design
+
+
+def latin_hypercube(bounds, n, seed=None):
+	"""Latin hypercube of n points: one point in each of the n strata of every parameter"""
+	rng = np.random.default_rng(seed)
+	dim = len(as_pairs(bounds))
+	strata = rng.permuted(np.tile(np.arange(n), (dim, 1)), axis=1).T
+	unit = (strata + rng.random((n, dim))) / n
+	return scale_unit(unit, bounds)
+
+
+# Primitive polynomials and initial direction numbers (Joe and Kuo, new-joe-kuo-6.21201)
+# for dimensions 2 to 10; dimension 1 is the van der Corput sequence
+SOBOL_DIRECTIONS = (
+	(1, 0, (1,)),
+	(2, 1, (1, 3)),
+	(3, 1, (1, 3, 1)),
+	(3, 2, (1, 1, 1)),
+	(4, 1, (1, 1, 3, 3)),
+	(4, 4, (1, 3, 5, 13)),
+	(5, 2, (1, 1, 5, 5, 17)),
+	(5, 4, (1, 1, 5, 5, 5)),
+	(5, 7, (1, 1, 7, 11, 19)),
+)
+SOBOL_BITS = 32
+
+
+def sobol_directions(dim):
+	if dim > len(SOBOL_DIRECTIONS) + 1:
+		raise ValueError('Sobol designs support up to {} parameters'.format(len(SOBOL_DIRECTIONS) + 1))
+	v = np.zeros((dim, SOBOL_BITS), dtype=np.uint64)
+	v[0] = [1 << (SOBOL_BITS - 1 - i) for i in range(SOBOL_BITS)]
+	for d in range(1, dim):
+		s, a, m = SOBOL_DIRECTIONS[d - 1]
+		for i in range(SOBOL_BITS):
+			if i < s:
+				v[d, i] = m[i] << (SOBOL_BITS - 1 - i)
+			else:
+				value = v[d, i - s] ^ (v[d, i - s] >> s)
+				for k in range(1, s):
+					if (a >> (s - 1 - k)) & 1:
+						value ^= v[d, i - k]
+				v[d, i] = value
+	return v
+
+
+def sobol(bounds, n, seed=None, skip=0):
+	"""
+	Sobol points skip .. skip + n - 1 in Gray code order
+	Point i + 1 is point i XOR the direction number of the lowest set bit of i + 1, so
+	the whole sequence is one cumulative XOR. With a seed the points get a random
+	digital shift, which keeps their stratification.
+	"""
+	dim = len(as_pairs(bounds))
+	if n <= 0:
+		return scale_unit(np.empty((0, dim)), bounds)
+	v = sobol_directions(dim)
+	first = np.zeros(dim, dtype=np.uint64)
+	gray = skip ^ (skip >> 1)
+	for bit in range(SOBOL_BITS):
+		if (gray >> bit) & 1:
+			first ^= v[:, bit]
+	k = np.arange(skip + 1, skip + n, dtype=np.uint64)
+	lowest = np.log2(k & (~k + np.uint64(1))).astype(np.intp)
+	steps = np.vstack((first, v[:, lowest].T))
+	x = np.bitwise_xor.accumulate(steps, axis=0)
+	if seed is not None:
+		x ^= np.random.default_rng(seed).integers(0, 1 << SOBOL_BITS, size=dim, dtype=np.uint64)
+	return scale_unit(x * (1.0 / (1 << SOBOL_BITS)), bounds)
+
+
+def flaw_stack(design, flaw):
+	"""Combined length of the crack(s), ligaments and loss measured from the inner surface"""
+	if flaw == 'cw':
+		return design['length'] * 2 + design['lig_2'] + design['height']
+	if flaw == 'cc':
+		return design['length_1'] * 2 + design['length_2'] * 2 + design['lig_1'] + design['lig_2']
+	raise ValueError('unknown flaw type {!r}, expected cw or cc'.format(flaw))
+
+
+def remaining_ligament(design, pipe_thk, flaw):
+	"""lig_1 of the CW geometry or lig_3 of the CC geometry"""
+	return pipe_thk - flaw_stack(design, flaw)
+
+
+def feasible(design, pipe_thk, flaw, max_length=None, min_ligament=0.0):
+	"""Mask of geometries that fit in the wall and, if given, within max_length"""
+	stack = flaw_stack(design, flaw)
+	ok = pipe_thk - stack > min_ligament
+	if max_length is not None:
+		ok &= stack <= max_length + LENGTH_TOL
+	for name in design.dtype.names[1:]:
+		ok &= design[name] > 0
+	return ok
+
+
+def prune(design, pipe_thk, flaw, max_length=None, min_ligament=0.0):
+	"""Feasible cases only; their index still refers to the unpruned design"""
+	return design[feasible(design, pipe_thk, flaw, max_length, min_ligament)]
+
+
+def flaw_detail(design, pipe_thk, flaw):
+	"""Design table in the column order of flaw_detail in the summary files"""
+	rest = remaining_ligament(design, pipe_thk, flaw) * 1000
+	if flaw == 'cw':
+		columns = (design['height'] * 1000, design['length'] * 2000, design['lig_2'] * 1000, rest)
+	else:
+		columns = (design['length_1'] * 2000, design['length_2'] * 2000, design['lig_1'] * 1000,
+			design['lig_2'] * 1000, rest)
+	return np.column_stack((design['index'],) + columns)
+
+
+def dimensionless(design, pipe_thk, flaw):
+	"""Flaw variables normalized by the wall thickness, in the order of the fitted equations"""
+	if flaw == 'cw':
+		columns = (design['height'], design['length'] * 2, design['lig_2'])
+	elif flaw == 'cc':
+		columns = (design['length_1'] * 2, design['length_2'] * 2, design['lig_1'], design['lig_2'])
+	else:
+		raise ValueError('unknown flaw type {!r}, expected cw or cc'.format(flaw))
+	return np.column_stack(columns) / pipe_thk
+
+
+def write_table(path, design, pipe_thk, flaw):
+	columns = CW_COLUMNS if flaw == 'cw' else CC_COLUMNS
+	np.savetxt(path, flaw_detail(design, pipe_thk, flaw), fmt=['%d'] + ['%.6g'] * (len(columns) - 1),
+		delimiter=', ', header=', '.join(columns) + ' (mm)')
@@ -0,0 +1,192 @@
+"""
+Vectorized burst pressure equations for pipes with interacting flaws
+The fitted Buckingham-pi power laws of the MATLAB scripts, evaluated on NumPy arrays
+or memory-mapped columns in fixed-size blocks:
+ - CW (crack + wall loss): pb = 1 + c1 (h/t)^c2 (a/t)^c3 (l/t)^c4 (D/t)^c5
+ - CC (two cracks):        pb = 1 + c1 (a1/t)^c2 (a2/t)^c3 (l1/t)^c4 (l2/t)^c5 (D/t)^c6
+pb is normalized by the burst pressure of the pipe without flaw. Crack lengths a,
+a1, a2 are full lengths (2 * length in the Abaqus scripts), h is the loss height,
+l, l1, l2 the ligaments; all lengths in the same unit as t and D.
+
+The coefficient sets (per grade and pipe configuration) are stored as data in
+data/coefficients.json together with the normalized ranges they were fitted on. The
+allTD fits of the MATLAB scripts are on t/D, so their D/t exponents are stored
+negated. c1 is not recorded in the scripts: complete_set() tells how to refit it.
+The validity flags are computed in the same pass: bit i is set when variable i is
+outside its range, bit 7 (with pb set to NaN) when an input is not a positive number.
+"""
+############################################################################################################
+import os
+import json
+import numpy as np
+
+CW_VARIABLES = ('h/t', 'a/t', 'l/t', 'D/t')
+CC_VARIABLES = ('a1/t', 'a2/t', 'l1/t', 'l2/t', 'D/t')
+VARIABLES = {'cw': CW_VARIABLES, 'cc': CC_VARIABLES}
+
+INVALID = 1 << 7  # flag for non-positive or NaN inputs
+RANGE_TOL = 1e-9  # relative slack on the range limits
+BLOCK = 1 << 16  # elements per block, sized to stay in cache
+
+COEFFICIENT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'coefficients.json')
+
+
+class CoefficientSet(object):
+	"""Coefficients c1..cn of one fitted equation and the ranges of its variables"""
+
+	def __init__(self, name, flaw, c, ranges, grade=None, t_mm=None, D_mm=None, pb_ref_MPa=None, source=None):
+		if flaw not in VARIABLES:
+			raise ValueError('unknown flaw type {!r}, expected cw or cc'.format(flaw))
+		self.name = name
+		self.flaw = flaw
+		self.variables = VARIABLES[flaw]
+		if len(c) != len(self.variables) + 1:
+			raise ValueError('{} needs {} coefficients, got {}'.format(name, len(self.variables) + 1, len(c)))
+		self.c = np.array([np.nan if v is None else v for v in c], dtype=float)
+		self.lower = np.array([ranges[v][0] for v in self.variables], dtype=float) * (1 - RANGE_TOL)
+		self.upper = np.array([ranges[v][1] for v in self.variables], dtype=float) * (1 + RANGE_TOL)
+		self.grade = grade
+		self.t_mm = t_mm
+		self.D_mm = D_mm
+		self.pb_ref_MPa = pb_ref_MPa
+		self.source = source
+
+	def __repr__(self):
+		return 'CoefficientSet({!r}, c={})'.format(self.name, list(self.c))
+
+	def ranges(self):
+		return dict((v, (lo, hi)) for v, lo, hi in zip(self.variables, self.lower, self.upper))
+
+	def replace(self, c):
+		"""Same set with new coefficients, e.g. after a refit"""
+		ranges = dict((v, (lo / (1 - RANGE_TOL), hi / (1 + RANGE_TOL))) for v, (lo, hi) in self.ranges().items())
+		return CoefficientSet(self.name, self.flaw, list(c), ranges, self.grade, self.t_mm, self.D_mm,
+			self.pb_ref_MPa, self.source)
+
+	def as_dict(self):
+		record = dict(name=self.name, flaw=self.flaw, grade=self.grade, t_mm=self.t_mm, D_mm=self.D_mm,
+			pb_ref_MPa=self.pb_ref_MPa, source=self.source)
+		record['c'] = [None if np.isnan(v) else float(v) for v in self.c]
+		record['ranges'] = dict((v, [float(lo / (1 - RANGE_TOL)), float(hi / (1 + RANGE_TOL))])
+			for v, (lo, hi) in self.ranges().items())
+		return record
+
+
+def load_coefficients(path=COEFFICIENT_FILE):
+	with open(path) as f:
+		doc = json.load(f)
+	return dict((record['name'], CoefficientSet(**record)) for record in doc['sets'])
+
+
+def save_coefficients(sets, path=COEFFICIENT_FILE, note=None):
+	doc = {'note': note or [], 'sets': [s.as_dict() for s in sets]}
+	if note is None and os.path.exists(path):
+		with open(path) as f:
+			doc['note'] = json.load(f).get('note', [])
+	with open(path, 'w') as f:
+		json.dump(doc, f, indent=1)
+
+
+COEFFICIENTS = load_coefficients()
+
+
+def get_set(coeffs):
+	if isinstance(coeffs, CoefficientSet):
+		return coeffs
+	try:
+		return COEFFICIENTS[coeffs]
+	except KeyError:
+		raise KeyError('no coefficient set {!r}, available: {}'.format(coeffs, ', '.join(sorted(COEFFICIENTS))))
+
+
+def pipe_set(flaw, grade, t_mm, D_mm, sets=None):
+	"""Set fitted on one pipe (wall thickness and outer diameter in mm) and grade, None if there is none"""
+	for coeffs in (COEFFICIENTS if sets is None else sets).values():
+		if coeffs.flaw == flaw and coeffs.grade == 'X{}'.format(grade) and coeffs.t_mm is not None and \
+			np.isclose(coeffs.t_mm, t_mm) and np.isclose(coeffs.D_mm, D_mm):
+			return coeffs
+	return None
+
+
+def complete_set(coeffs):
+	"""The set, or a ValueError on how to get c1 when it is not known"""
+	coeffs = get_set(coeffs)
+	if np.isnan(coeffs.c[0]):
+		raise ValueError('c1 of {} is not known: refit the set on the simulation results (pyburst.fitting.refit), '
+			'save it with equations.save_coefficients and pass the file with --coefficients'.format(coeffs.name))
+	return coeffs
+
+
+def evaluate(coeffs, columns, t, D, out=None, flags=None, block=BLOCK):
+	"""
+	pb and validity flags for the flaw columns (in the order of the set's variables
+	without D/t) of pipes with wall thickness t and outer diameter D
+	Columns can be memory-mapped; they are read block by block and pb is written to
+	`out` (allocated when None) so memory stays bounded by the block size.
+	"""
+	coeffs = complete_set(coeffs)
+	columns = [np.asarray(col) for col in columns]
+	if len(columns) != len(coeffs.variables) - 1:
+		raise ValueError('{} needs the columns {}'.format(coeffs.name, ', '.join(coeffs.variables[:-1])))
+	n = len(columns[0])
+	t_arr = np.broadcast_to(np.asarray(t, dtype=float), (n,))
+	D_arr = np.broadcast_to(np.asarray(D, dtype=float), (n,))
+	if out is None:
+		out = np.empty(n)
+	if flags is None:
+		flags = np.empty(n, dtype=np.uint8)
+	c1, exponents = coeffs.c[0], coeffs.c[1:]
+	# prod (x_i / t)^c_i = prod x_i^c_i * t^-(sum c_i): the normalization is one term
+	t_exponent = -exponents.sum()
+
+	acc = np.empty(min(block, n))
+	term = np.empty(min(block, n))
+	bad = np.empty(min(block, n), dtype=bool)
+	for start in range(0, n, block):
+		stop = min(start + block, n)
+		m = stop - start
+		a, tm, bd = acc[:m], term[:m], bad[:m]
+		f = flags[start:stop]
+		f[:] = 0
+		t_blk = t_arr[start:stop]
+		D_blk = D_arr[start:stop]
+		np.log(t_blk, out=a)
+		a *= t_exponent
+		for i, x in enumerate([col[start:stop] for col in columns] + [D_blk]):
+			with np.errstate(invalid='ignore', divide='ignore'):
+				np.log(x, out=tm)
+			tm *= exponents[i]
+			a += tm
+			# Range check on x / t without dividing: x < lower * t or x > upper * t
+			np.multiply(t_blk, coeffs.lower[i], out=tm)
+			np.less(x, tm, out=bd)
+			np.multiply(t_blk, coeffs.upper[i], out=tm)
+			np.logical_or(bd, np.greater(x, tm), out=bd)
+			np.bitwise_or(f, bd.view(np.uint8) << i, out=f)
+		np.isfinite(a, out=bd)
+		np.logical_not(bd, out=bd)
+		np.bitwise_or(f, bd.view(np.uint8) << 7, out=f)
+		np.exp(a, out=a)
+		a *= c1
+		a += 1.0
+		np.copyto(a, np.nan, where=bd)
+		out[start:stop] = a
+	return out, flags
+
+
+def predict_cw(h, a, l, t, D, coeffs='CW_allTD', out=None, flags=None):
+	"""Normalized burst pressure of a crack (full length a) with wall loss h and ligament l"""
+	return evaluate(coeffs, (h, a, l), t, D, out, flags)
+
+
+def predict_cc(a1, a2, l1, l2, t, D, coeffs='CC_allTD', out=None, flags=None):
+	"""Normalized burst pressure of two cracks a1, a2 with ligaments l1, l2"""
+	return evaluate(coeffs, (a1, a2, l1, l2), t, D, out, flags)
+
+
+def describe_flags(flags, flaw):
+	"""Names of the out-of-range variables for one flag value"""
+	names = [v for i, v in enumerate(VARIABLES[flaw]) if int(flags) & (1 << i)]
+	if int(flags) & INVALID:
+		names.append('invalid')
+	return names
@@ -0,0 +1,168 @@
+"""
+Fitting the Buckingham-pi power laws of the burst pressure equations
+pb = 1 + c1 * prod(x_i^c_{i+1}), with x the normalized flaw variables (h/t, a/t, ...).
+Taking logs of |pb - 1| makes the model linear in (log |c1|, c2, ...), which gives
+the starting point; fit_power_law then minimizes the squared error in pb (as
+fitnlm does) by Levenberg-Marquardt with the analytic Jacobian.
+
+Fits are batched: pb (and x, if the datasets have different points) carry leading
+dimensions (grades, pipe configurations, resamples), and weights select or repeat
+points per dataset. Datasets of different sizes are padded with zero weights by
+stack_datasets.
+"""
+############################################################################################################
+from collections import namedtuple
+
+import numpy as np
+
+"""Coefficients with standard errors and residual statistics, one entry per dataset"""
+FitResult = namedtuple('FitResult', ['c', 'se', 'sse', 'rmse', 'r2', 'max_residual', 'n', 'iterations',
+	'converged'])
+
+
+def log_design(x):
+	"""Columns [1, log x_1, log x_2, ...] of the linearized model"""
+	x = np.asarray(x, dtype=float)
+	if np.any(x <= 0):
+		raise ValueError('power-law variables must be positive')
+	return np.concatenate((np.ones(x.shape[:-1] + (1,)), np.log(x)), axis=-1)
+
+
+def loglinear_fit(x, pb, weights=None):
+	"""
+	Coefficients c1..cn from a least-squares fit of log |pb - 1|
+	x is (..., points, variables); pb is (..., points) for a batch of datasets, weights
+	(..., points) are per-point weights, e.g. bootstrap counts.
+	"""
+	A = log_design(x)
+	y = np.asarray(pb, dtype=float) - 1
+	# All points of a dataset lie on the same side of 1 (c1 < 0 for pb below the pipe without flaw)
+	if weights is None:
+		weights = np.ones(y.shape)
+	sign = np.where(np.sum(weights * y, axis=-1) < 0, -1.0, 1.0)
+	with np.errstate(divide='ignore'):
+		z = np.log(np.abs(y))
+	weights = np.where(np.isfinite(z), weights, 0.0)
+	z = np.where(np.isfinite(z), z, 0.0)
+	# Normal equations for the whole batch at once; the pseudo-inverse copes with resamples
+	# that leave too few distinct points to determine every coefficient
+	AtWA = np.einsum('...n,...ni,...nj->...ij', weights, A, A)
+	AtWz = np.einsum('...n,...ni,...n->...i', weights, A, z)
+	beta = np.einsum('...ij,...j->...i', np.linalg.pinv(AtWA), AtWz)
+	c = beta.copy()
+	c[..., 0] = sign * np.exp(beta[..., 0])
+	return c
+
+
+def power_law(c, x):
+	"""pb for coefficients c (..., n + 1) at points x (..., points, n)"""
+	c = np.asarray(c, dtype=float)
+	logx = np.log(np.asarray(x, dtype=float))
+	return 1 + c[..., :1] * np.exp(np.einsum('...i,...ni->...n', c[..., 1:], logx))
+
+
+def jacobian(c, logx):
+	"""Model values and derivatives d pb / d c of shape (..., points, n + 1)"""
+	prod = np.exp(np.einsum('...i,...ni->...n', c[..., 1:], logx))
+	J = np.empty(prod.shape + (c.shape[-1],))
+	J[..., 0] = prod
+	J[..., 1:] = (c[..., :1] * prod)[..., None] * logx
+	return 1 + c[..., :1] * prod, J
+
+
+def fit_power_law(x, pb, weights=None, c0=None, max_iter=100, tol=1e-10):
+	"""
+	Least-squares fit of pb = 1 + c1 prod(x_i^c_{i+1}) for a batch of datasets
+	Starts from the log-space fit unless c0 is given, and iterates each dataset until
+	its relative decrease of the squared error is below tol. Only the datasets still
+	iterating are carried through each step.
+	"""
+	x = np.asarray(x, dtype=float)
+	y = np.asarray(pb, dtype=float)
+	shape, size = y.shape[:-1], y.shape[-1]
+	w = np.ones(y.shape) if weights is None else np.broadcast_to(np.asarray(weights, dtype=float), y.shape)
+	c = loglinear_fit(x, y, w) if c0 is None else np.broadcast_to(c0, shape + (x.shape[-1] + 1,))
+	p = c.shape[-1]
+	# Work on a flat batch; x is either shared by all datasets or given per dataset
+	y = y.reshape(-1, size)
+	w = w.reshape(-1, size)
+	c = np.array(c, dtype=float).reshape(-1, p)
+	shared = x.ndim == 2
+	logx = np.log(x) if shared else np.log(np.broadcast_to(x, shape + x.shape[-2:])).reshape(-1, size, p - 1)
+	eye = np.eye(p)
+
+	f, J = jacobian(c, logx)
+	r = y - f
+	sse = np.einsum('bn,bn->b', w, r * r)
+	lam = np.full(len(y), 1e-3)
+	iterations = np.zeros(len(y), dtype=int)
+	active = np.arange(len(y))
+	for _ in range(max_iter):
+		if not len(active):
+			break
+		wa, Ja, ra = w[active], J[active], r[active]
+		lx = logx if shared else logx[active]
+		WJ = np.swapaxes(Ja * wa[..., None], 1, 2)
+		JtWJ = np.matmul(WJ, Ja)
+		JtWr = np.matmul(WJ, ra[..., None])[..., 0]
+		# Marquardt damping scales with the diagonal, so the step is invariant to the variable scales
+		damped = JtWJ + lam[active, None, None] * (JtWJ * eye + 1e-12 * eye)
+		c_new = c[active] + np.linalg.solve(damped, JtWr[..., None])[..., 0]
+		f_new, J_new = jacobian(c_new, lx)
+		r_new = y[active] - f_new
+		sse_new = np.einsum('bn,bn->b', wa, r_new * r_new)
+		better = sse_new <= sse[active]
+		done = better & (sse[active] - sse_new <= tol * np.maximum(sse[active], 1e-300))
+		keep = active[better]
+		c[keep], r[keep], J[keep], sse[keep] = c_new[better], r_new[better], J_new[better], sse_new[better]
+		lam[active] = np.where(better, lam[active] * 0.1, lam[active] * 10.0)
+		iterations[active] += 1
+		# A dataset whose step keeps failing is at its minimum within round-off
+		active = active[~done & (lam[active] < 1e12)]
+	converged = np.ones(len(y), dtype=bool)
+	converged[active] = False
+
+	n = w.sum(axis=-1)
+	dof = np.maximum(n - p, 1)
+	JtWJ = np.matmul(np.swapaxes(J * w[..., None], 1, 2), J)
+	cov = np.linalg.pinv(JtWJ) * (sse / dof)[:, None, None]
+	se = np.sqrt(np.maximum(np.diagonal(cov, axis1=-2, axis2=-1), 0.0))
+	mean = np.einsum('bn,bn->b', w, y) / np.maximum(n, 1)
+	sst = np.einsum('bn,bn->b', w, (y - mean[:, None]) ** 2)
+	with np.errstate(invalid='ignore', divide='ignore'):
+		r2 = 1 - sse / np.where(sst > 0, sst, np.nan)
+	max_residual = np.max(np.where(w > 0, np.abs(r), 0.0), axis=-1)
+	rmse = np.sqrt(sse / np.maximum(n, 1))
+	out = [c.reshape(shape + (p,)), se.reshape(shape + (p,))]
+	out += [v.reshape(shape) for v in (sse, rmse, r2, max_residual, n, iterations, converged)]
+	return FitResult(*out)
+
+
+def stack_datasets(datasets):
+	"""
+	Pad [(x, pb), ...] of different sizes to one batch (x, pb, weights)
+	The padding repeats the first point with weight zero, so it is a valid point that
+	does not count in the fit.
+	"""
+	size = max(len(pb) for _, pb in datasets)
+	k = np.asarray(datasets[0][0]).shape[-1]
+	X = np.empty((len(datasets), size, k))
+	Y = np.empty((len(datasets), size))
+	W = np.zeros((len(datasets), size))
+	for i, (x, pb) in enumerate(datasets):
+		m = len(pb)
+		X[i, :m], Y[i, :m], W[i, :m] = x, pb, 1.0
+		X[i, m:], Y[i, m:] = X[i, 0], Y[i, 0]
+	return X, Y, W
+
+
+def refit(coeffs, x, pb, weights=None):
+	"""CoefficientSet with its coefficients refitted to the data, and the fit; x may omit D/t"""
+	from pyburst.equations import get_set
+	coeffs = get_set(coeffs)
+	result = fit_power_law(x, pb, weights)
+	c = result.c
+	if c.shape[-1] == len(coeffs.variables):
+		# Fitted on one pipe configuration, the D/t exponent stays 0
+		c = np.append(c, 0.0)
+	return coeffs.replace(c), result
@@ -0,0 +1,136 @@
+"""
+Named edges of the partitioned pipe, derived from its dimensions
+The quarter pipe of the scripts (x, y >= 0, 0 <= z <= pipe_len) is partitioned by
+the plane z = pipe_len - crack_par and by the half-plane at angle theta_par from the
+y axis (the line from the origin to magic_pt). The edges outside the flaw region
+are seeded by number in three groups:
+ - radial: edges through the wall
+ - near: axial edges between the partition plane and the flaw end, and the arcs of
+   the flaw partition (0 < theta < theta_par)
+ - far: axial edges from z = 0 to the partition plane, and the arcs of the rest of
+   the quarter (theta_par < theta < 90 deg)
+Every edge is named and located by its midpoint, which is what findAt needs, so a
+new diameter or thickness needs no hand-collected coordinates.
+
+Angles are measured from the y axis, as for the flaws on the x = 0 plane; pipe_id
+and pipe_od are the inner and outer radii, as in the scripts.
+"""
+############################################################################################################
+import os
+import json
+import math
+
+from pyburst.cache import case_key, atomic_write
+
+GROUPS = ('radial', 'near', 'far')
+
+
+class PipeGeometry(object):
+	"""Partitioned quarter pipe; theta_par defaults to the arc of crack_par on the outer surface"""
+
+	def __init__(self, pipe_id, pipe_od, pipe_len, crack_par, theta_par=None):
+		if not 0 < pipe_id < pipe_od:
+			raise ValueError('inner radius {} must be below the outer radius {}'.format(pipe_id, pipe_od))
+		if not 0 < crack_par < pipe_len:
+			raise ValueError('crack_par {} must be inside the pipe length {}'.format(crack_par, pipe_len))
+		self.pipe_id = pipe_id
+		self.pipe_od = pipe_od
+		self.pipe_thk = pipe_od - pipe_id
+		self.pipe_len = pipe_len
+		self.crack_par = crack_par
+		self.theta_par = crack_par / pipe_od if theta_par is None else theta_par
+		if not 0 < self.theta_par < math.pi / 2:
+			raise ValueError('theta_par {} must be between 0 and 90 degrees'.format(self.theta_par))
+
+	def params(self):
+		return dict(pipe_id=self.pipe_id, pipe_od=self.pipe_od, pipe_len=self.pipe_len,
+			crack_par=self.crack_par, theta_par=self.theta_par)
+
+	def point(self, r, theta, z):
+		return (round(r * math.sin(theta), 9), round(r * math.cos(theta), 9), z)
+
+	def magic_pt(self):
+		"""End of the partition line on the z = pipe_len face, just outside the pipe"""
+		r = self.pipe_od * 1.05
+		return (r * math.sin(self.theta_par), r * math.cos(self.theta_par))
+
+	def edges(self):
+		"""{name: (group, midpoint)} of the seeded edges"""
+		radii = {'inner': self.pipe_id, 'outer': self.pipe_od}
+		angles = {'y': 0.0, 'par': self.theta_par, 'x': math.pi / 2}
+		split = self.pipe_len - self.crack_par
+		levels = {'0': 0.0, 'split': split, 'end': self.pipe_len}
+		r_mid = self.pipe_id + self.pipe_thk / 2
+
+		edges = {}
+		# Through the wall, except on the flaw faces (theta = 0 or theta_par beside the flaw)
+		for angle, level in (('par', '0'), ('par', 'end'), ('y', '0'), ('y', 'split'),
+			('x', '0'), ('x', 'split'), ('x', 'end')):
+			edges['radial_{}_{}'.format(angle, level)] = ('radial', self.point(r_mid, angles[angle], levels[level]))
+		# Along the axis: the near segment beside the flaw region, the far segment to z = 0
+		z_near = (split + self.pipe_len) / 2
+		for side in ('inner', 'outer'):
+			for angle in ('par', 'x'):
+				edges['axial_{}_{}_near'.format(side, angle)] = ('near', self.point(radii[side], angles[angle], z_near))
+			for angle in ('y', 'par', 'x'):
+				edges['axial_{}_{}_far'.format(side, angle)] = ('far', self.point(radii[side], angles[angle], split / 2))
+		# Around the circumference: the flaw partition arcs and the arcs of the rest of the quarter
+		theta_small = self.theta_par / 2
+		theta_large = (self.theta_par + math.pi / 2) / 2
+		for side in ('inner', 'outer'):
+			for level in ('0', 'split'):
+				edges['arc_{}_small_{}'.format(side, level)] = ('near', self.point(radii[side], theta_small,
+					levels[level]))
+			for level in ('0', 'split', 'end'):
+				edges['arc_{}_large_{}'.format(side, level)] = ('far', self.point(radii[side], theta_large,
+					levels[level]))
+		return edges
+
+
+class EdgeIndex(object):
+	"""Serialized edge points of one pipe configuration: name -> point and group -> points"""
+
+	def __init__(self, params, edges, magic_pt):
+		self.params = params
+		self.edges = dict((name, (group, tuple(point))) for name, (group, point) in edges.items())
+		self.magic_pt = tuple(magic_pt)
+		self.groups = dict((group, sorted(name for name, (g, _) in self.edges.items() if g == group))
+			for group in GROUPS)
+
+	@classmethod
+	def build(cls, geometry):
+		return cls(geometry.params(), geometry.edges(), geometry.magic_pt())
+
+	def __getitem__(self, name):
+		return self.edges[name][1]
+
+	def group(self, group):
+		"""Midpoints of the edges of a group, in name order"""
+		return [self.edges[name][1] for name in self.groups[group]]
+
+	def magic_edge(self):
+		"""A point on the partition line of the z = pipe_len face, for the axial cell partition"""
+		return self['radial_par_end']
+
+	def as_dict(self):
+		return {'params': self.params, 'magic_pt': list(self.magic_pt),
+			'edges': dict((name, [group, list(point)]) for name, (group, point) in self.edges.items())}
+
+	def save(self, path):
+		atomic_write(path, json.dumps(self.as_dict(), sort_keys=True, indent=1))
+
+	@classmethod
+	def load(cls, path):
+		with open(path) as f:
+			doc = json.load(f)
+		return cls(doc['params'], doc['edges'], doc['magic_pt'])
+
+
+def cached_index(folder, geometry):
+	"""Edge index of a pipe configuration, read from folder or built and saved there"""
+	path = os.path.join(folder, case_key(**geometry.params()) + '.json')
+	if os.path.exists(path):
+		return EdgeIndex.load(path)
+	index = EdgeIndex.build(geometry)
+	index.save(path)
+	return index
@@ -0,0 +1,207 @@
+"""
+Per-stage timing of the simulation cases
+Every stage of a case (sketch, partition, mesh, model, morph, solve, extract,
+cleanup) appends one JSON line to the stage log of the sweep with its wall time, the
+CPU time of this process, the resident memory at its end and counts such as
+elements, nodes and increments. The scripts mark the stages with lap() while the
+case runs top to bottom, and record the solve from the scheduler when it finishes.
+
+    python -m pyburst.instrument burst_pressure/Burst_full_cw_sTsD_stages.jsonl [--against old.jsonl]
+
+prints the time per stage of each sweep, with the stage taking the largest share
+marked, and with --against the stages whose mean time grew since the old log.
+"""
+############################################################################################################
+import os
+import sys
+import json
+import time
+import argparse
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+
+def rss_mb():
+	"""Resident memory of this process in MB, None where it cannot be read"""
+	try:
+		import psutil
+		return psutil.Process().memory_info().rss / 1048576.0
+	except ImportError:
+		pass
+	try:
+		with open('/proc/self/statm') as f:
+			return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1048576.0
+	except (IOError, OSError, ValueError, AttributeError):
+		return None
+
+
+def count_increments(path):
+	"""Converged increments in an Abaqus status file (.sta), 0 if there is none"""
+	if not os.path.exists(path):
+		return 0
+	count = 0
+	with open(path) as f:
+		for line in f:
+			fields = line.split()
+			if len(fields) > 2 and fields[0].isdigit() and fields[1].isdigit():
+				count += 1
+	return count
+
+
+def solver_times(path):
+	"""CPU and wall-clock seconds from the end of an Abaqus message file (.msg), {} if absent"""
+	times = {}
+	if not os.path.exists(path):
+		return times
+	with open(path) as f:
+		for line in f:
+			if 'TOTAL CPU TIME' in line:
+				times['cpu'] = float(line.split('=')[-1])
+			elif 'WALLCLOCK TIME' in line:
+				times['wall'] = float(line.split('=')[-1])
+	return times
+
+
+class StageLog(object):
+	"""JSON lines log of the stages of every case; context (e.g. sweep=job_name) goes in every line"""
+
+	def __init__(self, path, **context):
+		self.path = path
+		self.context = context
+		self.case = None
+		self.current = None  # (stage, fields, start, wall clock, cpu clock)
+		folder = os.path.dirname(path)
+		if folder and not os.path.isdir(folder):
+			os.makedirs(folder)
+
+	def record(self, case, stage, wall, cpu=None, start=None, **fields):
+		"""Append the line of a stage measured elsewhere, e.g. a solve timed by the scheduler"""
+		line = OrderedDict(self.context)
+		line.update(case=case, stage=stage, start=start if start is not None else time.time() - wall,
+			wall=wall, cpu=cpu, rss_mb=rss_mb())
+		line.update(fields)
+		with open(self.path, 'a') as f:
+			f.write(json.dumps(line) + '\n')
+		return line
+
+	def begin(self, case):
+		"""Start the stages of a case, closing any stage still running"""
+		self.end()
+		self.case = case
+
+	def lap(self, stage, **fields):
+		"""Close the running stage and start the next one"""
+		self.end()
+		self.current = (stage, fields, time.time(), time.perf_counter(), time.process_time())
+
+	def end(self, **fields):
+		"""Close the running stage, fields (e.g. elements=...) are added to its line"""
+		if self.current is None:
+			return None
+		stage, started, start, wall, cpu = self.current
+		self.current = None
+		started = dict(started, **fields)
+		return self.record(self.case, stage, time.perf_counter() - wall, time.process_time() - cpu, start,
+			**started)
+
+	@contextmanager
+	def stage(self, stage, case=None, **fields):
+		"""Time a block as one stage of case (the current case by default); the yielded dict adds fields"""
+		extra = dict(fields)
+		start, wall, cpu = time.time(), time.perf_counter(), time.process_time()
+		try:
+			yield extra
+		finally:
+			self.record(case if case is not None else self.case, stage, time.perf_counter() - wall,
+				time.process_time() - cpu, start, **extra)
+
+
+def read_log(path):
+	with open(path) as f:
+		return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(records, by='sweep'):
+	"""{group: {stage: statistics}} of the wall and CPU times, grouped on the by field"""
+	groups = OrderedDict()
+	for record in records:
+		group = groups.setdefault(record.get(by), OrderedDict())
+		group.setdefault(record['stage'], []).append(record)
+	summary = OrderedDict()
+	for group, stages in groups.items():
+		total = sum(r['wall'] for rows in stages.values() for r in rows)
+		summary[group] = OrderedDict()
+		for stage, rows in stages.items():
+			wall = np.array([r['wall'] for r in rows])
+			cpu = [r['cpu'] for r in rows if r.get('cpu') is not None]
+			rss = [r['rss_mb'] for r in rows if r.get('rss_mb') is not None]
+			summary[group][stage] = {
+				'count': len(rows), 'cases': len(set(r['case'] for r in rows)),
+				'wall': float(wall.sum()), 'mean': float(wall.mean()), 'p50': float(np.percentile(wall, 50)),
+				'p90': float(np.percentile(wall, 90)), 'max': float(wall.max()),
+				'cpu': float(sum(cpu)) if cpu else None, 'rss_mb': max(rss) if rss else None,
+				'share': float(wall.sum() / total) if total > 0 else 0.0}
+			for name in ('elements', 'nodes', 'increments'):
+				values = [r[name] for r in rows if r.get(name) is not None]
+				if values:
+					summary[group][stage][name] = float(np.mean(values))
+	return summary
+
+
+def compare(old, new, threshold=0.1, by='sweep', min_seconds=0.1):
+	"""
+	Stages whose mean wall time grew by more than threshold and min_seconds:
+	[(group, stage, old mean, new mean)]
+	"""
+	old, new = summarize(old, by), summarize(new, by)
+	# A single group on each side (e.g. two runs of one sweep under different names) is compared directly
+	pairs = [(group, old[group], new[group]) for group in new if group in old]
+	if not pairs and len(old) == 1 and len(new) == 1:
+		pairs = [(list(new)[0], list(old.values())[0], list(new.values())[0])]
+	regressions = []
+	for group, before, after in pairs:
+		for stage, stats in after.items():
+			mean = before[stage]['mean'] if stage in before else None
+			if mean is not None and stats['mean'] > mean * (1 + threshold) and stats['mean'] - mean > min_seconds:
+				regressions.append((group, stage, mean, stats['mean']))
+	return regressions
+
+
+def report(records, by='sweep'):
+	lines = []
+	for group, stages in summarize(records, by).items():
+		lines.append('{} ({} cases)'.format(group, max(s['cases'] for s in stages.values())))
+		lines.append('  {:<10} {:>6} {:>10} {:>9} {:>9} {:>9} {:>10} {:>7} {:>9}'.format('stage', 'count',
+			'total (s)', 'mean', 'p90', 'max', 'cpu (s)', 'share', 'rss (MB)'))
+		hot = max(stages, key=lambda stage: stages[stage]['wall'])
+		for stage, s in stages.items():
+			lines.append('  {:<10} {:>6} {:>10.1f} {:>9.2f} {:>9.2f} {:>9.2f} {:>10} {:>6.1f}% {:>9}{}'.format(
+				stage, s['count'], s['wall'], s['mean'], s['p90'], s['max'],
+				'-' if s['cpu'] is None else '{:.1f}'.format(s['cpu']), 100 * s['share'],
+				'-' if s['rss_mb'] is None else '{:.0f}'.format(s['rss_mb']), ' <- hot' if stage == hot else ''))
+	return '\n'.join(lines)
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(prog='python -m pyburst.instrument', description=__doc__.split('\n')[1])
+	parser.add_argument('log', help='stage log (.jsonl)')
+	parser.add_argument('--against', help='older stage log to compare the mean stage times with')
+	parser.add_argument('--threshold', type=float, default=0.1, help='relative growth reported as a regression')
+	parser.add_argument('--by', default='sweep', help='field the cases are grouped on')
+	args = parser.parse_args(argv)
+	records = read_log(args.log)
+	print(report(records, args.by))
+	if args.against:
+		regressions = compare(read_log(args.against), records, args.threshold, args.by)
+		for group, stage, before, after in regressions:
+			print('{} {}: mean {:.2f} s -> {:.2f} s (+{:.0f}%)'.format(group, stage, before, after,
+				100 * (after / before - 1) if before > 0 else float('inf')))
+		if not regressions:
+			print('no stage slower by more than {:.0f}%'.format(100 * args.threshold))
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,296 @@
+"""
+Acceptance lookup tables: pb on a dense grid, memory-mapped and interpolated
+A table holds pb at every node of a grid over the normalized flaw variables, with
+the pipe as t/D as in the MATLAB fits (a1_norm, l1_norm, ToverD of CC_allTD.m):
+
+ - CW: h/t, a/t, l/t, t/D
+ - CC: a1/t, a2/t, l1/t, l2/t, t/D
+
+It is built from a model (a coefficient set of pyburst.equations or a
+pyburst.surrogate), or from simulation results that cover a full-factorial grid, and
+written to one file: a 4 KiB JSON header with the axes, then the float32 values in C
+order. Opening a table reads the header and maps the values; queries interpolate
+multilinearly between the 2^d nodes around each point, in blocks of arrays. Uniform
+axes are located arithmetically, others by binary search.
+
+    lookup.build('cw_allTD.lut', 'CW_allTD', points=33)
+    pb, flags = LookupTable('cw_allTD.lut').evaluate((h, a, l), t, D)
+
+    python -m pyburst.lookup build cw_allTD.lut --model CW_allTD --coefficients refit.json --points 33
+    python -m pyburst.lookup results burst_pressure/results cc_x65.lut --flaw cc --grade 65
+
+evaluate() has the API and validity flags of equations.evaluate (bit i when variable
+i is outside the grid, where the nearest edge value is used); pyburst.assess takes
+a .lut file in place of a coefficient set.
+"""
+############################################################################################################
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+
+import numpy as np
+
+from pyburst import equations
+from pyburst.equations import VARIABLES, INVALID, RANGE_TOL, BLOCK
+
+MAGIC = b'PBLUT1\n'
+HEADER = 4096  # bytes before the values
+GRID_VARIABLES = {'cw': ('h/t', 'a/t', 'l/t', 't/D'), 'cc': ('a1/t', 'a2/t', 'l1/t', 'l2/t', 't/D')}
+
+
+def to_grid(x):
+	"""Normalized variables of the equations (last one D/t) to grid coordinates (last one t/D)"""
+	g = np.array(x, dtype=float)
+	with np.errstate(divide='ignore'):
+		g[..., -1] = 1.0 / g[..., -1]
+	return g
+
+
+def model_pb(model, x):
+	"""pb of a coefficient set or a model with predict_x at normalized variables x (n, variables)"""
+	if isinstance(model, equations.CoefficientSet):
+		return equations.evaluate(model, [x[:, i] for i in range(x.shape[1] - 1)], 1.0, x[:, -1])[0]
+	return model.predict_x(x)
+
+
+def write(path, flaw, axes, values, source=None):
+	"""Write a table of values (one dimension per axis) with its axes"""
+	if flaw not in GRID_VARIABLES:
+		raise ValueError('unknown flaw type {!r}, expected cw or cc'.format(flaw))
+	axes = [np.asarray(axis, dtype=float) for axis in axes]
+	shape = tuple(len(axis) for axis in axes)
+	if len(axes) != len(GRID_VARIABLES[flaw]) or np.shape(values) != shape:
+		raise ValueError('a {} table needs {} axes and values of their shape'.format(flaw,
+			len(GRID_VARIABLES[flaw])))
+	for axis in axes:
+		if np.any(np.diff(axis) <= 0):
+			raise ValueError('axes must be increasing')
+	header = json.dumps({'flaw': flaw, 'variables': GRID_VARIABLES[flaw], 'axes': [axis.tolist() for axis in axes],
+		'dtype': 'float32', 'source': source}).encode()
+	if len(MAGIC) + len(header) + 1 > HEADER:
+		raise ValueError('the axes do not fit in the {} byte header'.format(HEADER))
+	tmp = path + '.tmp'
+	with open(tmp, 'wb') as f:
+		f.write(MAGIC + header + b'\n' + b' ' * (HEADER - len(MAGIC) - len(header) - 1))
+		np.ascontiguousarray(values, dtype=np.float32).tofile(f)
+	os.replace(tmp, path)
+
+
+def grid_axes(ranges, flaw, points):
+	"""Evenly spaced axes over the ranges of the equation variables (D/t range turned into t/D)"""
+	names = VARIABLES[flaw]
+	points = dict((name, points) for name in names) if not hasattr(points, 'items') else points
+	axes = []
+	for name in names:
+		lo, hi = ranges[name]
+		if name == 'D/t':
+			lo, hi = 1.0 / hi, 1.0 / lo
+		axes.append(np.linspace(lo, hi, points[name]) if hi > lo else np.array([lo]))
+	return axes
+
+
+def build(path, model, points=17, ranges=None, source=None):
+	"""
+	Table of a model over ranges ({variable: (low, high)} of the equation variables,
+	default the ranges of the model) with points nodes per axis (an int or a dict)
+	"""
+	if not hasattr(model, 'predict_x'):
+		model = equations.complete_set(model)
+	ranges = ranges or dict((name, (lo / (1 - RANGE_TOL), hi / (1 + RANGE_TOL)))
+		for name, (lo, hi) in model.ranges().items())
+	axes = grid_axes(ranges, model.flaw, points)
+	values = np.empty(tuple(len(axis) for axis in axes), dtype=np.float32)
+	# One slab of the first axis at a time keeps the temporary arrays small
+	rest = np.stack(np.meshgrid(*axes[1:], indexing='ij'), axis=-1).reshape(-1, len(axes) - 1)
+	x = np.empty((len(rest), len(axes)))
+	x[:, 1:] = rest
+	x[:, -1] = 1.0 / x[:, -1]
+	for i, value in enumerate(axes[0]):
+		x[:, 0] = value
+		values[i] = model_pb(model, x).reshape(values.shape[1:])
+	if source is None:
+		source = getattr(model, 'name', None) or 'surrogate {}'.format(model.info)
+	write(path, model.flaw, axes, values, source)
+	return LookupTable(path)
+
+
+def build_from_results(path, x, pb, flaw, source='simulation results'):
+	"""Table of results x (cases, equation variables) that cover every node of the grid of their values"""
+	g = to_grid(x)
+	axes = [np.unique(np.round(g[:, i], 9)) for i in range(g.shape[1])]
+	values = np.full(tuple(len(axis) for axis in axes), np.nan, dtype=np.float32)
+	index = tuple(np.searchsorted(axis, np.round(g[:, i], 9)) for i, axis in enumerate(axes))
+	values[index] = pb
+	missing = int(np.isnan(values).sum())
+	if missing:
+		raise ValueError('the results miss {} of the {} grid nodes; build the table from a surrogate '
+			'trained on them instead'.format(missing, values.size))
+	write(path, flaw, axes, values, source)
+	return LookupTable(path)
+
+
+class LookupTable(object):
+	"""Memory-mapped table, see the module docstring"""
+
+	def __init__(self, path):
+		with open(path, 'rb') as f:
+			head = f.read(HEADER)
+		if not head.startswith(MAGIC):
+			raise ValueError('{} is not a lookup table'.format(path))
+		header = json.loads(head[len(MAGIC):].split(b'\n', 1)[0].decode())
+		self.path = path
+		self.flaw = header['flaw']
+		self.variables = VARIABLES[self.flaw]
+		self.source = header.get('source')
+		self.axes = [np.asarray(axis, dtype=float) for axis in header['axes']]
+		self.shape = tuple(len(axis) for axis in self.axes)
+		self.values = np.memmap(path, dtype=np.dtype(header['dtype']), mode='r', offset=HEADER, shape=self.shape)
+		self.flat = self.values.reshape(-1)
+		self.strides = np.array([int(np.prod(self.shape[i + 1:])) for i in range(len(self.shape))], dtype=np.int64)
+		self.uniform = [len(axis) > 1 and np.allclose(np.diff(axis), axis[1] - axis[0], rtol=1e-6, atol=0)
+			for axis in self.axes]
+		self.lower = np.array([axis[0] for axis in self.axes]) * (1 - RANGE_TOL)
+		self.upper = np.array([axis[-1] for axis in self.axes]) * (1 + RANGE_TOL)
+		# Offsets of the nodes of a cell from its lowest node, first axis slowest
+		steps = [stride if size > 1 else 0 for stride, size in zip(self.strides, self.shape)]
+		self.offsets = np.array([sum(step for step, upper in zip(steps, corner) if upper)
+			for corner in itertools.product((0, 1), repeat=len(self.shape))], dtype=np.int64)
+
+	def __repr__(self):
+		return 'LookupTable({!r}, {}, {})'.format(self.path, self.flaw, 'x'.join(str(n) for n in self.shape))
+
+	def ranges(self):
+		"""Ranges of the equation variables covered by the grid"""
+		ranges = {}
+		for name, axis in zip(self.variables, self.axes):
+			ranges[name] = (1.0 / axis[-1], 1.0 / axis[0]) if name == 'D/t' else (axis[0], axis[-1])
+		return ranges
+
+	def locate(self, i, v):
+		"""Lower node index and fraction of the cell along axis i, clamped to the grid"""
+		axis = self.axes[i]
+		n = len(axis)
+		if n == 1:
+			return np.zeros(len(v), dtype=np.int64), np.zeros(len(v))
+		if self.uniform[i]:
+			pos = (v - axis[0]) * ((n - 1) / (axis[-1] - axis[0]))
+			np.clip(pos, 0, n - 1, out=pos)
+			lo = np.minimum(pos.astype(np.int64), n - 2)
+			return lo, pos - lo
+		lo = np.clip(np.searchsorted(axis, v, side='right') - 1, 0, n - 2)
+		frac = (v - axis[lo]) / (axis[lo + 1] - axis[lo])
+		return lo, np.clip(frac, 0.0, 1.0)
+
+	def interpolate(self, g):
+		"""pb at grid coordinates g (n, axes), multilinear between the nodes"""
+		n = len(g)
+		base = np.zeros(n, dtype=np.int64)
+		fracs = []
+		for i in range(len(self.shape)):
+			lo, frac = self.locate(i, g[:, i])
+			base += lo * self.strides[i]
+			fracs.append(frac)
+		# The 2^d nodes of each cell in one gather, then one axis folded at a time
+		values = self.flat[base[:, None] + self.offsets].reshape((n,) + (2,) * len(self.shape))
+		for frac in fracs:
+			low = values[:, 0]
+			values = low + frac.reshape((n,) + (1,) * (low.ndim - 1)) * (values[:, 1] - low)
+		return values.astype(float)
+
+	def predict_x(self, x):
+		"""pb at the normalized variables of the equations (n, variables); NaN where an input is not positive"""
+		x = np.asarray(x, dtype=float)
+		bad = ~np.all(np.isfinite(x) & (x > 0), axis=1)
+		g = to_grid(np.where(bad[:, None], 1.0, x))
+		pb = self.interpolate(g)
+		pb[bad] = np.nan
+		return pb
+
+	def evaluate(self, columns, t, D, out=None, flags=None, block=BLOCK):
+		"""pb and validity flags as equations.evaluate, the limits being the grid"""
+		columns = [np.asarray(col) for col in columns]
+		if len(columns) != len(self.variables) - 1:
+			raise ValueError('the {} table needs the columns {}'.format(self.flaw, ', '.join(self.variables[:-1])))
+		n = len(columns[0])
+		t_arr = np.broadcast_to(np.asarray(t, dtype=float), (n,))
+		D_arr = np.broadcast_to(np.asarray(D, dtype=float), (n,))
+		if out is None:
+			out = np.empty(n)
+		if flags is None:
+			flags = np.empty(n, dtype=np.uint8)
+		g = np.empty((min(block, n), len(self.variables)))
+		for start in range(0, n, block):
+			stop = min(start + block, n)
+			gb = g[:stop - start]
+			t_blk = t_arr[start:stop]
+			for i, col in enumerate(columns):
+				np.divide(col[start:stop], t_blk, out=gb[:, i])
+			np.divide(t_blk, D_arr[start:stop], out=gb[:, -1])
+			f = flags[start:stop]
+			f[:] = 0
+			for i in range(len(self.variables)):
+				f |= ((gb[:, i] < self.lower[i]) | (gb[:, i] > self.upper[i])).view(np.uint8) << i
+			bad = ~np.all(np.isfinite(gb) & (gb > 0), axis=1)
+			f[bad] |= INVALID
+			gb[bad] = self.lower / (1 - RANGE_TOL)
+			pb = self.interpolate(gb)
+			pb[bad] = np.nan
+			out[start:stop] = pb
+		return out, flags
+
+
+def benchmark(table, n=1 << 20, seed=0):
+	"""Seconds per flaw of evaluate() on n random flaws within the grid"""
+	rng = np.random.default_rng(seed)
+	ranges = table.ranges()
+	t = np.full(n, 10.0)
+	columns = [t * rng.uniform(*ranges[name], size=n) for name in table.variables[:-1]]
+	D = t * rng.uniform(*ranges['D/t'], size=n)
+	start = time.perf_counter()
+	table.evaluate(columns, t, D)
+	return (time.perf_counter() - start) / n
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(prog='python -m pyburst.lookup', description=__doc__.split('\n')[1])
+	commands = parser.add_subparsers(dest='command')
+	command = commands.add_parser('build', help='tabulate a coefficient set or a surrogate')
+	command.add_argument('output', help='.lut file')
+	command.add_argument('--model', required=True, help='coefficient set, e.g. CW_allTD, or surrogate (.npz)')
+	command.add_argument('--coefficients', help='coefficient file with the set')
+	command.add_argument('--points', type=int, default=17, help='nodes per axis')
+	command = commands.add_parser('results', help='tabulate the full-factorial results of a result store')
+	command.add_argument('store', help='ResultStore directory, e.g. burst_pressure/results')
+	command.add_argument('output', help='.lut file')
+	command.add_argument('--flaw', required=True, choices=sorted(VARIABLES))
+	command.add_argument('--grade', type=int, help='only the cases of this grade')
+	args = parser.parse_args(argv)
+	if args.command == 'build':
+		from pyburst.assess import require_coefficients
+		require_coefficients(parser, args.coefficients, [args.model])
+		if args.coefficients:
+			equations.COEFFICIENTS.update(equations.load_coefficients(args.coefficients))
+		from pyburst.surrogate import Surrogate
+		model = Surrogate.load(args.model) if args.model.endswith('.npz') else args.model
+		table = build(args.output, model, args.points)
+	elif args.command == 'results':
+		from pyburst.store import ResultStore
+		from pyburst.surrogate import training_data
+		predicates = {} if args.grade is None else {'grade': args.grade}
+		x, pb = training_data(ResultStore(args.store), args.flaw, **predicates)
+		if not len(pb):
+			parser.exit(1, 'error: no {} cases with pb in {}\n'.format(args.flaw, args.store))
+		table = build_from_results(args.output, x, pb, args.flaw, 'results in {}'.format(args.store))
+	else:
+		parser.print_help()
+		return 1
+	print('{}: {:.1f} MB from {}'.format(table, table.values.nbytes / 1e6, table.source))
+	print('{:.3g} ns per flaw'.format(benchmark(table) * 1e9))
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,154 @@
+"""
+Plastic tables of the steel grades
+The grades are listed in data/materials.json: a measured table (X65), or a yield
+stress with a hardening exponent n (X42 n=8, X100 n=20) or with a tensile strength
+the exponent is derived from (X52, X70, X80). Power-law curves follow the X42 and
+X100 tables of the scripts:
+
+    sigma = yield * (1 + ep / ey) ^ (1 / n),  ey = yield / E
+
+at POINTS plastic strains evenly spaced from 0 to MAX_STRAIN - ey. With a tensile
+strength, n is the exponent whose engineering stress peaks at it (Considere: necking
+at ep = 1 / n - ey). Curves are evaluated on arrays, so a material sweep gets all
+its tables in one call, and plastic_table keeps the tuples handed to Abaqus per
+parameter set:
+
+    mdb.models['Model-1'].materials['steel'].Plastic(table=material.plastic_table(steel_grade))
+    material.plastic_table(yield_stress=450e6, uts=535e6)
+
+Each grade also has the Mises burst criterion of the flaw region (burst_mises):
+yield + 69 MPa as for X65, or a value determined from simulation (X42).
+"""
+############################################################################################################
+import os
+import json
+
+import numpy as np
+
+MATERIAL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'materials.json')
+
+YOUNG_MODULUS = 210000000000.0  # as in the scripts
+MAX_STRAIN = 0.8  # total strain at the end of the power-law tables
+BURST_MARGIN = 69e6  # burst criterion over the yield stress, as for X65
+POINTS = 30
+KEY_DIGITS = 9
+
+# Tables handed out so far, by parameters
+TABLES = {}
+
+
+def grade_name(grade):
+	"""'X65' for 65, '65', 'x65' or 'X65'"""
+	name = str(grade).upper()
+	return name if name.startswith('X') else 'X' + name
+
+
+def load_grades(path=MATERIAL_FILE):
+	with open(path) as f:
+		return json.load(f)['grades']
+
+
+GRADES = load_grades()
+
+
+def grades():
+	"""Grade numbers of the library, e.g. [42, 52, 65, 70, 80, 100]"""
+	return sorted(int(name[1:]) for name in GRADES)
+
+
+def add_grade(grade, yield_stress, uts=None, n=None, table=None, burst_mises=None):
+	"""Register a grade for this process, e.g. add_grade(56, 390e6, uts=490e6); burst_mises defaults to yield + 69 MPa"""
+	if table is None and uts is None and n is None:
+		raise ValueError('a grade needs a table, a tensile strength or a hardening exponent')
+	params = {'yield': float(yield_stress)}
+	params['burst_mises'] = float(yield_stress + BURST_MARGIN if burst_mises is None else burst_mises)
+	for name, value in (('uts', uts), ('n', n), ('table', table)):
+		if value is not None:
+			params[name] = value
+	GRADES[grade_name(grade)] = params
+
+
+def strengths(grade, young_modulus=YOUNG_MODULUS):
+	"""Nominal (yield stress, tensile strength) of a grade in Pa, the latter from n when not listed"""
+	params = grade_params(grade)
+	if 'uts' in params:
+		return params['yield'], params['uts']
+	return params['yield'], float(params['yield'] * uts_ratio(params['yield'], params['n'], young_modulus))
+
+
+def burst_mises(grade):
+	"""Mises burst criterion (Pa) of a grade, None if the library has none for it"""
+	return grade_params(grade).get('burst_mises')
+
+
+def power_law(yield_stress, n, plastic_strain, young_modulus=YOUNG_MODULUS):
+	"""True stress at plastic_strain; the arguments broadcast"""
+	yield_stress = np.asarray(yield_stress, dtype=float)
+	return yield_stress * (1 + np.asarray(plastic_strain) * young_modulus / yield_stress) ** (1.0 / np.asarray(n))
+
+
+def uts_ratio(yield_stress, n, young_modulus=YOUNG_MODULUS):
+	"""Engineering tensile strength over yield stress of a power-law curve"""
+	ey = np.asarray(yield_stress, dtype=float) / young_modulus
+	n = np.asarray(n, dtype=float)
+	return (n * ey) ** (-1.0 / n) * np.exp(ey - 1.0 / n)
+
+
+def hardening_exponent(yield_stress, uts, young_modulus=YOUNG_MODULUS, iterations=60):
+	"""n whose engineering stress peaks at uts, by bisection on all the arrays at once"""
+	yield_stress, uts = np.broadcast_arrays(np.asarray(yield_stress, dtype=float), np.asarray(uts, dtype=float))
+	if np.any(uts <= yield_stress):
+		raise ValueError('the tensile strength must exceed the yield stress')
+	# The ratio falls from large values at n = 1 to 1 where necking starts at yield (n * ey = 1)
+	low = np.ones(yield_stress.shape)
+	high = young_modulus / yield_stress
+	for _ in range(iterations):
+		mid = np.sqrt(low * high)
+		above = uts_ratio(yield_stress, mid, young_modulus) > uts / yield_stress
+		low = np.where(above, mid, low)
+		high = np.where(above, high, mid)
+	return np.sqrt(low * high)
+
+
+def plastic_strains(yield_stress, max_strain=MAX_STRAIN, points=POINTS, young_modulus=YOUNG_MODULUS):
+	"""(..., points) plastic strains from 0 to max_strain - ey"""
+	end = max_strain - np.asarray(yield_stress, dtype=float) / young_modulus
+	return np.linspace(0.0, 1.0, points) * end[..., None]
+
+
+def power_law_tables(yield_stress, n, max_strain=MAX_STRAIN, points=POINTS, young_modulus=YOUNG_MODULUS):
+	"""(..., points, 2) tables of stress and plastic strain for arrays of yield stresses and exponents"""
+	yield_stress, n = np.broadcast_arrays(np.asarray(yield_stress, dtype=float), np.asarray(n, dtype=float))
+	strain = plastic_strains(yield_stress, max_strain, points, young_modulus)
+	stress = power_law(yield_stress[..., None], n[..., None], strain, young_modulus)
+	return np.stack((stress, strain), axis=-1)
+
+
+def grade_params(grade):
+	name = grade_name(grade)
+	if name not in GRADES:
+		raise ValueError('unknown grade {}, expected one of {}'.format(name,
+			', '.join('X{}'.format(g) for g in grades())))
+	return GRADES[name]
+
+
+def plastic_table(grade=None, yield_stress=None, uts=None, n=None, max_strain=MAX_STRAIN, points=POINTS,
+	young_modulus=YOUNG_MODULUS):
+	"""
+	((stress, plastic strain), ...) of a grade of the library, or of a power-law curve
+	given by yield_stress and n or uts. Tables are kept in TABLES by their parameters.
+	"""
+	if grade is not None:
+		params = grade_params(grade)
+		if 'table' in params:
+			return tuple(tuple(float(v) for v in row) for row in params['table'])
+		yield_stress, uts, n = params['yield'], params.get('uts'), params.get('n')
+	if yield_stress is None or (uts is None and n is None):
+		raise ValueError('give a grade, or a yield stress with a tensile strength or a hardening exponent')
+	if n is None:
+		n = float(hardening_exponent(yield_stress, uts, young_modulus))
+	key = tuple(round(float(v), KEY_DIGITS) for v in (yield_stress, n, max_strain, young_modulus)) + (points,)
+	if key not in TABLES:
+		table = power_law_tables(yield_stress, n, max_strain, points, young_modulus)
+		TABLES[key] = tuple(tuple(row) for row in table.tolist())
+	return TABLES[key]
@@ -0,0 +1,127 @@
+"""
+Early termination of the solves once the burst criterion is reached
+The scheduler asks the monitor about every running job on each poll. When the
+status file (.sta) of the job has grown, i.e. new increments have converged, the
+probe reads the peak values of the new increments and a BurstTracker checks them
+against the Mises criterion. At the first crossing the burst time is interpolated,
+stored in job.meta['burst'] and the job is terminated, so the last and most
+expensive nonlinear increments of Step-2 are never solved.
+
+Probes:
+ - OdbProbe: new frames of the output database while the job writes it
+ - TableProbe: peak values written by the solver as a text table, one increment per
+   line (step number, step time, peak Mises, peak PEEQ); the fake solver writes one
+"""
+############################################################################################################
+import os
+
+from pyburst.odb_post import BurstTracker, Frame, OdbFrameReader
+
+
+class Probe(object):
+	"""Returns the frames of a job written since the previous call"""
+
+	def new_frames(self, job):
+		raise NotImplementedError
+
+	def forget(self, job):
+		pass
+
+
+class OdbProbe(Probe):
+	"""Reads the frames of the running job's output database that have not been seen yet"""
+
+	def __init__(self, region='FLAW_REGION', variables=('S', 'PEEQ')):
+		self.region = region
+		self.variables = variables
+		self.seen = {}  # job name -> {step name: frames read}
+
+	def new_frames(self, job):
+		path = os.path.join(job.workdir, job.name + '.odb')
+		if not os.path.exists(path):
+			return []
+		seen = self.seen.setdefault(job.name, {})
+		reader = OdbFrameReader(path, self.variables, self.region)
+		frames = []
+		try:
+			for name in reader.odb.steps.keys():
+				step = reader.odb.steps[name]
+				for i in range(seen.get(name, 0), len(step.frames)):
+					frame = step.frames[i]
+					values = dict((var, reader.field_values(frame, var)) for var in self.variables
+						if var in frame.fieldOutputs.keys())
+					frames.append(Frame(name, i, frame.frameValue, values))
+				seen[name] = len(step.frames)
+		finally:
+			reader.close()
+		return frames
+
+	def forget(self, job):
+		self.seen.pop(job.name, None)
+
+
+class TableProbe(Probe):
+	"""Reads the new lines of <job>.mon: step number, step time, peak Mises, peak PEEQ"""
+
+	def __init__(self, extension='.mon'):
+		self.extension = extension
+		self.offsets = {}  # job name -> (bytes read, increments read)
+
+	def new_frames(self, job):
+		path = os.path.join(job.workdir, job.name + self.extension)
+		if not os.path.exists(path):
+			return []
+		offset, count = self.offsets.get(job.name, (0, 0))
+		frames = []
+		with open(path) as f:
+			f.seek(offset)
+			while True:
+				line = f.readline()
+				# A line without newline is still being written
+				if not line.endswith('\n'):
+					break
+				offset = f.tell()
+				fields = line.split()
+				if not fields or fields[0].startswith('#'):
+					continue
+				step, time, mises, peeq = int(fields[0]), float(fields[1]), float(fields[2]), float(fields[3])
+				count += 1
+				frames.append(Frame('Step-{}'.format(step), count, time, {'S': [mises], 'PEEQ': [peeq]}))
+		self.offsets[job.name] = (offset, count)
+		return frames
+
+	def forget(self, job):
+		self.offsets.pop(job.name, None)
+
+
+class BurstMonitor(object):
+	"""Tells the scheduler to stop a job once its flaw region reaches max_mises"""
+
+	def __init__(self, probe, max_mises):
+		self.probe = probe
+		self.max_mises = max_mises
+		self.trackers = {}  # job name -> (BurstTracker, size of the status file)
+
+	def check(self, job):
+		"""BurstResult when the job can be stopped, otherwise None"""
+		sta = os.path.join(job.workdir, job.name + '.sta')
+		try:
+			size = os.path.getsize(sta)
+		except OSError:
+			return None
+		tracker, last_size = self.trackers.get(job.name, (None, -1))
+		if tracker is None:
+			tracker = BurstTracker(self.max_mises)
+		self.trackers[job.name] = (tracker, size)
+		# The probe is only read once new increments have converged
+		if size == last_size:
+			return None
+		for frame in self.probe.new_frames(job):
+			if tracker.update(frame) is not None:
+				job.meta['burst'] = tracker.result
+				return tracker.result
+		return None
+
+	def forget(self, job):
+		self.trackers.pop(job.name, None)
+		self.probe.forget(job)
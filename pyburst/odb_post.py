@@ -0,0 +1,178 @@
+"""
+Streaming extraction of the burst time from the flaw region output
+The frames of the output database are walked one at a time and only the peak Mises
+stress and PEEQ of the flaw region are kept. The walk stops at the first frame where
+the peak Mises stress reaches the burst criterion, and the burst time is interpolated
+between that frame and the previous one.
+
+burst_time is the step time of the step in which the criterion is met. In Step-2 it
+is the fraction of the pressure ramp from pres_mag_1 to pres_mag_2, as used by the
+MATLAB scripts: pb = p_sim_1 + (p_sim_2 - p_sim_1) * burst_time.
+
+Frames come from a FrameReader, so the same code runs on an Abaqus ODB (odbAccess,
+only available inside Abaqus Python) or on NumPy frame data.
+"""
+############################################################################################################
+import json
+from collections import namedtuple
+
+import numpy as np
+
+from pyburst import material
+
+# Mises burst criteria (Pa) of the grades in data/materials.json, see material.burst_mises
+BURST_MISES = dict((grade, material.burst_mises(grade)) for grade in material.grades()
+	if material.burst_mises(grade) is not None)
+
+"""One output frame: step name, frame number, step time and flaw region values per variable"""
+Frame = namedtuple('Frame', ['step', 'index', 'time', 'values'])
+
+
+class BurstResult(namedtuple('BurstResult', ['burst', 'step', 'burst_time', 'frame', 'max_mises', 'max_peeq',
+	'frames_read'])):
+	"""Burst time and the peak values up to it; burst is False if the criterion was never met"""
+
+	def pressure(self, pres_mag_1, pres_mag_2, ramp_step='Step-2'):
+		"""Burst pressure from the burst time, the Step-1 pressure ramps from zero"""
+		if not self.burst:
+			return None
+		if self.step == ramp_step:
+			return pres_mag_1 + (pres_mag_2 - pres_mag_1) * self.burst_time
+		return pres_mag_1 * self.burst_time
+
+	def as_dict(self):
+		return dict(self._asdict())
+
+
+class FrameReader(object):
+	"""Yields Frame tuples in time order; values are arrays over the flaw region points"""
+
+	def frames(self):
+		raise NotImplementedError
+
+	def close(self):
+		pass
+
+
+class ArrayFrameReader(FrameReader):
+	"""Frames from NumPy data: steps is a list of (step name, times, {variable: (frames, points)})"""
+
+	def __init__(self, steps):
+		self.steps = steps
+
+	def frames(self):
+		for name, times, values in self.steps:
+			for i, time in enumerate(times):
+				yield Frame(name, i, float(time), dict((var, data[i]) for var, data in values.items()))
+
+
+class OdbFrameReader(FrameReader):
+	"""
+	Frames of an Abaqus output database, restricted to the flaw region
+	S is reduced to its Mises invariant; data are read as bulk blocks, one frame at a time.
+	"""
+
+	def __init__(self, path, variables=('S', 'PEEQ'), region='FLAW_REGION', steps=None):
+		from odbAccess import openOdb
+		self.odb = openOdb(path, readOnly=True)
+		self.variables = variables
+		self.steps = steps
+		sets = self.odb.rootAssembly.elementSets
+		self.region = sets[region] if region in sets.keys() else None
+
+	def field_values(self, frame, variable):
+		from abaqusConstants import MISES
+		field = frame.fieldOutputs[variable]
+		if self.region is not None:
+			field = field.getSubset(region=self.region)
+		if variable == 'S':
+			field = field.getScalarField(invariant=MISES)
+		blocks = field.bulkDataBlocks
+		if not blocks:
+			return np.zeros(0)
+		return np.concatenate([np.asarray(block.data).ravel() for block in blocks])
+
+	def frames(self):
+		names = self.steps or list(self.odb.steps.keys())
+		for name in names:
+			for i, frame in enumerate(self.odb.steps[name].frames):
+				values = dict((var, self.field_values(frame, var)) for var in self.variables
+					if var in frame.fieldOutputs.keys())
+				yield Frame(name, i, frame.frameValue, values)
+
+	def close(self):
+		self.odb.close()
+
+
+def peak(values, variable):
+	data = values.get(variable)
+	if data is None or len(data) == 0:
+		return 0.0
+	return float(np.max(data))
+
+
+class BurstTracker(object):
+	"""Takes frames one at a time and reports the burst as soon as the criterion is met"""
+
+	def __init__(self, max_mises):
+		self.max_mises = max_mises
+		self.previous = None  # (step, time, peak Mises) of the last frame
+		self.last = None
+		self.max_peeq = 0.0
+		self.count = 0
+		self.result = None
+
+	def update(self, frame):
+		"""BurstResult once the criterion is met, otherwise None"""
+		if self.result is not None:
+			return self.result
+		self.count += 1
+		mises = peak(frame.values, 'S')
+		self.max_peeq = max(self.max_peeq, peak(frame.values, 'PEEQ'))
+		if mises >= self.max_mises:
+			previous = self.previous
+			if previous is not None and previous[0] == frame.step and mises > previous[2]:
+				_, time_0, mises_0 = previous
+				time = time_0 + (self.max_mises - mises_0) / (mises - mises_0) * (frame.time - time_0)
+			else:
+				# First frame of a step: the step starts from the end of the previous one
+				time = frame.time
+			self.result = BurstResult(True, frame.step, time, frame.index, mises, self.max_peeq, self.count)
+			return self.result
+		self.previous = (frame.step, frame.time, mises)
+		self.last = (frame, mises)
+		return None
+
+	def finish(self):
+		"""Result after the last frame, burst is False if the criterion was never met"""
+		if self.result is not None:
+			return self.result
+		if self.last is None:
+			return BurstResult(False, None, None, None, 0.0, 0.0, 0)
+		frame, mises = self.last
+		return BurstResult(False, frame.step, None, frame.index, mises, self.max_peeq, self.count)
+
+
+def find_burst(reader, max_mises):
+	"""Walk the frames until the peak Mises stress reaches max_mises"""
+	tracker = BurstTracker(max_mises)
+	for frame in reader.frames():
+		if tracker.update(frame) is not None:
+			break
+	return tracker.finish()
+
+
+def extract_burst(path, max_mises, region='FLAW_REGION'):
+	"""Burst result of an Abaqus output database"""
+	reader = OdbFrameReader(path, region=region)
+	try:
+		return find_burst(reader, max_mises)
+	finally:
+		reader.close()
+
+
+def write_result(path, result, **extra):
+	record = result.as_dict()
+	record.update(extra)
+	with open(path, 'w') as f:
+		json.dump(record, f, sort_keys=True)
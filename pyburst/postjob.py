@@ -0,0 +1,232 @@
+"""
+Post-job cleanup of the solver files, off the critical path
+A finished job leaves scratch files (.abq, .mdl, .pac, .stt, .prt, .res, .sim, .dat)
+and its output database. Cleanup hands each job to a background worker that removes
+the scratch files and, optionally, compacts the flaw region output of the ODB into
+<folder>/<job>_flaw.npz before removing the ODB. The compact file keeps, per frame,
+the step, frame number, step time and the Mises stress and PEEQ at every point of
+the flaw region (float32, compressed), so the burst time can be re-extracted with
+another criterion:
+
+    odb_post.find_burst(CompactFrameReader('burst_pressure/<job>_flaw.npz'), max_mises)
+
+Reading an ODB needs odbAccess, so by default the compaction runs in a separate
+Abaqus Python process:
+
+    abaqus python pyburst/postjob.py compact <job>.odb <job>_flaw.npz [--region FLAW_REGION]
+
+The ODB is only removed once the compaction has succeeded and written its compact file.
+"""
+############################################################################################################
+import os
+import sys
+import time
+import argparse
+import subprocess
+import threading
+from collections import deque
+
+import numpy as np
+
+if __name__ == '__main__' and __package__ is None:
+	# Run as a file by abaqus python: make the package importable
+	sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyburst.odb_post import Frame, FrameReader, OdbFrameReader
+
+SCRATCH_EXTENSIONS = ('.abq', '.mdl', '.pac', '.stt', '.prt', '.res', '.sim', '.dat')
+
+# Variables kept in the compact file, under their ODB names
+COMPACT_VARIABLES = ('S', 'PEEQ')
+
+
+def remove_files(paths):
+	"""Remove the files that exist, on any platform; returns the bytes freed"""
+	freed = 0
+	for path in paths:
+		try:
+			size = os.path.getsize(path)
+			os.remove(path)
+			freed += size
+		except OSError:
+			# Missing, or still locked by a solver process on Windows
+			pass
+	return freed
+
+
+def scratch_files(name, workdir='.', extensions=SCRATCH_EXTENSIONS):
+	return [os.path.join(workdir, name + ext) for ext in extensions]
+
+
+def compact(reader, path):
+	"""Write the frames of a reader to a compressed .npz; returns the number of frames"""
+	steps, step_index, index, times = [], [], [], []
+	values = dict((var, []) for var in COMPACT_VARIABLES)
+	for frame in reader.frames():
+		if frame.step not in steps:
+			steps.append(frame.step)
+		step_index.append(steps.index(frame.step))
+		index.append(frame.index)
+		times.append(frame.time)
+		for var in COMPACT_VARIABLES:
+			values[var].append(np.asarray(frame.values.get(var, ()), dtype=np.float32))
+	arrays = {'steps': np.array(steps, dtype=str), 'step_index': np.array(step_index, dtype=np.int16),
+		'index': np.array(index, dtype=np.int32), 'time': np.array(times, dtype=float)}
+	for var, frames in values.items():
+		# The region has the same points in every frame; frames without output are padded with NaN
+		points = max([len(v) for v in frames] + [0])
+		data = np.full((len(frames), points), np.nan, dtype=np.float32)
+		for i, v in enumerate(frames):
+			data[i, :len(v)] = v
+		arrays[var] = data
+	tmp = path + '.tmp.npz'
+	np.savez_compressed(tmp, **arrays)
+	os.replace(tmp, path)
+	return len(times)
+
+
+def compact_odb(odb_path, path, region='FLAW_REGION'):
+	"""Compact the flaw region output of an ODB (needs odbAccess)"""
+	reader = OdbFrameReader(odb_path, variables=COMPACT_VARIABLES, region=region)
+	try:
+		return compact(reader, path)
+	finally:
+		reader.close()
+
+
+class CompactFrameReader(FrameReader):
+	"""Frames of a compact file, in the order they were written"""
+
+	def __init__(self, path):
+		with np.load(path) as data:
+			self.data = dict((name, data[name]) for name in data.files)
+
+	def frames(self):
+		steps = self.data['steps']
+		for i in range(len(self.data['time'])):
+			values = dict((var, self.data[var][i][~np.isnan(self.data[var][i])]) for var in COMPACT_VARIABLES
+				if var in self.data)
+			yield Frame(str(steps[self.data['step_index'][i]]), int(self.data['index'][i]),
+				float(self.data['time'][i]), values)
+
+
+def compact_command(odb_path, path, region='FLAW_REGION', executable=('abaqus', 'python')):
+	cmd = list(executable) + [os.path.abspath(__file__), 'compact', odb_path, path, '--region', region]
+	if os.name == 'nt' and executable[0] == 'abaqus':
+		# abaqus is a batch file on Windows
+		cmd = ['cmd', '/c'] + cmd
+	return cmd
+
+
+class Cleanup(object):
+	"""
+	Background worker threads removing the files of finished jobs, see the module docstring
+	executable runs the compaction (None compacts in the worker thread, which needs
+	odbAccess in this process). With a StageLog in stages each job adds a cleanup line
+	with the bytes freed and the size of its compact file.
+	"""
+
+	def __init__(self, folder='burst_pressure', workers=2, compact_output=True, keep_odb=False,
+		region='FLAW_REGION', executable=('abaqus', 'python'), stages=None):
+		self.folder = folder
+		self.compact_output = compact_output
+		self.keep_odb = keep_odb
+		self.region = region
+		self.executable = executable
+		self.stages = stages
+		self.queue = deque()
+		self.errors = []
+		self.lock = threading.Condition()
+		self.closed = False
+		self.threads = [threading.Thread(target=self.work) for _ in range(workers)]
+		for thread in self.threads:
+			thread.daemon = True
+			thread.start()
+
+	def submit(self, name, workdir='.'):
+		with self.lock:
+			self.queue.append((name, workdir))
+			self.lock.notify()
+
+	def work(self):
+		while True:
+			with self.lock:
+				while not self.queue and not self.closed:
+					self.lock.wait()
+				if not self.queue:
+					return
+				name, workdir = self.queue.popleft()
+			try:
+				self.clean(name, workdir)
+			except Exception as error:
+				self.errors.append((name, error))
+
+	def compact_path(self, name):
+		return os.path.join(self.folder, name + '_flaw.npz')
+
+	def clean(self, name, workdir='.'):
+		"""Remove the scratch files of a job, compact its ODB and remove it; returns the bytes freed"""
+		start = time.time()
+		freed = remove_files(scratch_files(name, workdir))
+		odb = os.path.join(workdir, name + '.odb')
+		out = self.compact_path(name)
+		size = None
+		error = None
+		if self.compact_output and os.path.exists(odb):
+			if not os.path.isdir(self.folder):
+				try:
+					os.makedirs(self.folder)
+				except OSError:
+					pass
+			# A compact file left by an earlier job of the same name must not pass for this one
+			remove_files([out])
+			try:
+				if self.executable is None:
+					compact_odb(odb, out, self.region)
+				else:
+					returncode = subprocess.call(compact_command(os.path.abspath(odb), os.path.abspath(out),
+						self.region, self.executable), cwd=workdir)
+					if returncode != 0:
+						error = RuntimeError('compaction of {} exited with {}'.format(odb, returncode))
+			except Exception as exc:
+				error = exc
+			if error is None and os.path.exists(out):
+				size = os.path.getsize(out)
+		if not self.keep_odb and (size is not None or not self.compact_output):
+			freed += remove_files([odb])
+		if self.stages is not None:
+			self.stages.record(name, 'cleanup', time.time() - start, start=start, freed_mb=freed / 1048576.0,
+				compact_mb=None if size is None else size / 1048576.0)
+		if error is not None:
+			# The ODB is kept; close() reports the job
+			raise error
+		return freed
+
+	def close(self):
+		"""Wait for the queued jobs; returns the (job, error) of the jobs that failed"""
+		with self.lock:
+			self.closed = True
+			self.lock.notify_all()
+		for thread in self.threads:
+			thread.join()
+		return self.errors
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(prog='postjob.py', description=__doc__.split('\n')[1])
+	commands = parser.add_subparsers(dest='command')
+	command = commands.add_parser('compact', help='compact the flaw region output of an ODB')
+	command.add_argument('odb')
+	command.add_argument('output', help='.npz file')
+	command.add_argument('--region', default='FLAW_REGION', help='element set of the flaw region')
+	args = parser.parse_args(argv)
+	if args.command == 'compact':
+		frames = compact_odb(args.odb, args.output, args.region)
+		sys.stdout.write('{} frames written to {}\n'.format(frames, args.output))
+	else:
+		parser.print_help()
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,308 @@
+"""
+Monte Carlo probability of burst below the MAOP for every reported flaw
+Each flaw of an inspection list is sampled around its reported sizes: measurement
+error on every flaw dimension (normal, absolute standard deviations), scatter of the
+wall thickness, yield stress and tensile strength (normal, coefficients of
+variation). Every sample goes through a burst pressure model (a coefficient set of
+pyburst.equations, a pyburst.surrogate model or a pyburst.lookup table):
+
+    p_burst = pb * p0,  p0 = 2 t sigma_f / (D - t)
+
+with sigma_f the tensile strength (or the mean of yield and tensile strength with
+flow='mean'); with p_ref the intact burst pressure of the nominal pipe is given
+instead of Barlow's, and scaled with the sampled t and sigma_f. A sample fails when
+p_burst < maop, or when the model has no pb for it (e.g. a ligament sampled below
+zero). Out-of-range samples are counted and reported, not dropped.
+
+The draws of a flaw come from its own counter-based stream, Philox keyed on (seed,
+record number), so the probabilities do not depend on the chunk size or the number
+of worker processes. With shift > 0 the samples are drawn by importance sampling:
+the standard normal variates are centred at distance shift from the mean, along the
+unit direction towards the failure side (larger cracks and losses, smaller
+ligaments, thickness and strength) over the variates that scatter (the yield stress
+only with flow='mean'), and weighted by their likelihood ratio. This resolves
+probabilities far below 1 / samples; shift is best about the reliability index
+-Phi^-1(pof) of the flaws of interest (3 for 1e-3, 4 for 3e-5).
+
+    python -m pyburst.reliability flaws.csv pof.csv --flaw cw --t 15 --D 240 --grade 65 --maop 12
+        --size-sd 0.5 --t-cov 0.03 --uts-cov 0.04 --samples 100000 --shift 3
+
+writes record, pof, its standard error and the out-of-range share per flaw, chunk by
+chunk in input order (CSV only; the input is read as by pyburst.assess). With a
+shift, the out-of-range share comes from the same variates before the shift, which
+costs a second model evaluation.
+"""
+############################################################################################################
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+from collections import deque
+
+import numpy as np
+
+from pyburst import equations, material
+from pyburst.assess import FLAW_COLUMNS, get_model, needed_columns, csv_chunks, parse_csv, require_coefficients
+
+# Sign of the variate that makes each flaw dimension more severe
+DIRECTIONS = {'cw': (1, 1, -1), 'cc': (1, 1, -1, -1)}
+SCATTER = ('t', 'yield', 'uts')  # variates after the flaw dimensions, all worse when lower
+FLOWS = ('uts', 'mean')
+BLOCK = 1 << 20  # samples evaluated at once
+MIN_SIZE = 1e-6  # sampled sizes are kept above this share of t
+
+
+def stream(seed, record):
+	"""Generator of one flaw: Philox keyed on the seed and the record number"""
+	return np.random.Generator(np.random.Philox(key=(int(record) << 64) | (int(seed) & 0xFFFFFFFFFFFFFFFF)))
+
+
+class Uncertainty(object):
+	"""
+	Scatter of the inputs: size_sd, standard deviations of the flaw dimensions (one
+	value or one per column, in the unit of the flaw list), and the coefficients of
+	variation of t, the yield stress and the tensile strength
+	"""
+
+	def __init__(self, size_sd=0.0, t_cov=0.0, yield_cov=0.0, uts_cov=0.0):
+		self.size_sd = size_sd
+		self.t_cov = float(t_cov)
+		self.yield_cov = float(yield_cov)
+		self.uts_cov = float(uts_cov)
+
+	def size_sds(self, flaw):
+		sd = np.broadcast_to(np.asarray(self.size_sd, dtype=float), (len(FLAW_COLUMNS[flaw]),))
+		if np.any(sd < 0):
+			raise ValueError('standard deviations cannot be negative')
+		return sd
+
+
+class MonteCarlo(object):
+	"""
+	P(p_burst < maop) of the flaws of one type, see the module docstring
+	yield_stress and uts are nominal strengths in MPa (from the grade when given), maop
+	and p_ref in MPa.
+	"""
+
+	def __init__(self, model, flaw, maop, uncertainty, grade=None, yield_stress=None, uts=None, p_ref=None,
+		flow='uts', samples=10000, shift=0.0, seed=0, block=BLOCK):
+		self.model = get_model(model) if isinstance(model, str) else model
+		if self.model.flaw != flaw:
+			raise ValueError('the {} flaws need a {} model, got {!r}'.format(flaw, flaw, self.model))
+		if isinstance(self.model, equations.CoefficientSet):
+			equations.complete_set(self.model)
+		if flow not in FLOWS:
+			raise ValueError('unknown flow stress {!r}, expected one of {}'.format(flow, ', '.join(FLOWS)))
+		if grade is not None:
+			nominal = material.strengths(grade)
+			yield_stress = nominal[0] / 1e6 if yield_stress is None else yield_stress
+			uts = nominal[1] / 1e6 if uts is None else uts
+		if uts is None or (flow == 'mean' and yield_stress is None):
+			raise ValueError('give a grade or the nominal strengths')
+		self.flaw = flaw
+		self.maop = float(maop)
+		self.uncertainty = uncertainty
+		self.sd = uncertainty.size_sds(flaw)
+		self.yield_stress = yield_stress
+		self.uts = float(uts)
+		self.p_ref = p_ref
+		self.flow = flow
+		self.samples = int(samples)
+		self.seed = seed
+		self.block = block
+		self.mu = float(shift) * self.failure_direction()
+
+	def failure_direction(self):
+		"""Unit vector towards failure over the variates that scatter, zero if none does"""
+		u = self.uncertainty
+		active = list(self.sd > 0) + [u.t_cov > 0, u.yield_cov > 0 and self.flow == 'mean', u.uts_cov > 0]
+		direction = np.array(list(DIRECTIONS[self.flaw]) + [-1] * len(SCATTER), dtype=float) * active
+		norm = np.sqrt(np.dot(direction, direction))
+		return direction / norm if norm > 0 else direction
+
+	def flow_stress(self, yield_stress, uts):
+		return uts if self.flow == 'uts' else 0.5 * (yield_stress + uts)
+
+	def evaluate(self, columns, t, D):
+		if isinstance(self.model, equations.CoefficientSet):
+			return equations.evaluate(self.model, columns, t, D)
+		return self.model.evaluate(columns, t, D)
+
+	def inputs(self, z, sizes, t, D):
+		"""Sampled flaw dimensions, t, D and flow stress of the standard normal variates z (flaws, size, k)"""
+		m = len(self.sd)
+		u = self.uncertainty
+		ts = t[:, None] * (1 + u.t_cov * z[..., m])
+		ts = np.maximum(ts, MIN_SIZE * t[:, None])
+		dims = [np.maximum(sizes[:, i, None] + self.sd[i] * z[..., i], MIN_SIZE * t[:, None]) for i in range(m)]
+		uts = self.uts * (1 + u.uts_cov * z[..., m + 2])
+		ys = None if self.yield_stress is None else self.yield_stress * (1 + u.yield_cov * z[..., m + 1])
+		return dims, ts, np.broadcast_to(D[:, None], ts.shape), self.flow_stress(ys, uts)
+
+	def draw(self, generators, size, sizes, t, D):
+		"""Failure indicator times weight, and out-of-range mask, of one block of samples per flaw"""
+		k = len(self.mu)
+		z = np.stack([g.standard_normal((size, k)) for g in generators])  # (flaws, size, k)
+		if self.mu.any():
+			# The out-of-range share is counted on the unshifted variates, weighting it is too noisy
+			dims, ts, Ds, sigma = self.inputs(z, sizes, t, D)
+			flags = self.evaluate([d.ravel() for d in dims], ts.ravel(), Ds.ravel())[1]
+			out = (flags.reshape(ts.shape) & 0x7F) != 0
+			z += self.mu
+			weight = np.exp(-np.dot(z, self.mu) + 0.5 * np.dot(self.mu, self.mu))
+		else:
+			out = None
+			weight = np.ones(z.shape[:2])
+		dims, ts, Ds, sigma = self.inputs(z, sizes, t, D)
+		pb, flags = self.evaluate([d.ravel() for d in dims], ts.ravel(), Ds.ravel())
+		pb = pb.reshape(ts.shape)
+		if self.p_ref is None:
+			p0 = 2 * ts * sigma / (Ds - ts)
+		else:
+			nominal = t / (D - t) * self.flow_stress(self.yield_stress, self.uts)
+			p0 = self.p_ref * ts / (Ds - ts) * sigma / nominal[:, None]
+		with np.errstate(invalid='ignore'):
+			fail = ~(pb * p0 >= self.maop)
+		if out is None:
+			out = (flags.reshape(ts.shape) & 0x7F) != 0
+		return fail * weight, out
+
+	def chunk(self, start, sizes, t, D):
+		"""pof, standard error and out-of-range share of flaws start, start + 1, ... (sizes (flaws, dims))"""
+		sizes = np.asarray(sizes, dtype=float)
+		n = len(sizes)
+		t = np.broadcast_to(np.asarray(t, dtype=float), (n,))
+		D = np.broadcast_to(np.asarray(D, dtype=float), (n,))
+		total = np.zeros(n)
+		squares = np.zeros(n)
+		out = np.zeros(n)
+		flaws = max(1, self.block // self.samples)
+		for first in range(0, n, flaws):
+			rows = slice(first, min(first + flaws, n))
+			generators = [stream(self.seed, start + i) for i in range(rows.start, rows.stop)]
+			size = min(self.samples, self.block)
+			for done in range(0, self.samples, size):
+				m = min(size, self.samples - done)
+				value, out_of_range = self.draw(generators, m, sizes[rows], t[rows], D[rows])
+				total[rows] += value.sum(axis=1)
+				squares[rows] += (value * value).sum(axis=1)
+				out[rows] += out_of_range.sum(axis=1)
+		pof = total / self.samples
+		var = np.maximum(squares / self.samples - pof * pof, 0.0) / max(self.samples - 1, 1)
+		return pof, np.sqrt(var), out / self.samples
+
+
+"""Per-process engine of the pool workers, set by init_worker"""
+WORKER = {}
+
+
+def init_worker(settings):
+	if settings.get('coefficients'):
+		equations.COEFFICIENTS.update(equations.load_coefficients(settings['coefficients']))
+	WORKER['engine'] = MonteCarlo(**settings['engine'])
+	WORKER['settings'] = settings
+
+
+def reliability_chunk(task):
+	"""Worker: parse a chunk of CSV lines, run it and format the output"""
+	start, lines = task
+	settings = WORKER['settings']
+	columns = parse_csv(lines, settings['header'], settings['needed'], ',')
+	flaw = settings['engine']['flaw']
+	sizes = np.column_stack([columns[name] for name in FLAW_COLUMNS[flaw]])
+	t = settings['t'] if settings['t'] is not None else columns['t']
+	D = settings['D'] if settings['D'] is not None else columns['D']
+	pof, se, out = WORKER['engine'].chunk(start, sizes, t, D)
+	records = range(start, start + len(pof))
+	ids = columns.get('id')
+	if ids is None:
+		rows = zip(records, pof.tolist(), se.tolist(), out.tolist())
+	else:
+		rows = zip(records, ids.tolist(), pof.tolist(), se.tolist(), out.tolist())
+	return len(pof), ''.join(','.join(str(v) if isinstance(v, str) else repr(v) for v in row) + '\n'
+		for row in rows)
+
+
+def run(args):
+	engine = {'model': args.cw_coeffs if args.flaw == 'cw' else args.cc_coeffs, 'flaw': args.flaw,
+		'maop': args.maop, 'uncertainty': Uncertainty([float(v) for v in args.size_sd.split(',')], args.t_cov,
+		args.yield_cov, args.uts_cov), 'grade': args.grade, 'yield_stress': args.yield_stress, 'uts': args.uts,
+		'p_ref': args.p_ref, 'flow': args.flow, 'samples': args.samples, 'shift': args.shift, 'seed': args.seed}
+	header, chunks = csv_chunks(args.input, args.chunk)
+	settings = {'engine': engine, 'header': header, 'needed': needed_columns(args, header), 't': args.t,
+		'D': args.D, 'coefficients': args.coefficients}
+	# Fail early on a bad model or strengths, before starting the pool
+	init_worker(settings)
+	out = open(args.output, 'w')
+	out.write('record,' + ('id,' if args.id else '') + 'pof,se,out_of_range\n')
+	processes = args.processes or multiprocessing.cpu_count()
+	begin = time.time()
+	total = 0
+	pool = multiprocessing.Pool(processes, init_worker, (settings,)) if processes > 1 else None
+	pending = deque()
+	try:
+		for task in chunks:
+			pending.append(reliability_chunk(task) if pool is None else pool.apply_async(reliability_chunk, (task,)))
+			while pending and (len(pending) >= 2 * processes or pool is None):
+				item = pending.popleft()
+				n, text = item if pool is None else item.get()
+				out.write(text)
+				out.flush()
+				total += n
+		while pending:
+			n, text = pending.popleft().get()
+			out.write(text)
+			total += n
+	finally:
+		if pool is not None:
+			pool.close()
+			pool.join()
+		out.close()
+	elapsed = time.time() - begin
+	sys.stderr.write('{} flaws x {} samples in {:.2f} s ({:.3g} samples/s, {} processes)\n'.format(
+		total, args.samples, elapsed, total * args.samples / elapsed if elapsed > 0 else 0.0, processes))
+	return total
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(prog='python -m pyburst.reliability', description=__doc__.split('\n')[1])
+	parser.add_argument('input', help='flaw list (.csv), columns as for pyburst.assess')
+	parser.add_argument('output', help='probabilities (.csv)')
+	parser.add_argument('--flaw', required=True, choices=sorted(FLAW_COLUMNS), help='flaw type of all records')
+	parser.add_argument('--maop', type=float, required=True, help='maximum allowable operating pressure (MPa)')
+	parser.add_argument('--t', type=float, help='nominal wall thickness of all records (default: t column)')
+	parser.add_argument('--D', type=float, help='outer diameter of all records (default: D column)')
+	parser.add_argument('--grade', help='steel grade giving the nominal strengths, e.g. 65')
+	parser.add_argument('--yield-stress', type=float, help='nominal yield stress (MPa)')
+	parser.add_argument('--uts', type=float, help='nominal tensile strength (MPa)')
+	parser.add_argument('--flow', choices=FLOWS, default='uts', help='flow stress of the intact burst pressure')
+	parser.add_argument('--p-ref', type=float, help='intact burst pressure of the nominal pipe (MPa)')
+	parser.add_argument('--size-sd', default='0', help='standard deviation of the flaw sizes, one or one per column')
+	parser.add_argument('--t-cov', type=float, default=0.0, help='coefficient of variation of t')
+	parser.add_argument('--yield-cov', type=float, default=0.0, help='coefficient of variation of the yield stress')
+	parser.add_argument('--uts-cov', type=float, default=0.0, help='coefficient of variation of the tensile strength')
+	parser.add_argument('--samples', type=int, default=10000, help='samples per flaw')
+	parser.add_argument('--shift', type=float, default=0.0, help='importance sampling shift (standard deviations, about the reliability index)')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--cw-coeffs', default='CW_allTD', help='coefficient set or surrogate (.npz) of the CW records')
+	parser.add_argument('--cc-coeffs', default='CC_allTD', help='coefficient set or surrogate (.npz) of the CC records')
+	parser.add_argument('--coefficients', help='coefficient file (see equations.save_coefficients)')
+	parser.add_argument('--map', action='append', default=[], metavar='NAME=COLUMN',
+		help='read variable NAME from COLUMN')
+	parser.add_argument('--id', help='column copied to the output to identify the records')
+	parser.add_argument('--chunk', type=int, default=1 << 12, help='flaws per chunk')
+	parser.add_argument('--processes', type=int, help='worker processes (default: all cores)')
+	args = parser.parse_args(argv)
+	if not os.path.exists(args.input):
+		parser.error('no such file: {}'.format(args.input))
+	require_coefficients(parser, args.coefficients, [getattr(args, args.flaw + '_coeffs')])
+	try:
+		run(args)
+	except (ValueError, KeyError) as error:
+		parser.exit(1, 'error: {}\n'.format(error.args[0] if error.args else error))
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
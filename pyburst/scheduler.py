@@ -0,0 +1,232 @@
+"""
+Concurrent job scheduler for the DOE sweeps
+Jobs are queued as Abaqus input files and started through a solver backend while
+the number of jobs in flight, the CPUs and the memory in use stay within budget.
+
+The CAE scripts write the input file of a case, submit it here and call step(),
+so the pre-processing of the next case overlaps with the solves already running.
+An optional monitor (see monitor.py) can stop a running job once it has its result.
+"""
+############################################################################################################
+import os
+import sys
+import json
+import time
+import subprocess
+from collections import deque, namedtuple
+
+"""Result of a finished job: return code 0 means the solver completed"""
+JobResult = namedtuple('JobResult', ['job', 'returncode', 'start', 'end'])
+
+
+def abaqus_tokens(cpus):
+	"""Abaqus licence tokens of a job on cpus cores, int(5 * cpus^0.422)"""
+	return int(5 * cpus ** 0.422)
+
+
+class Job(object):
+	"""A single solver job: input deck plus its CPU and memory budget"""
+
+	def __init__(self, name, input_file, cpus=16, memory_mb=None, workdir='.', meta=None):
+		self.name = name
+		self.input_file = input_file
+		self.cpus = cpus
+		self.memory_mb = memory_mb  # None lets the solver pick, counts as zero in the budget
+		self.workdir = workdir
+		self.meta = meta if meta is not None else {}
+
+	def __repr__(self):
+		return 'Job({!r}, cpus={}, memory_mb={})'.format(self.name, self.cpus, self.memory_mb)
+
+
+class SolverBackend(object):
+	"""Starts, polls and kills solver processes; subclass to plug in another solver"""
+
+	def command(self, job):
+		raise NotImplementedError
+
+	def start(self, job):
+		log = open(os.path.join(job.workdir, job.name + '.log'), 'w')
+		try:
+			return subprocess.Popen(self.command(job), cwd=job.workdir, stdout=log,
+				stderr=subprocess.STDOUT)
+		finally:
+			log.close()
+
+	def poll(self, handle):
+		"""Return None while running, otherwise the return code"""
+		return handle.poll()
+
+	def kill(self, handle):
+		if handle.poll() is None:
+			handle.kill()
+			handle.wait()
+
+	def terminate(self, job, handle):
+		"""Stop a job that has its result, the solver output written so far is kept"""
+		self.kill(handle)
+
+
+class AbaqusBackend(SolverBackend):
+	"""Runs the Abaqus/Standard solver on an input file in interactive (blocking) mode"""
+
+	def __init__(self, executable='abaqus', mp_mode='threads', extra_args=()):
+		self.executable = executable
+		self.mp_mode = mp_mode
+		self.extra_args = list(extra_args)
+
+	def command(self, job):
+		inp = os.path.splitext(os.path.basename(job.input_file))[0]
+		cmd = [self.executable, 'job=' + job.name, 'input=' + inp,
+			'cpus=' + str(job.cpus), 'mp_mode=' + self.mp_mode]
+		if job.memory_mb:
+			cmd.append('memory=' + str(int(job.memory_mb)) + ' mb')
+		cmd += self.extra_args + ['interactive', 'ask_delete=OFF']
+		if os.name == 'nt':
+			# abaqus is a batch file on Windows
+			cmd = ['cmd', '/c'] + cmd
+		return cmd
+
+	def terminate(self, job, handle, timeout=60.0):
+		# Killing the driver would leave the solver process running, ask Abaqus to stop the job
+		cmd = [self.executable, 'terminate', 'job=' + job.name]
+		if os.name == 'nt':
+			cmd = ['cmd', '/c'] + cmd
+		subprocess.call(cmd, cwd=job.workdir)
+		deadline = time.time() + timeout
+		while handle.poll() is None and time.time() < deadline:
+			time.sleep(0.5)
+		self.kill(handle)
+
+
+"""
+Stand-in solver: writes a status file and a result file like Abaqus does. With a list of
+increments (step, step time, peak Mises, peak PEEQ) it spreads them over the duration and
+also writes the peak values to <name>.mon, for testing the burst monitor.
+"""
+FAKE_SOLVER = r'''
+import sys, time, json
+name, duration, rc, increments = sys.argv[1], float(sys.argv[2]), int(sys.argv[3]), json.loads(sys.argv[4])
+sta = open(name + '.sta', 'w')
+sta.write(' STEP  INC ATT SEVERE EQUIL TOTAL  TOTAL      STEP       INC OF\n')
+mon = open(name + '.mon', 'w') if increments else None
+for i, (step, step_time, mises, peeq) in enumerate(increments):
+	time.sleep(duration / len(increments))
+	mon.write('{} {!r} {!r} {!r}\n'.format(step, step_time, mises, peeq))
+	mon.flush()
+	sta.write('{:6d}{:6d}   1     0     1     1  {:<10.4g} {:<10.4g} 0.01\n'.format(step, i + 1, i + 1.0, step_time))
+	sta.flush()
+if not increments:
+	time.sleep(duration)
+sta.write(' THE ANALYSIS HAS COMPLETED SUCCESSFULLY\n' if rc == 0 else ' THE ANALYSIS HAS NOT BEEN COMPLETED\n')
+sta.close()
+with open(name + '.odb', 'w') as f:
+	f.write(open(sys.argv[5]).read() if len(sys.argv) > 5 else '')
+sys.exit(rc)
+'''
+
+
+class FakeSolverBackend(SolverBackend):
+	"""Runs a local Python process instead of Abaqus, for dry runs of the scheduling"""
+
+	def __init__(self, duration=1.0, returncode=0):
+		self.duration = duration
+		self.returncode = returncode
+
+	def command(self, job):
+		duration = job.meta.get('duration', self.duration)
+		returncode = job.meta.get('returncode', self.returncode)
+		increments = job.meta.get('increments', [])
+		cmd = [sys.executable, '-c', FAKE_SOLVER, job.name, str(duration), str(returncode), json.dumps(increments)]
+		if os.path.exists(os.path.join(job.workdir, job.input_file)):
+			cmd.append(job.input_file)
+		return cmd
+
+
+class Scheduler(object):
+	"""
+	Work queue that keeps up to max_jobs jobs in flight
+	A job is admitted when its CPUs and memory fit in what is left of total_cpus and
+	total_memory_mb. A job larger than the whole budget still runs, but alone.
+	A job stopped by the monitor finishes with return code 0. With an admission
+	controller (see admission.py) the controller sizes each submitted job and decides
+	what fits instead, and learns from the finished jobs.
+	"""
+
+	def __init__(self, backend, max_jobs=4, total_cpus=None, total_memory_mb=None,
+		poll_interval=1.0, on_finish=None, monitor=None, admission=None):
+		self.backend = backend
+		self.max_jobs = max_jobs
+		self.total_cpus = total_cpus
+		self.total_memory_mb = total_memory_mb
+		self.poll_interval = poll_interval
+		self.on_finish = on_finish
+		self.monitor = monitor
+		self.admission = admission
+		self.queue = deque()
+		self.running = {}  # job name -> (job, handle, start time)
+		self.results = []
+
+	def submit(self, job):
+		if self.admission is not None:
+			self.admission.prepare(job)
+		self.queue.append(job)
+
+	def cpus_in_use(self):
+		return sum(job.cpus for job, _, _ in self.running.values())
+
+	def memory_in_use(self):
+		return sum(job.memory_mb or 0 for job, _, _ in self.running.values())
+
+	def fits(self, job):
+		if self.admission is not None:
+			return self.admission.fits(job, [running for running, _, _ in self.running.values()])
+		if not self.running:
+			return True
+		if len(self.running) >= self.max_jobs:
+			return False
+		if self.total_cpus is not None and self.cpus_in_use() + job.cpus > self.total_cpus:
+			return False
+		if self.total_memory_mb is not None and \
+			self.memory_in_use() + (job.memory_mb or 0) > self.total_memory_mb:
+			return False
+		return True
+
+	def step(self):
+		"""Reap finished jobs and start queued ones that fit, without blocking"""
+		for name in list(self.running):
+			job, handle, start = self.running[name]
+			returncode = self.backend.poll(handle)
+			if returncode is None:
+				if self.monitor is None or self.monitor.check(job) is None:
+					continue
+				self.backend.terminate(job, handle)
+				returncode = 0
+			del self.running[name]
+			if self.monitor is not None:
+				self.monitor.forget(job)
+			result = JobResult(job, returncode, start, time.time())
+			self.results.append(result)
+			if self.admission is not None:
+				self.admission.observe(result)
+			if self.on_finish is not None:
+				self.on_finish(result)
+		# Jobs start in submission order, a large job at the head waits for room
+		while self.queue and self.fits(self.queue[0]):
+			job = self.queue.popleft()
+			self.running[job.name] = (job, self.backend.start(job), time.time())
+		return bool(self.queue or self.running)
+
+	def run(self):
+		"""Block until the queue is drained and every job has finished"""
+		while self.step():
+			time.sleep(self.poll_interval)
+		return self.results
+
+	def cancel(self):
+		"""Drop the queue and kill the running jobs"""
+		self.queue.clear()
+		for job, handle, start in list(self.running.values()):
+			self.backend.kill(handle)
+			self.results.append(JobResult(job, None, start, time.time()))
+		self.running.clear()
@@ -0,0 +1,301 @@
+"""
+Columnar store of the simulation results
+One directory holds every finished case of every sweep: one .npy file per column,
+opened as a memory map, and schema.json with the column types and the row count.
+Columns are addressed by name instead of by position in the .mat tables, rows are
+appended as jobs finish, and queries read only the columns they filter on, block by
+block, before gathering the requested columns for the matching rows.
+
+Several processes can append to one store (the scripts, the sweep runner, the
+coordinator of pyburst.distributed): every append holds an exclusive lock on
+<root>/lock while it re-reads the row count, writes its rows and publishes the new
+count.
+
+Lengths are in mm and pressures in MPa, as in the summary files and the MATLAB
+scripts. pb is the burst pressure over the pressure of the pipe without flaw of its
+configuration and grade (pb_ref_MPa of the coefficient sets, reference_pressure).
+Geometry columns that do not apply to a flaw type are NaN (height and length_2 of
+CC and CW cases respectively, lig_3 of CW cases). For CW cases length_1 is the
+crack length.
+"""
+############################################################################################################
+import os
+import json
+import time
+
+import numpy as np
+
+from pyburst import equations
+from pyburst.cache import atomic_write
+
+SCHEMA = (
+	('flaw', 'S2'),  # cw or cc
+	('config', 'S4'),  # pipe configuration: sTsD, sTbD, bTsD, bTbD
+	('grade', 'i2'),  # steel grade X..
+	('index', 'i8'),  # case index in the DOE of the sweep
+	('height', 'f8'),  # wall loss height
+	('length_1', 'f8'),  # full crack lengths
+	('length_2', 'f8'),
+	('lig_1', 'f8'),  # ligaments from the inner surface
+	('lig_2', 'f8'),
+	('lig_3', 'f8'),
+	('pipe_thk', 'f8'),
+	('pipe_od', 'f8'),  # outer diameter
+	('pres_mag_1', 'f8'),  # pressure window of the two steps
+	('pres_mag_2', 'f8'),
+	('burst_time', 'f8'),  # in the window above, NaN if the case did not burst
+	('pb', 'f8'),  # normalized burst pressure, NaN without reference pressure
+	('wall_time', 'f8'),  # s
+	('finished', 'f8'),  # Unix time the result was stored
+	('job', 'S48'),
+	('key', 'S40'),  # case key of the result cache
+)
+
+BLOCK = 1 << 18  # rows per block when filtering
+FLOAT_TOL = 1e-6  # relative tolerance of equality on float columns, so lig_2=4 matches 4.000000001
+
+
+def config_name(T_small, D_small):
+	return ('s' if T_small else 'b') + 'T' + ('s' if D_small else 'b') + 'D'
+
+
+def reference_pressure(flaw, grade, pipe_thk, pipe_od):
+	"""Burst pressure (MPa) of the pipe without flaw, sizes in mm as in the store; None if unknown"""
+	coeffs = equations.pipe_set(flaw, grade, pipe_thk, pipe_od)
+	return None if coeffs is None else coeffs.pb_ref_MPa
+
+
+class StoreLock(object):
+	"""Exclusive lock on a file, held by one process at a time; released by the system if the process dies"""
+
+	def __init__(self, path):
+		self.path = path
+		self.file = None
+
+	def __enter__(self):
+		self.file = open(self.path, 'a+')
+		if os.name == 'nt':
+			import msvcrt
+			self.file.seek(0)
+			while True:
+				try:
+					msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+					break
+				except OSError:
+					# LK_LOCK gives up after 10 s, keep waiting
+					pass
+		else:
+			import fcntl
+			fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+		return self
+
+	def __exit__(self, *exc):
+		if os.name == 'nt':
+			import msvcrt
+			self.file.seek(0)
+			msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+		else:
+			import fcntl
+			fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+		self.file.close()
+		self.file = None
+
+
+def missing(dtype):
+	dtype = np.dtype(dtype)
+	if dtype.kind == 'f':
+		return np.nan
+	if dtype.kind == 'S':
+		return b''
+	return 0
+
+
+class ResultStore(object):
+	"""Append-only columnar table in a directory, see the module docstring"""
+
+	def __init__(self, root, schema=SCHEMA):
+		self.root = root
+		self.meta_path = os.path.join(root, 'schema.json')
+		self.schema = [(name, np.dtype(dtype).str) for name, dtype in schema]
+		self.rows = 0
+		self.capacity = 0
+		self.names = [name for name, _ in self.schema]
+		self.dtypes = dict(self.schema)
+		self.maps = {}
+		self.refresh()
+
+	def refresh(self):
+		"""Schema, row count and capacity as last published, e.g. by another process"""
+		if not os.path.exists(self.meta_path):
+			return
+		with open(self.meta_path) as f:
+			meta = json.load(f)
+		self.schema = [(name, str(dtype)) for name, dtype in meta['columns']]
+		if meta['capacity'] != self.capacity:
+			# Grown elsewhere: the column files were replaced
+			self.maps = {}
+		self.rows = meta['rows']
+		self.capacity = meta['capacity']
+		self.names = [name for name, _ in self.schema]
+		self.dtypes = dict(self.schema)
+
+	def lock(self):
+		if not os.path.isdir(self.root):
+			os.makedirs(self.root)
+		return StoreLock(os.path.join(self.root, 'lock'))
+
+	def __len__(self):
+		return self.rows
+
+	def path(self, name):
+		return os.path.join(self.root, name + '.npy')
+
+	def column(self, name):
+		"""Memory map of the filled part of a column"""
+		if name not in self.dtypes:
+			raise KeyError('no column {!r}, columns are {}'.format(name, ', '.join(self.names)))
+		if not self.rows:
+			return np.empty(0, dtype=self.dtypes[name])
+		if name not in self.maps:
+			self.maps[name] = np.load(self.path(name), mmap_mode='r+')
+		return self.maps[name][:self.rows]
+
+	def save_meta(self):
+		atomic_write(self.meta_path, json.dumps({'columns': self.schema, 'rows': self.rows,
+			'capacity': self.capacity}, indent=1))
+
+	def grow(self, rows):
+		"""Reallocate every column to hold at least rows rows, doubling the capacity"""
+		capacity = max(rows, 2 * self.capacity, 1024)
+		if not os.path.isdir(self.root):
+			os.makedirs(self.root)
+		for name, dtype in self.schema:
+			new = np.lib.format.open_memmap(self.path(name) + '.tmp', mode='w+', dtype=dtype, shape=(capacity,))
+			if self.rows:
+				new[:self.rows] = self.column(name)
+			new.flush()
+			del new
+			self.maps.pop(name, None)
+			os.replace(self.path(name) + '.tmp', self.path(name))
+		self.capacity = capacity
+
+	def append(self, rows):
+		"""Append rows given as a dict of columns or a list of dicts; missing columns get NaN/empty"""
+		if hasattr(rows, 'keys'):
+			columns = dict(rows)
+		else:
+			columns = dict((name, [row.get(name, missing(self.dtypes[name])) for row in rows])
+				for name in set(name for row in rows for name in row))
+		unknown = set(columns) - set(self.names)
+		if unknown:
+			raise KeyError('unknown columns {}'.format(', '.join(sorted(unknown))))
+		n = max(np.size(value) for value in columns.values()) if columns else 0
+		if not n:
+			return
+		if 'finished' not in columns:
+			columns['finished'] = time.time()
+		with self.lock():
+			# Rows appended by other processes since this store was opened come first
+			self.refresh()
+			if self.rows + n > self.capacity:
+				self.grow(self.rows + n)
+			start, stop = self.rows, self.rows + n
+			for name, dtype in self.schema:
+				if name not in self.maps:
+					self.maps[name] = np.load(self.path(name), mmap_mode='r+')
+				target = self.maps[name]
+				target[start:stop] = np.asarray(columns.get(name, missing(dtype))).astype(dtype)
+				target.flush()
+			# The row count is published last, a crash before it leaves the store as it was
+			self.rows = stop
+			self.save_meta()
+
+	def mask(self, **predicates):
+		"""
+		Rows matching all predicates: a value (equality, with FLOAT_TOL on floats), a
+		(low, high) tuple (inclusive range, None for open), a list of values, or a callable
+		taking the column block and returning a mask
+		"""
+		result = np.zeros(self.rows, dtype=bool)
+		names = list(predicates)
+		for name in names:
+			self.column(name)
+		for start in range(0, self.rows, BLOCK):
+			stop = min(start + BLOCK, self.rows)
+			ok = np.ones(stop - start, dtype=bool)
+			for name in names:
+				data = self.column(name)[start:stop]
+				ok &= self.match(data, predicates[name])
+				# Later columns are only read for blocks that still have candidates
+				if not ok.any():
+					break
+			result[start:stop] = ok
+		return result
+
+	def match(self, data, predicate):
+		if callable(predicate):
+			return np.asarray(predicate(data), dtype=bool)
+		if isinstance(predicate, tuple):
+			low, high = predicate
+			ok = np.ones(len(data), dtype=bool)
+			if low is not None:
+				ok &= data >= low
+			if high is not None:
+				ok &= data <= high
+			return ok
+		if isinstance(predicate, list):
+			ok = np.zeros(len(data), dtype=bool)
+			for value in predicate:
+				ok |= self.match(data, value)
+			return ok
+		if data.dtype.kind == 'S':
+			return data == (predicate.encode('ascii') if not isinstance(predicate, bytes) else predicate)
+		if data.dtype.kind == 'f':
+			return np.abs(data - predicate) <= FLOAT_TOL * max(abs(predicate), 1.0)
+		return data == predicate
+
+	def query(self, columns=None, **predicates):
+		"""Structured array of the requested columns (all by default) for the matching rows"""
+		columns = columns or self.names
+		rows = np.flatnonzero(self.mask(**predicates)) if predicates else np.arange(self.rows)
+		out = np.empty(len(rows), dtype=[(name, self.dtypes[name]) for name in columns])
+		for name in columns:
+			out[name] = self.column(name)[rows]
+		return out
+
+
+def detail_columns(detail, flaw):
+	"""Columns of a flaw_detail table (summary files, .mat data) by name; burst_time is the last column"""
+	detail = np.atleast_2d(np.asarray(detail, dtype=float))
+	if flaw == 'cw':
+		names = ('index', 'height', 'length_1', 'lig_2', 'lig_1')
+	elif flaw == 'cc':
+		names = ('index', 'length_1', 'length_2', 'lig_1', 'lig_2', 'lig_3')
+	else:
+		raise ValueError('unknown flaw type {!r}, expected cw or cc'.format(flaw))
+	columns = dict((name, detail[:, i]) for i, name in enumerate(names))
+	if detail.shape[1] > len(names):
+		columns['burst_time'] = detail[:, len(names)]
+	return columns
+
+
+def import_detail(store, detail, flaw, config, grade, pipe_thk, pipe_od, window, pb_ref=None):
+	"""
+	Append a flaw_detail table of one sweep; pipe sizes in mm, window and pb_ref in MPa
+	pb is computed from the burst time as in the MATLAB scripts when pb_ref is given.
+	"""
+	columns = detail_columns(detail, flaw)
+	columns.update(flaw=flaw, config=config, grade=grade, pipe_thk=pipe_thk, pipe_od=pipe_od,
+		pres_mag_1=window[0], pres_mag_2=window[1])
+	if pb_ref is not None and 'burst_time' in columns:
+		columns['pb'] = (window[0] + (window[1] - window[0]) * columns['burst_time']) / pb_ref
+	store.append(columns)
+
+
+def import_mat(store, path, flaw, config, grade, pipe_thk, pipe_od, window, pb_ref=None, variable=None):
+	"""Append the table of a MATLAB data file such as CW_sTsD_data.mat (needs scipy)"""
+	from scipy.io import loadmat
+	data = loadmat(path)
+	if variable is None:
+		variable = os.path.splitext(os.path.basename(path))[0]
+	import_detail(store, data[variable], flaw, config, grade, pipe_thk, pipe_od, window, pb_ref)
@@ -0,0 +1,295 @@
+"""
+Neural-network surrogate of the burst pressure, trained on the result store
+A small multilayer perceptron in NumPy (tanh hidden layers) maps the logs of the
+normalized flaw variables of pyburst.equations (h/t, a/t, l/t, D/t for CW; a1/t,
+a2/t, l1/t, l2/t, D/t for CC) to pb. With a base coefficient set it learns the
+residual of the fitted power law instead, so it keeps the power law where that one
+is good and corrects it near the edges of the grid (the oor blocks of CC_allTD.m).
+
+The trained model is exported to one .npz file: layer weights as float32, the input
+and output scaling, the ranges of the training data and the base coefficients.
+Loading it needs NumPy only, and evaluate() has the block-wise API and validity
+flags of equations.evaluate:
+
+    python -m pyburst.surrogate train burst_pressure/results cw_mlp.npz --flaw cw --base CW_allTD
+    pb, flags = Surrogate.load('cw_mlp.npz').evaluate((h, a, l), t, D)
+
+A batch of a million flaws takes well under a microsecond per flaw on one core.
+python -m pyburst.assess takes the .npz file in place of a coefficient set.
+"""
+############################################################################################################
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+from pyburst import equations
+from pyburst.equations import VARIABLES, INVALID, RANGE_TOL, BLOCK
+
+# Columns of the result store giving the flaw variables, divided by pipe_thk
+STORE_COLUMNS = {'cw': ('height', 'length_1', 'lig_2', 'pipe_od'),
+	'cc': ('length_1', 'length_2', 'lig_1', 'lig_2', 'pipe_od')}
+
+
+def training_data(store, flaw, **predicates):
+	"""x (cases, variables) and pb of the finished cases of a flaw type in a ResultStore"""
+	if flaw not in STORE_COLUMNS:
+		raise ValueError('unknown flaw type {!r}, expected cw or cc'.format(flaw))
+	data = store.query(list(STORE_COLUMNS[flaw]) + ['pipe_thk', 'pb'], flaw=flaw, **predicates)
+	x = np.column_stack([data[name] for name in STORE_COLUMNS[flaw]]) / data['pipe_thk'][:, None]
+	keep = np.isfinite(data['pb']) & np.all(np.isfinite(x) & (x > 0), axis=1)
+	return x[keep], data['pb'][keep]
+
+
+def base_pb(c, logx):
+	"""Power law of coefficients c at the logs of x; 1 + 0 without a base"""
+	if c is None:
+		return np.ones(len(logx))
+	return 1 + c[0] * np.exp(np.dot(logx, c[1:]))
+
+
+class Surrogate(object):
+	"""Trained network of one flaw type, see the module docstring"""
+
+	def __init__(self, flaw, weights, biases, x_mean, x_scale, y_mean, y_scale, lower, upper, base=None,
+		info=None):
+		if flaw not in VARIABLES:
+			raise ValueError('unknown flaw type {!r}, expected cw or cc'.format(flaw))
+		self.flaw = flaw
+		self.variables = VARIABLES[flaw]
+		self.weights = [np.asarray(w, dtype=np.float32) for w in weights]
+		self.biases = [np.asarray(b, dtype=np.float32) for b in biases]
+		self.x_mean = np.asarray(x_mean, dtype=float)
+		self.x_scale = np.asarray(x_scale, dtype=float)
+		self.y_mean = float(y_mean)
+		self.y_scale = float(y_scale)
+		self.lower = np.asarray(lower, dtype=float) * (1 - RANGE_TOL)
+		self.upper = np.asarray(upper, dtype=float) * (1 + RANGE_TOL)
+		self.base = None if base is None else np.asarray(base, dtype=float)
+		self.info = info or {}
+		# The input scaling is folded into the first layer
+		self.w0 = (self.weights[0] / self.x_scale[:, None].astype(np.float32)).astype(np.float32)
+		self.b0 = (self.biases[0] - np.dot((self.x_mean / self.x_scale).astype(np.float32), self.weights[0]))
+
+	def __repr__(self):
+		return 'Surrogate({!r}, layers={})'.format(self.flaw, [w.shape[1] for w in self.weights])
+
+	def network(self, logx):
+		"""Network output (scaled back) at the logs of the normalized variables"""
+		h = np.dot(logx.astype(np.float32), self.w0)
+		h += self.b0
+		for w, b in zip(self.weights[1:], self.biases[1:]):
+			np.tanh(h, out=h)
+			h = np.dot(h, w)
+			h += b
+		return self.y_mean + self.y_scale * h[:, 0].astype(float)
+
+	def predict_x(self, x):
+		"""pb at normalized variables x (n, variables); NaN where an input is not positive"""
+		x = np.asarray(x, dtype=float)
+		with np.errstate(invalid='ignore', divide='ignore'):
+			logx = np.log(x)
+		bad = ~np.all(np.isfinite(logx), axis=1)
+		logx[bad] = 0.0
+		pb = base_pb(self.base, logx) + self.network(logx)
+		pb[bad] = np.nan
+		return pb
+
+	def evaluate(self, columns, t, D, out=None, flags=None, block=BLOCK):
+		"""pb and validity flags as equations.evaluate, ranges being those of the training data"""
+		columns = [np.asarray(col) for col in columns]
+		if len(columns) != len(self.variables) - 1:
+			raise ValueError('the {} surrogate needs the columns {}'.format(self.flaw,
+				', '.join(self.variables[:-1])))
+		n = len(columns[0])
+		t_arr = np.broadcast_to(np.asarray(t, dtype=float), (n,))
+		D_arr = np.broadcast_to(np.asarray(D, dtype=float), (n,))
+		if out is None:
+			out = np.empty(n)
+		if flags is None:
+			flags = np.empty(n, dtype=np.uint8)
+		x = np.empty((min(block, n), len(self.variables)))
+		for start in range(0, n, block):
+			stop = min(start + block, n)
+			xb = x[:stop - start]
+			t_blk = t_arr[start:stop]
+			for i, col in enumerate(columns + [D_arr]):
+				np.divide(col[start:stop], t_blk, out=xb[:, i])
+			f = flags[start:stop]
+			f[:] = 0
+			for i in range(len(self.variables)):
+				bd = (xb[:, i] < self.lower[i]) | (xb[:, i] > self.upper[i])
+				f |= bd.view(np.uint8) << i
+			pb = self.predict_x(xb)
+			f[np.isnan(pb)] |= INVALID
+			out[start:stop] = pb
+		return out, flags
+
+	def ranges(self):
+		return dict((v, (lo, hi)) for v, lo, hi in zip(self.variables, self.lower, self.upper))
+
+	def save(self, path):
+		"""Write the model to one .npz file"""
+		arrays = {'flaw': np.array(self.flaw), 'x_mean': self.x_mean, 'x_scale': self.x_scale,
+			'y': np.array([self.y_mean, self.y_scale]), 'lower': self.lower / (1 - RANGE_TOL),
+			'upper': self.upper / (1 + RANGE_TOL), 'info': np.array(json.dumps(self.info))}
+		for i, (w, b) in enumerate(zip(self.weights, self.biases)):
+			arrays['w{}'.format(i)] = w
+			arrays['b{}'.format(i)] = b
+		if self.base is not None:
+			arrays['base'] = self.base
+		tmp = path + '.tmp.npz'
+		np.savez_compressed(tmp, **arrays)
+		os.replace(tmp, path)
+
+	@classmethod
+	def load(cls, path):
+		with np.load(path) as data:
+			layers = sum(1 for name in data.files if name.startswith('w'))
+			return cls(str(data['flaw']), [data['w{}'.format(i)] for i in range(layers)],
+				[data['b{}'.format(i)] for i in range(layers)], data['x_mean'], data['x_scale'], data['y'][0],
+				data['y'][1], data['lower'], data['upper'], data['base'] if 'base' in data.files else None,
+				json.loads(str(data['info'])))
+
+
+def init_layers(sizes, rng):
+	weights = [rng.normal(0.0, np.sqrt(1.0 / m), (m, k)) for m, k in zip(sizes[:-1], sizes[1:])]
+	biases = [np.zeros(k) for k in sizes[1:]]
+	return weights, biases
+
+
+def forward(weights, biases, z):
+	"""Activations of every layer, the last one linear"""
+	activations = [z]
+	for i, (w, b) in enumerate(zip(weights, biases)):
+		z = np.dot(z, w) + b
+		if i < len(weights) - 1:
+			z = np.tanh(z)
+		activations.append(z)
+	return activations
+
+
+def gradients(weights, biases, activations, target, weight_decay):
+	"""Gradients of the mean squared error plus weight decay by backpropagation"""
+	n = len(target)
+	delta = (activations[-1][:, 0] - target)[:, None] * (2.0 / n)
+	grad_w, grad_b = [None] * len(weights), [None] * len(weights)
+	for i in range(len(weights) - 1, -1, -1):
+		grad_w[i] = np.dot(activations[i].T, delta) + 2 * weight_decay * weights[i]
+		grad_b[i] = delta.sum(axis=0)
+		if i:
+			delta = np.dot(delta, weights[i].T) * (1 - activations[i] ** 2)
+	return grad_w, grad_b
+
+
+def train(x, pb, flaw, hidden=(16, 16), base=None, epochs=5000, learning_rate=0.01, weight_decay=1e-6,
+	validation=0.2, seed=0, patience=500):
+	"""
+	Surrogate fitted to pb at normalized variables x (cases, variables) by full-batch
+	Adam. A validation share of the cases is held out and the weights with the lowest
+	validation error are kept (all cases are used when there are fewer than 10).
+	base is a coefficient set (name or CoefficientSet) whose residual is learned.
+	"""
+	x = np.asarray(x, dtype=float)
+	pb = np.asarray(pb, dtype=float)
+	if x.ndim != 2 or x.shape[1] != len(VARIABLES[flaw]):
+		raise ValueError('x needs one column per variable of {}: {}'.format(flaw, ', '.join(VARIABLES[flaw])))
+	if np.any(x <= 0):
+		raise ValueError('the normalized variables must be positive')
+	c = None
+	if base is not None:
+		base = equations.get_set(base)
+		if base.flaw != flaw or np.isnan(base.c[0]):
+			raise ValueError('base {} is not a complete {} coefficient set'.format(base.name, flaw))
+		c = base.c
+	logx = np.log(x)
+	target = pb - base_pb(c, logx)
+	rng = np.random.default_rng(seed)
+	order = rng.permutation(len(pb))
+	n_val = int(round(validation * len(pb))) if len(pb) >= 10 else 0
+	val, fit = order[:n_val], order[n_val:]
+	x_mean, x_scale = logx[fit].mean(axis=0), logx[fit].std(axis=0)
+	x_scale[x_scale == 0] = 1.0
+	y_mean, y_scale = target[fit].mean(), target[fit].std() or 1.0
+	z = (logx - x_mean) / x_scale
+	y = (target - y_mean) / y_scale
+	weights, biases = init_layers([x.shape[1]] + list(hidden) + [1], rng)
+	params = weights + biases
+	moments = [np.zeros_like(p) for p in params]
+	squares = [np.zeros_like(p) for p in params]
+	check = val if n_val else fit
+	best, best_loss, best_epoch = None, np.inf, 0
+	for epoch in range(1, epochs + 1):
+		activations = forward(weights, biases, z[fit])
+		grad_w, grad_b = gradients(weights, biases, activations, y[fit], weight_decay)
+		for i, (p, g) in enumerate(zip(params, grad_w + grad_b)):
+			moments[i] = 0.9 * moments[i] + 0.1 * g
+			squares[i] = 0.999 * squares[i] + 0.001 * g * g
+			p -= learning_rate * (moments[i] / (1 - 0.9 ** epoch)) / (np.sqrt(squares[i] / (1 - 0.999 ** epoch))
+				+ 1e-8)
+		loss = np.mean((forward(weights, biases, z[check])[-1][:, 0] - y[check]) ** 2)
+		if loss < best_loss:
+			best, best_loss, best_epoch = [p.copy() for p in params], loss, epoch
+		elif epoch - best_epoch > patience:
+			break
+	layers = len(weights)
+	model = Surrogate(flaw, best[:layers], best[layers:], x_mean, x_scale, y_mean, y_scale, x.min(axis=0),
+		x.max(axis=0), c)
+	residual = model.predict_x(x) - pb
+	model.info = {'cases': len(pb), 'validation_cases': n_val, 'epochs': epoch, 'best_epoch': best_epoch,
+		'hidden': list(hidden), 'base': None if base is None else base.name,
+		'rmse': float(np.sqrt(np.mean(residual[fit] ** 2))),
+		'validation_rmse': float(np.sqrt(np.mean(residual[val] ** 2))) if n_val else None,
+		'max_residual': float(np.abs(residual).max())}
+	return model
+
+
+def benchmark(model, n=1000000, seed=0):
+	"""Seconds per flaw of evaluate() on n flaws drawn in the training ranges"""
+	rng = np.random.default_rng(seed)
+	lower, upper = model.lower / (1 - RANGE_TOL), model.upper / (1 + RANGE_TOL)
+	x = lower + (upper - lower) * rng.random((n, len(model.variables)))
+	t = np.ones(n)
+	start = time.perf_counter()
+	model.evaluate([x[:, i] for i in range(x.shape[1] - 1)], t, x[:, -1])
+	return (time.perf_counter() - start) / n
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(prog='python -m pyburst.surrogate', description=__doc__.split('\n')[1])
+	commands = parser.add_subparsers(dest='command')
+	command = commands.add_parser('train', help='train a surrogate on a result store and export it')
+	command.add_argument('store', help='ResultStore directory, e.g. burst_pressure/results')
+	command.add_argument('output', help='.npz file')
+	command.add_argument('--flaw', required=True, choices=sorted(VARIABLES))
+	command.add_argument('--grade', type=int, help='only the cases of this grade')
+	command.add_argument('--base', help='coefficient set whose residual is learned, e.g. CW_allTD')
+	command.add_argument('--coefficients', help='coefficient file with the base set')
+	command.add_argument('--hidden', default='16,16', help='hidden layer sizes')
+	command.add_argument('--epochs', type=int, default=5000)
+	command.add_argument('--seed', type=int, default=0)
+	args = parser.parse_args(argv)
+	if args.command != 'train':
+		parser.print_help()
+		return 1
+	from pyburst.store import ResultStore
+	if args.coefficients:
+		equations.COEFFICIENTS.update(equations.load_coefficients(args.coefficients))
+	predicates = {} if args.grade is None else {'grade': args.grade}
+	x, pb = training_data(ResultStore(args.store), args.flaw, **predicates)
+	if not len(pb):
+		parser.exit(1, 'error: no {} cases with pb in {}\n'.format(args.flaw, args.store))
+	model = train(x, pb, args.flaw, [int(size) for size in args.hidden.split(',')], args.base, args.epochs,
+		seed=args.seed)
+	model.save(args.output)
+	for name, value in sorted(model.info.items()):
+		print('{}: {}'.format(name, value))
+	print('{:.3g} us per flaw'.format(benchmark(model) * 1e6))
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,721 @@
+"""
+Declarative sweeps run side by side from one process
+A sweep spec (TOML, or JSON with the same layout) replaces the switches at the top
+of burst_full_cw.py and burst_full_cc.py. Lists of pipe configurations and grades
+expand into one sweep each:
+
+    [resources]                  # budget of the node, shared by all sweeps
+    max_jobs = 4
+    total_cpus = 64
+    admission = true             # memory and CPUs of each job from its mesh (pyburst.admission)
+    licence_tokens = 50
+
+    [[sweep]]
+    flaw = "cw"                  # cw or cc
+    config = ["sTsD", "sTbD"]    # small/big thickness, small/big diameter
+    grade = [42, 65]
+    template = true              # morph the decks from one reference case
+
+    [sweep.doe]                  # per parameter: "levels" (the script levels), a list, or one value
+    length = "levels"
+    lig_2 = [0.002, 0.004]
+
+    python -m pyburst.sweep list specs/*.toml
+    abaqus python pyburst/sweep.py run specs/overnight.toml
+
+The runner keeps one scheduler for every sweep. The geometry is still built in CAE
+by the script of the flaw type, started in build mode (noGUI=<script> -- --spec
+<file>) to write the decks of a sweep, or only its reference deck in template mode,
+without running them. The decks are handed to the scheduler one at a time, so every
+case gets the pressure window predicted from the cases finished before it. Results
+go to the same cache, summary, result store and stage log as the scripts.
+Other settings of a sweep: name, window, stop_at_burst, adaptive_window,
+window_margin, max_retries, coefficients (file of refitted sets predicting the first
+windows), compact_output, keep_odb, cpus_per_job, memory_per_job, check_max_length,
+and a [sweep.mesh] table (mesh_fine, mesh_end1, mesh_end2, seed_numbers).
+"""
+############################################################################################################
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import itertools
+import subprocess
+from collections import namedtuple, deque
+
+import numpy as np
+
+if __name__ == '__main__' and __package__ is None:
+	# Run as a file by abaqus python: make the package importable
+	sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyburst import doe, odb_post, material
+from pyburst.cache import ResultCache, case_key, atomic_write
+from pyburst.bracket import PressureBracket, equivalent_time, design_scales, pipe_equation
+from pyburst.deck import read_deck, FlawMorph, LIGAMENT, CRACK, LOSS
+from pyburst.instrument import StageLog, count_increments, solver_times
+from pyburst.monitor import BurstMonitor, OdbProbe
+from pyburst.postjob import Cleanup
+from pyburst.scheduler import Job, Scheduler, AbaqusBackend
+from pyburst.admission import AdmissionController
+from pyburst.store import ResultStore, detail_columns, reference_pressure
+
+FOLDER = 'burst_pressure'
+SCRIPT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Abaqus_script')
+
+# Pipe sizes of the configurations (outer radius and wall thickness, m)
+DIAMETERS = {'s': 0.12, 'b': 0.22}
+THICKNESSES = {'s': 0.015, 'b': 0.025}
+MAX_LENGTHS = {'s': 0.014, 'b': 0.02}  # allowable combined flaw length
+PIPE_LEN = 0.3
+
+"""Settings of the scripts per flaw type; windows per configuration and grade (None: any grade), in Pa"""
+FLAWS = {
+	'cw': {
+		'script': 'burst_full_cw.py',
+		'params': doe.CW_PARAMS,
+		'kinds': (LIGAMENT, CRACK, LIGAMENT, LOSS),
+		'lock_radius': 0.015,  # loss_width
+		'crack_par': {'s': 0.019, 'b': 0.021},
+		'magic_pt': {'sTsD': (0.0193620651670132, 0.125515379266719), 'sTbD': (0.0189993341502983, 0.219178067565725),
+			'bTsD': (0.022, 0.125079974416371), 'bTbD': (0.02, 0.227723428746363)},
+		'grades': None,  # any grade of the material library, looked up when the sweep is made
+		'cpus_per_job': 16,
+		'defaults': {'length': 0.0015, 'lig_2': 0.004, 'height': 0.004},
+		'levels': {
+			'length': {'s': [0.0005, 0.00125, 0.002], 'b': [0.0005, 0.00125, 0.002]},
+			'lig_2': {'s': [0.002, 0.0035, 0.005], 'b': [0.002, 0.004, 0.006, 0.008]},
+			'height': {'s': [0.002, 0.0035, 0.005], 'b': [0.002, 0.004, 0.006, 0.008]}},
+		'windows': {
+			'sTsD': {65: (58500000, 78000000), 42: (40000000, 60000000), 100: (90000000, 110000000)},
+			'sTbD': {None: (31500000, 42000000)},
+			'bTsD': {None: (112000000, 140000000)},
+			'bTbD': {None: (57600000, 72000000)}},
+	},
+	'cc': {
+		'script': 'burst_full_cc.py',
+		'params': doe.CC_PARAMS,
+		'kinds': (LIGAMENT, CRACK, LIGAMENT, CRACK, LIGAMENT),
+		'lock_radius': None,
+		'crack_par': {'s': 0.014, 'b': 0.018},
+		'magic_pt': {'sTsD': (0.0154052750086153, 0.126062196958124), 'sTbD': (0.0146274740894786, 0.228131534430823),
+			'bTsD': (0.022, 0.125079974416371), 'bTbD': (0.02, 0.227723428746363)},
+		'grades': (65,),  # the CC script has the X65 material only
+		'cpus_per_job': 18,
+		'defaults': {'length_1': 0.0005, 'length_2': 0.0005, 'lig_1': 0.004, 'lig_2': 0.004},
+		'levels': {
+			'length_1': {'s': [0.0005, 0.001, 0.0015], 'b': [0.0005, 0.0015, 0.0025]},
+			'length_2': {'s': [0.0005, 0.001, 0.0015], 'b': [0.0005, 0.0015, 0.0025]},
+			'lig_1': {'s': [0.002, 0.003, 0.004], 'b': [0.002, 0.004, 0.006]},
+			'lig_2': {'s': [0.002, 0.003, 0.004], 'b': [0.002, 0.004, 0.006]}},
+		'windows': {
+			'sTsD': {None: (73500000, 79000000)},
+			'sTbD': {None: (38000000, 42000000)},
+			'bTsD': {None: (112000000, 140000000)},
+			'bTbD': {None: (57600000, 72000000)}},
+	},
+}
+
+DEFAULT_MESH = {'mesh_fine': 0.0002, 'mesh_end1': 0.0005, 'mesh_end2': 0.002}
+
+# Settings of a sweep and their defaults, as in the scripts
+OPTIONS = {'name': None, 'window': None, 'template': False, 'stop_at_burst': True, 'adaptive_window': True,
+	'window_margin': 0.05, 'max_retries': 2, 'coefficients': None, 'compact_output': True, 'keep_odb': False, 'cpus_per_job': None,
+	'memory_per_job': 60000, 'check_max_length': True}
+
+# Budget of the node shared by the sweeps of a run
+RESOURCES = {'max_jobs': 4, 'total_cpus': 64, 'total_memory': 250000, 'licence_tokens': None, 'admission': False}
+
+"""One case of a sweep: parameters in m, its flaw_detail row (mm) and the bands through the wall"""
+Case = namedtuple('Case', ['index', 'name', 'params', 'detail', 'bands', 'key'])
+
+
+def seed_numbers(flaw, T_small, D_small):
+	"""Seeds per edge group of pyburst.geometry, as set in the scripts"""
+	if flaw == 'cw':
+		return {'radial': 3 if T_small else 5, 'near': 3, 'far': 10 if D_small else 15}
+	if T_small:
+		return {'radial': 3, 'near': 3, 'far': 10 if D_small else 15}
+	return {'radial': 4, 'near': 4, 'far': 10 if D_small else 12}
+
+
+class Sweep(object):
+	"""One flaw type, pipe configuration and grade with its DOE, see the module docstring"""
+
+	def __init__(self, flaw, config, grade=65, doe_spec=None, mesh=None, **options):
+		if flaw not in FLAWS:
+			raise ValueError('unknown flaw type {!r}, expected cw or cc'.format(flaw))
+		if config not in FLAWS[flaw]['windows']:
+			raise ValueError('unknown pipe configuration {!r}, expected one of {}'.format(
+				config, ', '.join(sorted(FLAWS[flaw]['windows']))))
+		if FLAWS[flaw]['grades'] is not None and grade not in FLAWS[flaw]['grades']:
+			raise ValueError('the {} script only runs {}, not X{}'.format(flaw,
+				', '.join('X{}'.format(name) for name in FLAWS[flaw]['grades']), grade))
+		if grade not in material.grades():
+			raise ValueError('X{} is not in the material library, add it to materials.json or with '
+				'material.add_grade'.format(grade))
+		if material.burst_mises(grade) is None:
+			raise ValueError('X{} has no burst criterion, add burst_mises to its entry in materials.json'.format(grade))
+		unknown = set(options) - set(OPTIONS)
+		if unknown:
+			raise ValueError('unknown sweep settings {}'.format(', '.join(sorted(unknown))))
+		self.flaw = flaw
+		self.config = config
+		self.grade = grade
+		self.settings = FLAWS[flaw]
+		self.options = dict(OPTIONS, **options)
+		self.T_small = config[0] == 's'
+		self.D_small = config[2] == 's'
+		self.pipe_od = DIAMETERS[config[2]]
+		self.pipe_thk = THICKNESSES[config[0]]
+		self.pipe_id = self.pipe_od - self.pipe_thk
+		self.crack_par = self.settings['crack_par'][config[0]]
+		magic_pt = self.settings['magic_pt'][config]
+		# Partition angle of the scripts, as passed to geometry.PipeGeometry
+		self.theta_par = math.atan2(magic_pt[0], magic_pt[1])
+		self.max_length = MAX_LENGTHS[config[0]]
+		windows = self.settings['windows'][config]
+		window = self.options['window'] or windows.get(grade, windows.get(None))
+		if window is None:
+			raise ValueError('no pressure window for {} X{}, give one with window = [p1, p2]'.format(config, grade))
+		self.window = (float(window[0]), float(window[1]))
+		self.job_name = self.options['name'] or 'Burst_full_{}_{}_X{}_'.format(flaw, config, grade)
+		self.mesh = dict(DEFAULT_MESH)
+		self.mesh.update(mesh or {})
+		self.custom_seeds = 'seed_numbers' in self.mesh
+		if not self.custom_seeds:
+			self.mesh['seed_numbers'] = seed_numbers(flaw, self.T_small, self.D_small)
+		self.design, self.num_of_simulation = self.make_design(doe_spec or {})
+		self.max_mises = material.burst_mises(grade)
+
+	def make_design(self, spec):
+		"""Design of the DOE table: full factorial of levels, or lhs/sobol over [low, high] bounds"""
+		spec = dict(spec)
+		method = spec.pop('method', 'full_factorial')
+		n = spec.pop('n', None)
+		seed = spec.pop('seed', None)
+		unknown = set(spec) - set(self.settings['params'])
+		if unknown:
+			raise ValueError('unknown {} parameters {}'.format(self.flaw, ', '.join(sorted(unknown))))
+		if method == 'full_factorial':
+			levels = []
+			for name in self.settings['params']:
+				value = spec.get(name, self.settings['defaults'][name])
+				if value == 'levels':
+					value = self.settings['levels'][name][self.config[0]]
+				levels.append((name, value if isinstance(value, list) else [value]))
+			design = doe.full_factorial(levels)
+		elif method in ('lhs', 'sobol'):
+			if n is None:
+				raise ValueError('{} designs need n'.format(method))
+			bounds = []
+			for name in self.settings['params']:
+				value = spec.get(name, self.settings['defaults'][name])
+				if value == 'levels':
+					value = self.settings['levels'][name][self.config[0]]
+				low, high = (min(value), max(value)) if isinstance(value, list) else (value, value)
+				bounds.append((name, low, high))
+			design = doe.latin_hypercube(bounds, n, seed) if method == 'lhs' else doe.sobol(bounds, n, seed)
+		else:
+			raise ValueError('unknown DOE method {!r}, expected full_factorial, lhs or sobol'.format(method))
+		max_length = self.max_length if self.options['check_max_length'] else None
+		return doe.prune(design, self.pipe_thk, self.flaw, max_length), len(design)
+
+	def key(self, params):
+		"""Cache key of a case, as computed by the scripts"""
+		extra = {'seed_numbers': self.mesh['seed_numbers']} if self.custom_seeds else {}
+		return case_key(pipe_od=self.pipe_od, pipe_thk=self.pipe_thk, steel_grade=self.grade,
+			mesh_fine=self.mesh['mesh_fine'], mesh_end1=self.mesh['mesh_end1'], mesh_end2=self.mesh['mesh_end2'],
+			pres_mag_1=self.window[0], pres_mag_2=self.window[1], template_mode=self.options['template'],
+			adaptive_window=self.options['adaptive_window'], **dict(params, **extra))
+
+	def cases(self):
+		details = doe.flaw_detail(self.design, self.pipe_thk, self.flaw)
+		cases = []
+		for row, detail in zip(self.design, details):
+			params = dict((name, float(row[name])) for name in self.settings['params'])
+			rest = self.pipe_thk - float(doe.flaw_stack(row, self.flaw))
+			if self.flaw == 'cw':
+				bands = [rest, params['length'] * 2, params['lig_2'], params['height']]
+			else:
+				bands = [params['lig_1'], params['length_1'] * 2, params['lig_2'], params['length_2'] * 2, rest]
+			index = int(row['index'])
+			cases.append(Case(index, self.job_name + str(index), params, [index] + detail[1:].tolist(), bands,
+				self.key(params)))
+		return cases
+
+	def reference(self, cases):
+		"""Reference case of template mode: the middle case of the design, as in the scripts"""
+		return cases[len(cases) // 2]
+
+	def morph(self, reference):
+		"""FlawMorph from the deck of the reference case to the other cases"""
+		return FlawMorph(list(self.settings['kinds']), reference.bands, self.pipe_id, self.pipe_thk, PIPE_LEN,
+			self.crack_par, self.theta_par, lock_radius=self.settings['lock_radius'])
+
+	def build_spec(self, cases):
+		"""Settings of the CAE script in build mode (read_build_spec)"""
+		return {'flaw': self.flaw, 'job_name': self.job_name, 'T_small': self.T_small, 'D_small': self.D_small,
+			'grade': self.grade, 'window': list(self.window), 'mesh_fine': self.mesh['mesh_fine'],
+			'mesh_end1': self.mesh['mesh_end1'], 'mesh_end2': self.mesh['mesh_end2'],
+			'seed_numbers': self.mesh['seed_numbers'], 'params': list(self.settings['params']),
+			'cases': [dict(case.params, index=case.index) for case in cases]}
+
+	def __repr__(self):
+		return 'Sweep({!r}, {!r}, X{}, {} cases)'.format(self.flaw, self.config, self.grade, len(self.design))
+
+
+def read_build_spec(argv):
+	"""Build spec passed to a CAE script with -- --spec <file>, None when the script runs on its own"""
+	if '--spec' not in argv:
+		return None
+	with open(argv[argv.index('--spec') + 1]) as f:
+		return json.load(f)
+
+
+def build_design(spec):
+	"""Design of the cases of a build spec"""
+	design = np.empty(len(spec['cases']), dtype=doe.design_dtype(spec['params']))
+	for i, case in enumerate(spec['cases']):
+		design[i] = tuple([case['index']] + [case[name] for name in spec['params']])
+	return design
+
+
+def read_spec(path):
+	"""Spec file as a dict: .json, or TOML (tomllib, or tomli before Python 3.11)"""
+	if path.endswith('.json'):
+		with open(path) as f:
+			return json.load(f)
+	try:
+		import tomllib
+	except ImportError:
+		import tomli as tomllib
+	with open(path, 'rb') as f:
+		return tomllib.load(f)
+
+
+def expand(entry):
+	"""Sweeps of one [[sweep]] table, one per combination of the listed configurations and grades"""
+	entry = dict(entry)
+	flaw = entry.pop('flaw', None)
+	if flaw is None:
+		raise ValueError('a sweep needs a flaw type (cw or cc)')
+	configs = entry.pop('config', 'sTsD')
+	grades = entry.pop('grade', 65)
+	configs = configs if isinstance(configs, list) else [configs]
+	grades = grades if isinstance(grades, list) else [grades]
+	if entry.get('name') and len(configs) * len(grades) > 1:
+		raise ValueError('name is the job name of a single sweep, it cannot be shared by {} sweeps'.format(
+			len(configs) * len(grades)))
+	doe_spec = entry.pop('doe', None)
+	mesh = entry.pop('mesh', None)
+	return [Sweep(flaw, config, grade, doe_spec, mesh, **entry) for config, grade in itertools.product(configs, grades)]
+
+
+def load_specs(paths):
+	"""Sweeps of the spec files and the budget of the node (RESOURCES updated by the files)"""
+	sweeps = []
+	resources = dict(RESOURCES)
+	for path in paths:
+		spec = read_spec(path)
+		entries = spec.get('sweep', [])
+		for entry in entries if isinstance(entries, list) else [entries]:
+			sweeps.extend(expand(entry))
+		unknown = set(spec.get('resources', {})) - set(RESOURCES)
+		if unknown:
+			raise ValueError('unknown resources {} in {}'.format(', '.join(sorted(unknown)), path))
+		resources.update(spec.get('resources', {}))
+	names = [s.job_name for s in sweeps]
+	duplicates = sorted(set(name for name in names if names.count(name) > 1))
+	if duplicates:
+		raise ValueError('several sweeps named {}'.format(', '.join(duplicates)))
+	return sweeps, resources
+
+
+class CaeBuilder(object):
+	"""Writes the decks of a sweep with its CAE script in build mode, one CAE process per sweep"""
+
+	def __init__(self, executable='abaqus', script_dir=SCRIPT_DIR):
+		self.executable = executable
+		self.script_dir = script_dir
+
+	def start(self, sweep, cases, workdir='.'):
+		path = os.path.join(FOLDER, sweep.job_name + 'build.json')
+		atomic_write(os.path.join(workdir, path), json.dumps(sweep.build_spec(cases), indent=1))
+		cmd = [self.executable, 'cae', 'noGUI=' + os.path.join(self.script_dir, sweep.settings['script']),
+			'--', '--spec', path]
+		if os.name == 'nt':
+			# abaqus is a batch file on Windows
+			cmd = ['cmd', '/c'] + cmd
+		log = open(os.path.join(workdir, sweep.job_name + 'build.log'), 'w')
+		try:
+			return subprocess.Popen(cmd, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+		finally:
+			log.close()
+
+	def poll(self, handle):
+		return handle.poll()
+
+
+class DeckBuilder(object):
+	"""
+	Writes the requested decks from an existing deck of the reference case of the sweep
+	(its middle case, see Sweep.reference), e.g. from an earlier template sweep of the
+	same pipe, with the flaw of each case morphed in
+	"""
+
+	def __init__(self, path):
+		self.path = path
+
+	def start(self, sweep, cases, workdir='.'):
+		deck = read_deck(self.path)
+		morph = sweep.morph(sweep.reference(sweep.cases()))
+		for case in cases:
+			deck.write(os.path.join(workdir, case.name + '.inp'), morph.apply(deck.nodes, case.bands),
+				comment='Flaw morphed from ' + self.path)
+		return None
+
+	def poll(self, handle):
+		return 0
+
+
+class SweepMonitor(object):
+	"""Burst monitor of each sweep, for the one scheduler of the runner"""
+
+	def __init__(self, monitors):
+		self.monitors = monitors
+
+	def check(self, job):
+		monitor = self.monitors.get(job.meta['sweep'])
+		return None if monitor is None else monitor.check(job)
+
+	def forget(self, job):
+		monitor = self.monitors.get(job.meta['sweep'])
+		if monitor is not None:
+			monitor.forget(job)
+
+
+class JobFinisher(object):
+	"""
+	What happens to a finished job of one sweep, shared by finish_job of the scripts
+	and SweepRunner: stage log, burst time, re-run outside the window, then cache,
+	summary and result store. window is the fixed window of the sweep, in which the
+	burst times are reported; pipe_od is the outer radius as in the scripts, and
+	write_summary is called after every job.
+	"""
+
+	def __init__(self, flaw, config, grade, pipe_thk, pipe_od, window, max_mises, bracket, cache, store, stages,
+		flaw_detail, write_summary, adaptive_window=True, max_retries=2, workdir='.'):
+		self.flaw = flaw
+		self.config = config
+		self.grade = grade
+		self.pipe_thk = pipe_thk
+		self.pipe_od = pipe_od
+		self.window = window
+		self.max_mises = max_mises
+		self.bracket = bracket
+		self.cache = cache
+		self.store = store
+		self.stages = stages
+		self.flaw_detail = flaw_detail
+		self.write_summary = write_summary
+		self.adaptive_window = adaptive_window
+		self.max_retries = max_retries
+		self.workdir = workdir
+		self.pb_ref = reference_pressure(flaw, grade, pipe_thk * 1000, pipe_od * 2000)
+
+	def path(self, name):
+		return os.path.join(self.workdir, name)
+
+	def __call__(self, result, scheduler, cleanup):
+		job = result.job
+		# Jobs solved on another host bring their solver counts along
+		solver = job.meta.get('solver') or {'cpu': solver_times(self.path(job.name + '.msg')).get('cpu'),
+			'increments': count_increments(self.path(job.name + '.sta'))}
+		self.stages.record(job.name, 'solve', result.end - result.start, start=result.start, cpu=solver['cpu'],
+			increments=solver['increments'], returncode=result.returncode)
+		if result.returncode == 0:
+			case_detail = list(job.meta['flaw_detail'])
+			record = {'job': job.name, 'wall_time': result.end - result.start}
+			pb = float('nan')
+			if self.max_mises is not None:
+				window = job.meta['window']
+				burst = job.meta.get('burst')
+				if burst is None:
+					with self.stages.stage('extract', job.name):
+						burst = odb_post.extract_burst(self.path(job.name + '.odb'), self.max_mises)
+				odb_post.write_result(self.path(os.path.join(FOLDER, job.name + '_burst.json')), burst,
+					pres_mag_1=window[0], pres_mag_2=window[1])
+				retry = self.bracket.retry(burst, window) if self.adaptive_window else None
+				if retry is not None and job.meta['retries'] < self.max_retries:
+					# Burst outside the window: re-run the same deck with the new pressures
+					retries = job.meta['retries'] + 1
+					name = job.meta['case'] + '_r' + str(retries)
+					read_deck(self.path(job.input_file)).write(self.path(name + '.inp'), pressures=retry,
+						comment='Pressure window moved from ' + job.name)
+					meta = dict(job.meta, window=retry, retries=retries)
+					meta.pop('burst', None)
+					scheduler.submit(Job(name, name + '.inp', cpus=job.cpus, memory_mb=job.memory_mb,
+						workdir=job.workdir, meta=meta))
+					cleanup.submit(job.name, job.workdir)
+					return
+				if burst.burst:
+					pressure = burst.pressure(window[0], window[1])
+					self.bracket.add(job.meta['params'], pressure)
+					if self.pb_ref is not None:
+						pb = pressure / 1e6 / self.pb_ref
+					# burst_time is the last column of flaw_detail; the MATLAB scripts convert it with the fixed window
+					case_detail.append(equivalent_time(pressure, self.window))
+				else:
+					case_detail.append(float('nan'))
+				record['burst'] = burst.as_dict()
+				record['window'] = list(window)
+			record['flaw_detail'] = case_detail
+			self.cache.put(job.meta['key'], record)
+			self.flaw_detail.append(case_detail)
+			row = detail_columns(case_detail, self.flaw)
+			row.update(flaw=self.flaw, config=self.config, grade=self.grade, pipe_thk=self.pipe_thk * 1000,
+				pipe_od=self.pipe_od * 2000, pres_mag_1=self.window[0] / 1e6, pres_mag_2=self.window[1] / 1e6,
+				pb=pb, wall_time=record['wall_time'], job=job.name, key=job.meta['key'])
+			self.store.append(row)
+		cleanup.submit(job.name, job.workdir)
+		self.write_summary()
+
+
+class SweepState(object):
+	"""Cases still to run and the results so far of one sweep of a run"""
+
+	def __init__(self, sweep, store, workdir='.'):
+		self.sweep = sweep
+		self.workdir = workdir
+		self.cache = ResultCache(os.path.join(workdir, FOLDER, sweep.job_name + 'cache'))
+		self.stages = StageLog(os.path.join(workdir, FOLDER, sweep.job_name + 'stages.jsonl'), sweep=sweep.job_name)
+		self.bracket = PressureBracket(sweep.window, scales=design_scales(sweep.design, sweep.settings['params']),
+			margin=sweep.options['window_margin'], equation=pipe_equation(sweep.flaw, sweep.grade, sweep.pipe_thk,
+			sweep.pipe_od, sweep.options['coefficients']))
+		self.flaw_detail = []
+		self.finisher = JobFinisher(sweep.flaw, sweep.config, sweep.grade, sweep.pipe_thk, sweep.pipe_od, sweep.window,
+			sweep.max_mises, self.bracket, self.cache, store, self.stages, self.flaw_detail, self.write_summary,
+			sweep.options['adaptive_window'], sweep.options['max_retries'], workdir)
+		self.pending = deque()
+		self.build = None  # builder handle while the decks are written
+		self.built = False
+		self.failed = False
+		self.morph = None
+		self.template = None
+		self.template_name = None
+		for case in sweep.cases():
+			if self.cache.has(case.key):
+				cached = self.cache.get(case.key)
+				self.flaw_detail.append(cached['flaw_detail'])
+				if 'window' in cached:
+					self.bracket.add_time(tuple(case.params[name] for name in sweep.settings['params']),
+						cached['flaw_detail'][-1])
+			else:
+				self.pending.append(case)
+
+	def path(self, name):
+		return os.path.join(self.workdir, name)
+
+	def to_build(self):
+		"""Cases whose deck has to come from CAE"""
+		if not self.pending:
+			return []
+		if self.sweep.options['template']:
+			cases = self.sweep.cases()
+			reference = self.sweep.reference(cases)
+			self.template_name = reference.name + '.inp'
+			# The reference stays the same case when it is already cached
+			return [] if os.path.exists(self.path(self.template_name)) else [reference]
+		return [case for case in self.pending if not os.path.exists(self.path(case.name + '.inp'))]
+
+	def ready(self):
+		"""Deck sources in place once the build has finished"""
+		self.built = True
+		if self.sweep.options['template']:
+			self.template = read_deck(self.path(self.template_name))
+			reference = self.sweep.reference(self.sweep.cases())
+			self.morph = self.sweep.morph(reference)
+
+	def write_summary(self):
+		sweep = self.sweep
+		lines = []
+		lines.append('---------------------------------------------------------------')
+		lines.append('\n Total factorial DOE: ' + str(sweep.num_of_simulation))
+		lines.append('\n Feasible cases: ' + str(len(sweep.design)))
+		lines.append('\n Total simulations: ' + str(len(self.flaw_detail)))
+		lines.append('\n Pipe outer diameter: ' + str(sweep.pipe_od * 2 * 1000) + ' mm')
+		lines.append('\n Pipe thickness: ' + str(sweep.pipe_thk * 1000) + ' mm')
+		lines.append('\n---------------------------------------------------------------')
+		lines.append('\n Flaw parameters detail:')
+		for item in sorted(self.flaw_detail):
+			lines.append('\n' + str(item)[1:-1])
+		atomic_write(self.path(os.path.join(FOLDER, sweep.job_name + 'summary.txt')), ''.join(lines))
+
+
+class SweepRunner(object):
+	"""Runs the cases of several sweeps through one scheduler within the budget of the node"""
+
+	def __init__(self, sweeps, backend=None, builder=None, max_jobs=4, total_cpus=64, total_memory=250000,
+		poll_interval=1.0, probe=None, workdir='.', compact_executable=('abaqus', 'python'), licence_tokens=None,
+		admission=False):
+		self.store = ResultStore(os.path.join(workdir, FOLDER, 'results'))
+		self.states = dict((sweep.job_name, SweepState(sweep, self.store, workdir)) for sweep in sweeps)
+		self.order = [sweep.job_name for sweep in sweeps]
+		self.builder = builder or CaeBuilder()
+		self.workdir = workdir
+		self.poll_interval = poll_interval
+		monitors = {}
+		for name, state in self.states.items():
+			sweep = state.sweep
+			if sweep.options['stop_at_burst'] and sweep.max_mises is not None:
+				monitors[name] = BurstMonitor(probe or OdbProbe(), sweep.max_mises)
+		self.scheduler = Scheduler(backend or AbaqusBackend(), max_jobs=max_jobs, total_cpus=total_cpus,
+			total_memory_mb=total_memory, poll_interval=poll_interval, on_finish=self.finish,
+			monitor=SweepMonitor(monitors) if monitors else None,
+			admission=AdmissionController(total_cpus, total_memory, licence_tokens, max_jobs) if admission else None)
+		self.cleanups = dict((name, Cleanup(os.path.join(workdir, FOLDER),
+			compact_output=state.sweep.options['compact_output'], keep_odb=state.sweep.options['keep_odb'],
+			executable=compact_executable, stages=state.stages)) for name, state in self.states.items())
+		self.turn = 0
+		self.failed = []
+
+	def start_builds(self):
+		for state in self.states.values():
+			cases = state.to_build()
+			if cases:
+				state.build = self.builder.start(state.sweep, cases, self.workdir)
+			elif state.pending:
+				state.ready()
+
+	def poll_builds(self):
+		for name, state in self.states.items():
+			if state.built or state.failed or not state.pending:
+				continue
+			returncode = self.builder.poll(state.build)
+			if returncode is None:
+				continue
+			if returncode != 0 or state.to_build():
+				state.failed = True
+				self.failed.append(name)
+				sys.stderr.write('{}: building the decks failed (see {}build.log)\n'.format(name, name))
+				continue
+			state.ready()
+
+	def next_case(self):
+		"""Next case in round-robin order over the sweeps with decks ready"""
+		for i in range(len(self.order)):
+			state = self.states[self.order[(self.turn + i) % len(self.order)]]
+			if state.built and state.pending:
+				self.turn = (self.turn + i + 1) % len(self.order)
+				return state, state.pending.popleft()
+		return None, None
+
+	def feed(self):
+		"""Submit decks while the scheduler has nothing waiting, so windows use the latest results"""
+		while not self.scheduler.queue:
+			state, case = self.next_case()
+			if case is None:
+				return
+			self.submit(state, case)
+			self.scheduler.step()
+
+	def submit(self, state, case):
+		sweep = state.sweep
+		state.stages.begin(case.name)
+		params = tuple(case.params[name] for name in sweep.settings['params'])
+		if sweep.options['adaptive_window'] and sweep.max_mises is not None:
+			window = state.bracket.window(params)
+		else:
+			window = sweep.window
+		path = state.path(case.name + '.inp')
+		if state.template is not None and case.name + '.inp' != state.template_name:
+			state.stages.lap('morph')
+			state.template.write(path, state.morph.apply(state.template.nodes, case.bands), pressures=window,
+				comment='Flaw morphed from ' + state.template_name)
+			state.stages.end(nodes=len(state.template.nodes))
+		else:
+			# The built decks have the default window of the sweep
+			read_deck(path).write(path, pressures=window)
+		cpus = sweep.options['cpus_per_job'] or sweep.settings['cpus_per_job']
+		self.scheduler.submit(Job(case.name, case.name + '.inp', cpus=cpus, memory_mb=sweep.options['memory_per_job'],
+			workdir=self.workdir, meta={'sweep': sweep.job_name, 'key': case.key, 'flaw_detail': case.detail,
+			'case': case.name, 'params': params, 'window': window, 'retries': 0}))
+
+	def finish(self, result):
+		"""Burst time, retry or cache/store/summary of a finished job, see JobFinisher"""
+		job = result.job
+		self.states[job.meta['sweep']].finisher(result, self.scheduler, self.cleanups[job.meta['sweep']])
+
+	def busy(self):
+		return any(state.pending and not state.failed for state in self.states.values())
+
+	def run(self):
+		"""Build, run and collect every sweep; returns the names of the sweeps whose build failed"""
+		if not os.path.isdir(os.path.join(self.workdir, FOLDER)):
+			os.makedirs(os.path.join(self.workdir, FOLDER))
+		for state in self.states.values():
+			sweep = state.sweep
+			doe.write_table(state.path(os.path.join(FOLDER, sweep.job_name + 'design.txt')), sweep.design,
+				sweep.pipe_thk, sweep.flaw)
+		self.start_builds()
+		while True:
+			self.poll_builds()
+			self.feed()
+			running = self.scheduler.step()
+			if not running and not self.busy():
+				break
+			time.sleep(self.poll_interval)
+		for name, cleanup in self.cleanups.items():
+			for job, error in cleanup.close():
+				sys.stderr.write('{}: cleanup of {} failed: {}\n'.format(name, job, error))
+		for state in self.states.values():
+			state.write_summary()
+		return self.failed
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(prog='sweep.py', description=__doc__.split('\n')[1])
+	commands = parser.add_subparsers(dest='command')
+	listing = commands.add_parser('list', help='print the sweeps of the specs and their cases')
+	listing.add_argument('specs', nargs='+', help='spec files (.toml or .json)')
+	run = commands.add_parser('run', help='run the sweeps of the specs')
+	run.add_argument('specs', nargs='+', help='spec files (.toml or .json)')
+	run.add_argument('--max-jobs', type=int, help='jobs in flight (default: [resources] of the specs)')
+	run.add_argument('--total-cpus', type=int, help='CPUs of the node')
+	run.add_argument('--total-memory', type=int, help='memory of the node (MB)')
+	run.add_argument('--licence-tokens', type=int, help='Abaqus tokens of the node')
+	run.add_argument('--admission', action='store_true', default=None,
+		help='size memory and CPUs of each job from its mesh (pyburst.admission)')
+	run.add_argument('--abaqus', default='abaqus', help='Abaqus command')
+	run.add_argument('--reference', help='deck of the reference case to morph instead of building the decks in CAE')
+	args = parser.parse_args(argv)
+	if args.command is None:
+		parser.print_help()
+		return 1
+	try:
+		sweeps, resources = load_specs(args.specs)
+	except (ValueError, KeyError) as error:
+		parser.exit(1, 'error: {}\n'.format(error.args[0] if error.args else error))
+	if args.command == 'list':
+		for sweep in sweeps:
+			pending = sum(1 for case in sweep.cases() if not ResultCache(os.path.join(FOLDER,
+				sweep.job_name + 'cache')).has(case.key))
+			print('{:<32} {} {} X{:<4} {:>5} cases {:>5} to run  window {:.4g}-{:.4g} MPa{}'.format(sweep.job_name,
+				sweep.flaw, sweep.config, sweep.grade, len(sweep.design), pending, sweep.window[0] / 1e6,
+				sweep.window[1] / 1e6, '  template' if sweep.options['template'] else ''))
+		return 0
+	for name in ('max_jobs', 'total_cpus', 'total_memory', 'licence_tokens', 'admission'):
+		if getattr(args, name) is not None:
+			resources[name] = getattr(args, name)
+	builder = DeckBuilder(args.reference) if args.reference else CaeBuilder(args.abaqus)
+	runner = SweepRunner(sweeps, AbaqusBackend(args.abaqus), builder, compact_executable=(args.abaqus, 'python'),
+		**resources)
+	failed = runner.run()
+	return 1 if failed else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
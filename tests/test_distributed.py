@@ -0,0 +1,176 @@
+"""
+Tests of the queue broker, the workers and the coordinator of pyburst.distributed
+The solver is FakeSolverBackend, whose increments go to <job>.mon for TableProbe.
+"""
+############################################################################################################
+import os
+import time
+import threading
+
+import pytest
+
+from pyburst import distributed, sweep
+from pyburst.distributed import Broker, Coordinator, Worker
+from pyburst.monitor import TableProbe
+from pyburst.scheduler import FakeSolverBackend, Job, abaqus_tokens
+from pyburst.store import ResultStore
+
+# Step, step time, peak Mises, peak PEEQ: X65 bursts in Step-2, between step times 0.3 and 0.6
+INCREMENTS = [[1, 1.0, 4e8, 0.0], [2, 0.3, 5e8, 0.01], [2, 0.6, 6e8, 0.05], [2, 0.8, 7e8, 0.1], [2, 0.9, 8e8, 0.2],
+	[2, 1.0, 9e8, 0.3]]
+
+REFERENCE = '''*Heading
+*Node
+1, 0.105, 0.0, 0.0
+2, 0.12, 0.0, 0.0
+3, 0.105, 0.0, 0.3
+4, 0.12, 0.0, 0.3
+*Element, type=C3D8R
+1, 1, 2, 3, 4, 1, 2, 3, 4
+*Step, name=Step-1
+*Dsload
+inner, P, 58500000
+*End Step
+*Step, name=Step-2
+*Dsload
+inner, P, 78000000
+*End Step
+'''
+
+
+class Backend(FakeSolverBackend):
+	"""Fake solver whose flaw region goes past the X65 criterion"""
+
+	def command(self, job):
+		job.meta['increments'] = INCREMENTS
+		return FakeSolverBackend.command(self, job)
+
+
+def publish(broker, name, cpus, memory_mb=1000):
+	broker.publish(Job(name, name + '.inp', cpus=cpus, memory_mb=memory_mb), b'*Heading\n',
+		{'cpus': cpus, 'memory_mb': memory_mb, 'meta': {'sweep': 'test_', 'case': name}})
+
+
+def wait_for(condition, timeout=10.0):
+	deadline = time.time() + timeout
+	while not condition():
+		assert time.time() < deadline
+		time.sleep(0.02)
+
+
+def test_claim_within_tokens_and_worker_budget(tmp_path):
+	broker = Broker(str(tmp_path / 'broker.db'))
+	budget = abaqus_tokens(16) + abaqus_tokens(4) + 2
+	broker.reset(licence_tokens=budget)
+	publish(broker, 'a', 16)
+	publish(broker, 'b', 16, memory_mb=8000)
+	publish(broker, 'c', 4)
+	assert broker.claim('w1')[0] == 'a'
+	# b needs more tokens than are left, c still fits
+	assert broker.claim('w1')[0] == 'c'
+	assert broker.claim('w2') is None
+	assert broker.complete('a', 'w1', {'returncode': 0})
+	assert broker.claim('w2', cpus=8) is None
+	assert broker.claim('w2', cpus=16, memory_mb=4000) is None
+	name, payload, deck = broker.claim('w2', cpus=16, memory_mb=8000)
+	assert (name, payload['cpus'], deck) == ('b', 16, b'*Heading\n')
+	assert broker.queued() == 0
+	assert broker.collect() == [('a', {'returncode': 0})]
+
+
+def test_publish_beyond_the_token_budget(tmp_path):
+	broker = Broker(str(tmp_path / 'broker.db'))
+	broker.reset(licence_tokens=abaqus_tokens(16) - 1)
+	with pytest.raises(ValueError):
+		publish(broker, 'a', 16)
+
+
+def test_requeue_lost_then_failed(tmp_path):
+	broker = Broker(str(tmp_path / 'broker.db'))
+	broker.reset()
+	publish(broker, 'a', 4)
+	assert broker.claim('w1')[0] == 'a'
+	broker.heartbeat('w1', ['a'])
+	assert broker.requeue_lost(0.05, max_attempts=2) == []
+	broker.heartbeat('w1', ['a'])
+	assert broker.requeue_lost(0.05, max_attempts=2) == []
+	time.sleep(0.1)
+	assert broker.requeue_lost(0.05, max_attempts=2) == [('a', 'w1', True)]
+	assert broker.queued() == 1
+	assert broker.claim('w2')[0] == 'a'
+	# The result of the lost worker no longer counts, and its copy is cancelled
+	assert not broker.complete('a', 'w1', {'returncode': 0})
+	assert broker.heartbeat('w1', ['a']) == ['a']
+	broker.heartbeat('w2', ['a'])
+	broker.requeue_lost(0.05, max_attempts=2)
+	time.sleep(0.1)
+	assert broker.requeue_lost(0.05, max_attempts=2) == [('a', 'w2', False)]
+	assert broker.queued() == 0
+	[(name, result)] = broker.collect()
+	assert (name, result['returncode']) == ('a', None)
+	assert 'w2' in result['error']
+
+
+def test_worker_kills_cases_handed_to_another_worker(tmp_path):
+	path = str(tmp_path / 'broker.db')
+	coordinator = Broker(path)
+	coordinator.reset()
+	publish(coordinator, 'a', 4)
+	worker = Worker(path, name='w1', backend=FakeSolverBackend(duration=60.0), poll_interval=0.02,
+		heartbeat_interval=0.02, workdir=str(tmp_path), compact_executable=None)
+	worker.claim()
+	assert list(worker.scheduler.running) == ['a']
+	handle = worker.scheduler.running['a'][1]
+	worker.heartbeat.start()
+	try:
+		# The worker goes silent long enough to be lost, then comes back
+		worker.heartbeat.stop()
+		coordinator.requeue_lost(0.05, max_attempts=3)
+		time.sleep(0.1)
+		assert coordinator.requeue_lost(0.05, max_attempts=3) == [('a', 'w1', True)]
+		assert coordinator.claim('w2')[0] == 'a'
+		worker.heartbeat = distributed.Heartbeat(path, 'w1', 0.02)
+		worker.heartbeat.names.add('a')
+		worker.heartbeat.start()
+		wait_for(lambda: 'a' in worker.heartbeat.cancelled)
+		worker.kill_cancelled()
+	finally:
+		worker.heartbeat.stop()
+	assert not worker.scheduler.running
+	assert handle.poll() is not None
+	assert not worker.heartbeat.names
+	assert worker.done == 0
+
+
+def test_coordinator_runs_a_sweep_on_a_worker(tmp_path):
+	folder, host = tmp_path / 'coordinator', tmp_path / 'worker'
+	folder.mkdir()
+	host.mkdir()
+	(folder / 'ref.inp').write_text(REFERENCE)
+	path = str(tmp_path / 'broker.db')
+	sweeps = sweep.expand({'flaw': 'cw', 'config': 'sTsD', 'grade': 65, 'doe': {'length': [0.0005, 0.002]}})
+	coordinator = Coordinator(sweeps, path, sweep.DeckBuilder(str(folder / 'ref.inp')), licence_tokens=100,
+		lookahead=2, heartbeat_timeout=30.0, poll_interval=0.05, workdir=str(folder))
+	jobs = []
+
+	def serve():
+		# SQLite connections stay in the thread that opened them
+		worker = Worker(path, name='w1', backend=Backend(duration=0.3), poll_interval=0.05, heartbeat_interval=0.1,
+			probe=TableProbe(), workdir=str(host), compact_executable=None)
+		jobs.append(worker.run())
+
+	thread = threading.Thread(target=serve)
+	thread.start()
+	try:
+		failed = coordinator.run()
+	finally:
+		thread.join(30.0)
+	assert failed == []
+	assert not thread.is_alive()
+	cases = len(sweeps[0].design)
+	assert jobs == [cases]
+	table = ResultStore(str(folder / 'burst_pressure' / 'results')).query(['job', 'pb'])
+	assert len(table['job']) == cases
+	assert all(0 < pb < 2 for pb in table['pb'])
+	# The solver files stay on the worker
+	assert not [name for name in os.listdir(str(folder)) if name.endswith('.sta')]